@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: LGPL-2.1-or-later
+
+"""
+Startup time and memory of large GATT trees versus attribute count, built
+from full Characteristic/Descriptor objects and from echoez.synthetic's
+compact ones. Each tree is built in a fresh process so RSS is comparable.
+
+usage: PYTHONPATH=. python benchmarks/bench_large_tree.py [CHRCS...]
+"""
+
+import os
+import subprocess
+import sys
+import time
+
+from echoez.app import App
+from echoez.synthetic import SyntheticService
+
+from common import (
+    private_bus,
+    synthetic_service,
+)
+
+NUM_SERVICES = 4
+NUM_DESCS = 2
+
+
+def rss() -> int:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def measure(kind: str, num_chrcs: int):
+    with private_bus() as bus:
+        app = App(bus, "bench")
+        before = rss()
+        start = time.perf_counter()
+        for i in range(NUM_SERVICES):
+            if kind == "full":
+                service = synthetic_service(bus, 10 + i, num_chrcs, NUM_DESCS)
+            else:
+                service = SyntheticService(bus, 10 + i, num_chrcs, NUM_DESCS)
+            app.add_service(service)
+        built = time.perf_counter()
+        app.GetManagedObjects()
+        done = time.perf_counter()
+        attrs = NUM_SERVICES * (1 + num_chrcs * (1 + NUM_DESCS))
+        print(
+            f"{kind:8} {attrs:8} attributes "
+            f"{(built - start) * 1e3:9.1f} ms build "
+            f"{(done - built) * 1e3:9.1f} ms GetManagedObjects "
+            f"{(rss() - before) / attrs:8.0f} B/attribute"
+        )
+
+
+def main(*counts):
+    for num_chrcs in counts or (100, 1000, 5000):
+        for kind in ("full", "compact"):
+            subprocess.run(
+                [sys.executable, __file__, "--one", kind, str(num_chrcs)], check=True
+            )
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--one"]:
+        measure(sys.argv[2], int(sys.argv[3]))
+    else:
+        main(*(int(a) for a in sys.argv[1:]))
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: LGPL-2.1-or-later
+
+"""
+Cost of GetManagedObjects and GetAll over a large synthetic GATT tree, with
+the cached property dicts versus rebuilding them on every call (as echoez did
+before they were cached).
+
+usage: PYTHONPATH=. python benchmarks/bench_properties.py [SERVICES CHRCS DESCS]
+"""
+
+import sys
+
+from echoez.app import App
+
+from common import (
+    blocks_per_call,
+    private_bus,
+    synthetic_service,
+    timeit,
+)
+
+
+def invalidate(app):
+    for service in app.services:
+        service.invalidate_properties()
+        for chrc in service.get_characteristics():
+            chrc.invalidate_properties()
+            for desc in chrc.get_descriptors():
+                desc.invalidate_properties()
+
+
+def main(num_services=10, num_chrcs=50, num_descs=2):
+    with private_bus() as bus:
+        app = App(bus, "bench")
+        for i in range(num_services):
+            app.add_service(synthetic_service(bus, 10 + i, num_chrcs, num_descs))
+        chrc = app.services[-1].get_characteristics()[-1]
+        attrs = sum(
+            1 + len(s.get_characteristics()) * (1 + num_descs) for s in app.services
+        )
+        print(f"{attrs} attributes")
+
+        def uncached_managed_objects():
+            invalidate(app)
+            return app.GetManagedObjects()
+
+        def uncached_get_all():
+            chrc.invalidate_properties()
+            return chrc.GetAll("org.bluez.GattCharacteristic1")
+
+        for label, fn, n in (
+            ("GetManagedObjects, uncached", uncached_managed_objects, 50),
+            ("GetManagedObjects, cached", app.GetManagedObjects, 50),
+            ("GetAll, uncached", uncached_get_all, 20000),
+            (
+                "GetAll, cached",
+                lambda: chrc.GetAll("org.bluez.GattCharacteristic1"),
+                20000,
+            ),
+        ):
+            fn()  # warm up
+            print(
+                f"{label:30} {timeit(fn, n) * 1e6:10.1f} us/call "
+                f"{blocks_per_call(fn, n):10.1f} blocks/call"
+            )
+
+
+if __name__ == "__main__":
+    main(*(int(a) for a in sys.argv[1:]))
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: LGPL-2.1-or-later
+
+"""
+Server side cost of adding a service to a live App by emitting
+InterfacesAdded, versus a full re-registration: unexporting and re-exporting
+the whole tree and marshalling the GetManagedObjects reply BlueZ asks for.
+Client rediscovery after a re-registration comes on top and isn't measured.
+
+usage: PYTHONPATH=. python benchmarks/bench_reconfigure.py [SERVICES CHRCS DESCS]
+"""
+
+import sys
+import time
+
+import dbus.lowlevel
+
+from echoez.app import App
+from echoez.config import DBUS_OM_IFACE
+
+from common import (
+    private_bus,
+    synthetic_service,
+)
+
+ROUNDS = 20
+
+
+def walk(service):
+    yield service
+    for chrc in service.get_characteristics():
+        yield chrc
+        yield from chrc.get_descriptors()
+
+
+def marshal_managed_objects(app):
+    msg = dbus.lowlevel.SignalMessage("/", DBUS_OM_IFACE, "Bench")
+    msg.append(app.GetManagedObjects(), signature="a{oa{sa{sv}}}")
+    return msg
+
+
+def main(num_services=10, num_chrcs=50, num_descs=2):
+    with private_bus() as bus:
+        app = App(bus, "bench")
+        for i in range(num_services):
+            app.add_service(synthetic_service(bus, 10 + i, num_chrcs, num_descs))
+        app.registered = True
+        index = 10 + num_services
+
+        delta = 0.0
+        for _ in range(ROUNDS):
+            service = synthetic_service(bus, index, num_chrcs, num_descs)
+            start = time.perf_counter()
+            app.add_service(service)
+            bus.flush()
+            delta += time.perf_counter() - start
+            app.remove_service(service)
+            bus.flush()
+
+        full = 0.0
+        for _ in range(ROUNDS):
+            service = synthetic_service(bus, index, num_chrcs, num_descs)
+            start = time.perf_counter()
+            app.registered = False
+            services = list(app.services)
+            for s in services:
+                app.remove_service(s)
+            for s in services:
+                for attr in walk(s):
+                    attr.add_to_connection(bus, attr.path)
+                app.add_service(s)
+            app.add_service(service)
+            marshal_managed_objects(app)
+            full += time.perf_counter() - start
+            app.remove_service(service)
+
+        print(f"{len(app.GetManagedObjects())} objects")
+        print(f"add service, InterfacesAdded: {delta / ROUNDS * 1e3:8.2f} ms")
+        print(f"add service, re-register:     {full / ROUNDS * 1e3:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main(*(int(a) for a in sys.argv[1:]))
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: LGPL-2.1-or-later
+
+"""Helpers shared by the benchmarks."""
+
+import contextlib
+import subprocess
+import sys
+import time
+
+import dbus.bus
+import dbus.mainloop.glib
+
+from echoez.characteristic import Characteristic
+from echoez.descriptor import Descriptor
+from echoez.service import Service
+
+__all__ = [
+    "private_bus",
+    "synthetic_service",
+    "timeit",
+    "blocks_per_call",
+]
+
+
+@contextlib.contextmanager
+def private_bus():
+    """A connection to a throwaway dbus-daemon, so benchmarks need neither
+    BlueZ nor the system bus"""
+    daemon = subprocess.Popen(
+        ["dbus-daemon", "--session", "--print-address", "--nofork"],
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    try:
+        address = daemon.stdout.readline().strip()
+        # exporting objects needs a main loop, even if it never runs
+        bus = dbus.bus.BusConnection(
+            address, mainloop=dbus.mainloop.glib.DBusGMainLoop()
+        )
+        try:
+            yield bus
+        finally:
+            bus.close()
+    finally:
+        daemon.terminate()
+        daemon.wait()
+
+
+def synthetic_service(bus, index: int, num_chrcs: int, num_descs: int) -> Service:
+    service = Service(bus, index, f"0000{index:04x}-0000-1000-8000-00805f9b34fb", True)
+    for i in range(num_chrcs):
+        chrc = Characteristic(
+            bus, i, f"{i:08x}-0000-1000-8000-00805f9b34fb", ["read", "write"], service
+        )
+        for j in range(num_descs):
+            chrc.add_descriptor(
+                Descriptor(
+                    bus, j, f"{j:08x}-0001-1000-8000-00805f9b34fb", ["read"], chrc
+                )
+            )
+        service.add_characteristic(chrc)
+    return service
+
+
+def timeit(fn, n: int) -> float:
+    """Mean seconds per call of ``fn``"""
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - start) / n
+
+
+def blocks_per_call(fn, n: int) -> float:
+    """Mean number of memory blocks still allocated per call of ``fn`` while
+    its results are kept alive, ie. roughly the objects it builds"""
+    results = [None] * n
+    before = sys.getallocatedblocks()
+    for i in range(n):
+        results[i] = fn()
+    return (sys.getallocatedblocks() - before) / n
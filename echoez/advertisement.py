@@ -3,21 +3,30 @@
 # https://git.kernel.org/pub/scm/bluetooth/bluez.git/tree/test/
 
 import logging
+import struct
 
 import dbus.service
 
 from echoez.config import *
 from echoez.err import *
+from echoez.trace import traced
 
 from echoez.service import EchoService
 
 __all__ = [
     "Advertisement",
     "EchoAdvertisement",
+    "SECONDARY_CHANNELS",
 ]
 
 logger = logging.getLogger(__name__)
 
+SECONDARY_CHANNELS = ("1M", "2M", "Coded")
+# advertising data of a legacy advertising PDU
+LEGACY_MAX_LENGTH = 31
+# bytes of an AD structure's length and type
+AD_HEADER = 2
+
 
 class Advertisement(dbus.service.Object):
     PATH_BASE = "/org/bluez/example/advertisement"
@@ -33,6 +42,10 @@ class Advertisement(dbus.service.Object):
         self.local_name = None
         self.include_tx_power = None
         self.data = None
+        self.includes = None
+        # None for legacy advertising, see use_extended
+        self.secondary_channel = None
+        self.max_length = LEGACY_MAX_LENGTH
         dbus.service.Object.__init__(self, bus, self.path)
 
     def get_properties(self):
@@ -57,8 +70,32 @@ class Advertisement(dbus.service.Object):
 
         if self.data is not None:
             properties["Data"] = dbus.Dictionary(self.data, signature="yv")
+        if self.includes is not None:
+            properties["Includes"] = dbus.Array(self.includes, signature="s")
+        if self.secondary_channel is not None:
+            properties["SecondaryChannel"] = dbus.String(self.secondary_channel)
         return {LE_ADVERTISEMENT_IFACE: properties}
 
+    def get_length(self) -> int:
+        """Estimated bytes of advertising data, flags included"""
+        uuid_sizes = {4: 2, 8: 4}
+        length = AD_HEADER + 1
+        for uuids in (self.service_uuids, self.solicit_uuids):
+            sizes = [uuid_sizes.get(len(uuid), 16) for uuid in uuids or ()]
+            # one AD structure per UUID size
+            length += sum(sizes) + AD_HEADER * len(set(sizes))
+        for data in (self.manufacturer_data or {}).values():
+            length += AD_HEADER + 2 + len(data)
+        for uuid, data in (self.service_data or {}).items():
+            length += AD_HEADER + uuid_sizes.get(len(uuid), 16) + len(data)
+        for data in (self.data or {}).values():
+            length += AD_HEADER + len(data)
+        if self.local_name is not None:
+            length += AD_HEADER + len(self.local_name.encode())
+        if self.include_tx_power or "tx-power" in (self.includes or ()):
+            length += AD_HEADER + 1
+        return length
+
     def get_path(self):
         return dbus.ObjectPath(self.path)
 
@@ -87,23 +124,86 @@ class Advertisement(dbus.service.Object):
             self.local_name = ""
         self.local_name = dbus.String(name)
 
+    def add_include(self, name):
+        """Have BlueZ add "tx-power", "appearance", "local-name" (...)"""
+        if not self.includes:
+            self.includes = []
+        self.includes.append(name)
+
+    def use_extended(self, secondary_channel: str = "1M"):
+        """
+        Request extended advertising with the auxiliary packets on the
+        ``secondary_channel`` PHY. Its connectable advertisements aren't
+        scannable, so everything fits in up to ``max_length`` bytes of one
+        advertisement instead of 31 plus a scan response. See fit_to_adapter.
+        """
+        if secondary_channel not in SECONDARY_CHANNELS:
+            raise ValueError(f"Unknown secondary channel {secondary_channel!r}")
+        self.secondary_channel = secondary_channel
+
+    def fit_to_adapter(self, manager_props) -> bool:
+        """
+        Adjust to an adapter's LEAdvertisingManager1 properties, returning
+        whether extended advertising is used. Falls back to legacy
+        advertising unless the adapter supports the secondary channel, and
+        drops Includes it doesn't support.
+        """
+        channels = manager_props.get("SupportedSecondaryChannels", ())
+        if (
+            self.secondary_channel is not None
+            and self.secondary_channel not in channels
+        ):
+            logger.info(
+                f"{self.secondary_channel} secondary channel not supported "
+                f"(supported: {list(channels)}), using legacy advertising"
+            )
+            self.secondary_channel = None
+        if self.secondary_channel is None:
+            self.max_length = LEGACY_MAX_LENGTH
+            # legacy advertising spills over into a scan response
+            if self.get_length() > self.max_length:
+                logger.warning(
+                    f"{self.path} is {self.get_length()} bytes, over the "
+                    f"{self.max_length} of one legacy advertisement: the rest "
+                    "goes in a scan response, or is dropped by BlueZ"
+                )
+        else:
+            capabilities = manager_props.get("SupportedCapabilities", {})
+            self.max_length = int(capabilities.get("MaxAdvLen", LEGACY_MAX_LENGTH))
+            if self.get_length() > self.max_length:
+                logger.warning(
+                    f"{self.path} is {self.get_length()} bytes, "
+                    f"over the {self.max_length} the adapter can advertise"
+                )
+        if self.includes and "SupportedIncludes" in manager_props:
+            supported = manager_props["SupportedIncludes"]
+            self.includes = [i for i in self.includes if i in supported]
+        return self.secondary_channel is not None
+
     def add_data(self, ad_type, data):
         if not self.data:
             self.data = dbus.Dictionary({}, signature="yv")
         self.data[ad_type] = dbus.Array(data, signature="y")
 
+    @traced
     @dbus.service.method(DBUS_PROP_IFACE, in_signature="s", out_signature="a{sv}")
     def GetAll(self, interface):
         if interface != LE_ADVERTISEMENT_IFACE:
             raise InvalidArgsException()
         return self.get_properties()[LE_ADVERTISEMENT_IFACE]
 
+    @traced
     @dbus.service.method(LE_ADVERTISEMENT_IFACE, in_signature="", out_signature="")
     def Release(self):
         logger.info("%s: Released!" % self.path)
 
 
 class EchoAdvertisement(Advertisement):
+    # service data of the echo service, only sent with extended advertising:
+    # format version and the PSM of the L2CAP echo (0 if there's none)
+    ECHO_INFO = struct.Struct("<BH")
+    ECHO_INFO_VERSION = 1
+
     def __init__(self, bus, index):
         Advertisement.__init__(self, bus, index, "peripheral")
         self.add_manufacturer_data(
@@ -115,3 +215,19 @@ class EchoAdvertisement(Advertisement):
         # and probabaly thsi
         self.add_local_name("Echoez")
         self.include_tx_power = True
+
+    def add_extended_data(self, l2cap_psm: int = 0) -> bool:
+        """
+        Use the room extended advertising leaves (see fit_to_adapter) for
+        echo service data, so centrals learn the L2CAP PSM without a GATT
+        read. Returns whether it fits.
+        """
+        data = self.ECHO_INFO.pack(self.ECHO_INFO_VERSION, l2cap_psm)
+        self.add_service_data(EchoService.ECHO_SVC_UUID, data)
+        if self.get_length() <= self.max_length:
+            return True
+        del self.service_data[EchoService.ECHO_SVC_UUID]
+        if not self.service_data:
+            self.service_data = None
+        logger.warning(f"{self.path}: no room for the echo service data")
+        return False
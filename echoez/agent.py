@@ -2,12 +2,20 @@
 # SPDX-License-Identifier: LGPL-2.1-or-later
 # https://git.kernel.org/pub/scm/bluetooth/bluez.git/tree/test/
 
+import functools
 import logging
 
+from collections import OrderedDict
+from typing import (
+    Iterable,
+)
+
 import dbus.service
 
 from echoez.config import *
 from echoez.err import *
+from echoez.trace import traced
+from echoez.policy import *
 
 try:
     from gi.repository import GLib  # pyright: reportMissingImports=false
@@ -16,40 +24,114 @@ except ImportError:
 
 __all__ = [
     "Agent",
+    "DeviceTrust",
+    "device_path",
 ]
 
 logger = logging.getLogger(__name__)
 
 
-def set_trusted(path):
-    bus = dbus.SystemBus()
-    props = dbus.Interface(
-        bus.get_object("org.bluez", path), "org.freedesktop.DBus.Properties"
-    )
-    props.Set("org.bluez.Device1", "Trusted", True)
-
-
-# FIXME(mdegans): remove this. we want the app to be non-interactive
-def ask(prompt):
-    return input(prompt)
+def device_path(adapter: str, address: str) -> str:
+    """("/org/bluez/hci0", "AA:BB:CC:DD:EE:FF") -> BlueZ Device1 object path"""
+    return f"{adapter}/dev_{address.upper().replace(':', '_')}"
+
+
+class DeviceTrust:
+    """
+    Marks devices Trusted over an existing bus connection.
+
+    Calls are asynchronous, so they never block the main loop, and Device1
+    property proxies are cached per object path (without introspection) so a
+    pairing burst costs one method call per device. The cache holds the
+    ``max_devices`` most recently trusted devices, and devices BlueZ removes
+    are dropped from it.
+    """
+
+    def __init__(self, bus, max_devices: int = 256):
+        self.bus = bus
+        self.max_devices = max_devices
+        self.trusted = 0
+        self.failed = 0
+        # least recently used first
+        self._props = OrderedDict()
+        bus.add_signal_receiver(
+            self._on_interfaces_removed,
+            signal_name="InterfacesRemoved",
+            dbus_interface=DBUS_OM_IFACE,
+            bus_name=BLUEZ_SERVICE_NAME,
+        )
+
+    def set_trusted(self, device: str):
+        props = self._props.get(device)
+        if props is None:
+            if len(self._props) >= self.max_devices:
+                self._props.popitem(last=False)
+            props = self._props[device] = dbus.Interface(
+                self.bus.get_object(BLUEZ_SERVICE_NAME, device, introspect=False),
+                DBUS_PROP_IFACE,
+            )
+        else:
+            self._props.move_to_end(device)
+        props.Set(
+            DEVICE_IFACE,
+            "Trusted",
+            dbus.Boolean(True),
+            reply_handler=self._on_trusted,
+            error_handler=functools.partial(self._on_error, device),
+        )
+
+    def trust_all(self, adapter: str, addresses: Iterable[str]):
+        """Mark known devices Trusted up front so they skip the agent. Devices
+        BlueZ doesn't know about yet are logged and skipped."""
+        for address in addresses:
+            self.set_trusted(device_path(adapter, address))
+
+    def forget(self, device: str):
+        self._props.pop(device, None)
+
+    def get_stats(self):
+        return {"trusted": self.trusted, "failed": self.failed}
+
+    def _on_interfaces_removed(self, path, interfaces):
+        if DEVICE_IFACE in interfaces:
+            self.forget(path)
+
+    def _on_trusted(self):
+        self.trusted += 1
+
+    def _on_error(self, device: str, error: dbus.exceptions.DBusException):
+        self.failed += 1
+        # eg. the device was removed, so don't keep a dead proxy around
+        self.forget(device)
+        logger.warning(f"Could not trust {device}: {error}")
 
 
 class Agent(dbus.service.Object):
     PATH_BASE = "/com/mdegans"
 
     def __init__(
-        self, *args, loop: GLib.MainLoop = None, name: str = "echoez", **kwargs
+        self,
+        *args,
+        loop: GLib.MainLoop = None,
+        name: str = "echoez",
+        policy: PairingPolicy = None,
+        trust: DeviceTrust = None,
+        **kwargs,
     ):
         if not name.isalpha():
             raise ValueError(f"App name must be alphabetical only. '{name}' is invalid")
 
         self.path = f"{self.PATH_BASE}/{name}/agent"
         self.loop = loop
+        # rejects everything unless configured
+        self.policy = policy or PairingPolicy()
         dbus.service.Object.__init__(self, *args, object_path=self.path, **kwargs)
+        self.trust = trust or DeviceTrust(self.connection)
 
     def set_exit_on_release(self, exit_on_release):
         self.exit_on_release = exit_on_release
 
+    @traced
     @dbus.service.method(AGENT_INTERFACE, in_signature="", out_signature="")
     def Release(self):
         logger.info("Release")
@@ -57,52 +139,60 @@ class Agent(dbus.service.Object):
             logger.info("Quitting GLib.MainLoop")
             self.loop.quit()
 
+    @traced
     @dbus.service.method(AGENT_INTERFACE, in_signature="os", out_signature="")
     def AuthorizeService(self, device, uuid):
         logger.info("AuthorizeService (%s, %s)" % (device, uuid))
-        authorize = ask("Authorize connection (yes/no): ")
-        if authorize == "yes":
+        if self.policy.decide(device, AUTHORIZE_SERVICE):
             return
-        raise RejectedException("Connection rejected by user")
+        raise RejectedException("Connection rejected by policy")
 
+    @traced
     @dbus.service.method(AGENT_INTERFACE, in_signature="o", out_signature="s")
     def RequestPinCode(self, device):
         logger.info("RequestPinCode (%s)" % (device))
-        set_trusted(device)
-        return ask("Enter PIN Code: ")
+        if self.policy.pin_code is None or not self.policy.decide(device, PIN_CODE):
+            raise RejectedException("Pairing rejected by policy")
+        self.trust.set_trusted(device)
+        return self.policy.pin_code
 
+    @traced
     @dbus.service.method(AGENT_INTERFACE, in_signature="o", out_signature="u")
     def RequestPasskey(self, device):
         logger.info("RequestPasskey (%s)" % (device))
-        set_trusted(device)
-        passkey = ask("Enter passkey: ")
-        return dbus.UInt32(passkey)
+        if self.policy.passkey is None or not self.policy.decide(device, PASSKEY):
+            raise RejectedException("Pairing rejected by policy")
+        self.trust.set_trusted(device)
+        return dbus.UInt32(self.policy.passkey)
 
+    @traced
     @dbus.service.method(AGENT_INTERFACE, in_signature="ouq", out_signature="")
     def DisplayPasskey(self, device, passkey, entered):
         logger.info("DisplayPasskey (%s, %06u entered %u)" % (device, passkey, entered))
 
+    @traced
     @dbus.service.method(AGENT_INTERFACE, in_signature="os", out_signature="")
     def DisplayPinCode(self, device, pincode):
         logger.info("DisplayPinCode (%s, %s)" % (device, pincode))
 
+    @traced
     @dbus.service.method(AGENT_INTERFACE, in_signature="ou", out_signature="")
     def RequestConfirmation(self, device, passkey):
         logger.info("RequestConfirmation (%s, %06d)" % (device, passkey))
-        confirm = ask("Confirm passkey (yes/no): ")
-        if confirm == "yes":
-            set_trusted(device)
+        if self.policy.decide(device, CONFIRMATION):
+            self.trust.set_trusted(device)
             return
-        raise RejectedException("Passkey doesn't match")
+        raise RejectedException("Passkey rejected by policy")
 
+    @traced
     @dbus.service.method(AGENT_INTERFACE, in_signature="o", out_signature="")
     def RequestAuthorization(self, device):
         logger.info("RequestAuthorization (%s)" % (device))
-        auth = ask("Authorize? (yes/no): ")
-        if auth == "yes":
+        if self.policy.decide(device, AUTHORIZATION):
             return
-        raise RejectedException("Pairing rejected")
+        raise RejectedException("Pairing rejected by policy")
 
+    @traced
     @dbus.service.method(AGENT_INTERFACE, in_signature="", out_signature="")
     def Cancel(self):
         logger.info("Cancel")
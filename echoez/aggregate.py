@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: LGPL-2.1-or-later
+
+"""Batch characteristic writes for downstream processing."""
+
+import array
+import logging
+import queue
+import threading
+
+from typing import (
+    Callable,
+    Dict,
+)
+
+try:
+    from gi.repository import GLib  # pyright: reportMissingImports=false
+except ImportError:
+    import gobject as GLib  # pyright: reportMissingImports=false
+
+__all__ = [
+    "BatchWriter",
+    "WriteAggregator",
+]
+
+logger = logging.getLogger(__name__)
+
+
+class _Batch:
+    __slots__ = ("buffer", "used", "sizes", "timeout")
+
+    def __init__(self, max_bytes: int):
+        self.buffer = bytearray(max_bytes)
+        self.used = 0
+        self.sizes = array.array("I")
+        self.timeout = None
+
+
+class WriteAggregator:
+    """
+    Appends the values written to each characteristic to a buffer of its
+    own, preallocated to ``max_bytes``, and calls
+    ``consumer(path, data, sizes)`` with a memoryview of the batch and the
+    size of each write in it once the buffer is full or ``max_delay`` seconds
+    after the first write of the batch.
+
+    The memoryview is released when the consumer returns, as the buffer is
+    reused, so the consumer must copy anything it keeps. Slices of the view
+    are released with it, but a consumer holding an export of it (eg. a
+    numpy array or a PickleBuffer) keeps the whole buffer: that is logged,
+    and the batch goes on in a new buffer. A write larger than ``max_bytes``
+    is passed on as a batch of its own.
+
+    All methods must be called from the GLib main loop.
+    """
+
+    def __init__(
+        self,
+        consumer: Callable[[str, memoryview, array.array], None],
+        max_bytes: int = 64 * 1024,
+        max_delay: float = 0.05,
+    ):
+        self.consumer = consumer
+        self.max_bytes = max_bytes
+        self.max_delay_ms = max(int(max_delay * 1000), 1)
+        self.writes = 0
+        self.batches = 0
+        self.bytes = 0
+        self.timed_flushes = 0
+        self.kept_buffers = 0
+        self._batches: Dict[str, _Batch] = {}
+
+    def append(self, path: str, value):
+        """Add a written ``value`` (bytes or a sequence of ints) to the batch
+        of ``path``"""
+        batch = self._batches.get(path)
+        if batch is None:
+            batch = self._batches[path] = _Batch(self.max_bytes)
+        size = len(value)
+        self.writes += 1
+        self.bytes += size
+        if batch.used + size > self.max_bytes:
+            self._flush(path, batch)
+            if size > self.max_bytes:
+                self._deliver(path, memoryview(bytes(value)), array.array("I", (size,)))
+                return
+        batch.buffer[batch.used : batch.used + size] = value
+        batch.used += size
+        batch.sizes.append(size)
+        if batch.used == self.max_bytes:
+            self._flush(path, batch)
+        elif batch.timeout is None:
+            batch.timeout = GLib.timeout_add(self.max_delay_ms, self._on_timeout, path)
+
+    def flush(self, path: str = None):
+        """Hand pending writes (of ``path``, or all) to the consumer now"""
+        if path is None:
+            for path, batch in self._batches.items():
+                self._flush(path, batch)
+        elif path in self._batches:
+            self._flush(path, self._batches[path])
+
+    def remove(self, path: str):
+        """Flush and forget the batch of a removed characteristic"""
+        batch = self._batches.pop(path, None)
+        if batch is not None:
+            self._flush(path, batch)
+
+    def _on_timeout(self, path: str):
+        batch = self._batches[path]
+        batch.timeout = None
+        self.timed_flushes += 1
+        self._flush(path, batch)
+        return False
+
+    def _flush(self, path: str, batch: _Batch):
+        if batch.timeout is not None:
+            GLib.source_remove(batch.timeout)
+            batch.timeout = None
+        if not batch.used:
+            return
+        with memoryview(batch.buffer) as view:
+            if not self._deliver(path, view[: batch.used], batch.sizes):
+                batch.buffer = bytearray(self.max_bytes)
+        batch.used = 0
+        batch.sizes = array.array("I")
+
+    def _deliver(self, path: str, data: memoryview, sizes: array.array) -> bool:
+        """False if the consumer kept an export of ``data``"""
+        self.batches += 1
+        try:
+            self.consumer(path, data, sizes)
+        except Exception:
+            logger.exception(f"{path}: write consumer failed")
+        try:
+            data.release()
+        except BufferError:
+            self.kept_buffers += 1
+            logger.warning(f"{path}: write consumer kept the batch buffer")
+            return False
+        return True
+
+    def get_stats(self):
+        return {
+            "writes": self.writes,
+            "batches": self.batches,
+            "bytes": self.bytes,
+            "timed_flushes": self.timed_flushes,
+            "kept_buffers": self.kept_buffers,
+        }
+
+    def close(self):
+        self.flush()
+        self._batches.clear()
+
+
+class BatchWriter:
+    """
+    WriteAggregator consumer appending every batch to the file at ``path``.
+
+    Batches are copied on the main loop and written by a background thread,
+    as with echoez.record.Recorder, so the loop never waits on disk. If the
+    writer falls more than ``max_pending`` batches behind, new batches are
+    dropped and counted instead of blocking.
+    """
+
+    def __init__(self, path: str, max_pending: int = 1024):
+        self.path = path
+        self.written = 0
+        self.dropped = 0
+        self._queue = queue.Queue(max_pending)
+        self._file = open(path, "ab")
+        self._thread = threading.Thread(
+            target=self._run, name="echoez-batch-writer", daemon=True
+        )
+        self._thread.start()
+
+    def __call__(self, path: str, data: memoryview, sizes: array.array):
+        try:
+            self._queue.put_nowait(bytes(data))
+            self.written += 1
+        except queue.Full:
+            self.dropped += 1
+
+    def get_stats(self):
+        return {"written": self.written, "dropped": self.dropped}
+
+    def close(self):
+        """Write the pending batches and close the file. Close the
+        WriteAggregator first, so its last batches are written too."""
+        self._queue.put(None)
+        self._thread.join()
+        self._file.close()
+        if self.dropped:
+            logger.warning(f"{self.path}: dropped {self.dropped} batches")
+
+    def _run(self):
+        done = False
+        while not done:
+            batch = [self._queue.get()]
+            try:
+                while True:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            if None in batch:
+                done = True
+                batch = [b for b in batch if b is not None]
+            self._file.write(b"".join(batch))
+            self._file.flush()
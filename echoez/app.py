@@ -2,24 +2,50 @@
 # SPDX-License-Identifier: LGPL-2.1-or-later
 # https://git.kernel.org/pub/scm/bluetooth/bluez.git/tree/test/
 
+import base64
 import logging
 
 import dbus.service
 
 from echoez.config import *
+from echoez.err import *
+from echoez.trace import traced
+from echoez.characteristic import Characteristic
 from echoez.service import EchoService
 
 __all__ = [
     "App",
+    "normalize_uuid",
 ]
 
 
 logger = logging.getLogger(__name__)
 
 
+def normalize_uuid(uuid: str) -> str:
+    """Lowercase 128-bit form of a 16, 32 or 128-bit UUID string"""
+    uuid = uuid.lower()
+    if len(uuid) == 4:
+        return f"0000{uuid}{BASE_UUID_SUFFIX}"
+    if len(uuid) == 8:
+        return f"{uuid}{BASE_UUID_SUFFIX}"
+    return uuid
+
+
 class App(dbus.service.Object):
     """
     org.bluez.GattApplication1 interface implementation
+
+    Keeps an index of every service, characteristic and descriptor by object
+    path and by UUID, so lookups stay constant time however large the tree
+    gets. Attributes must therefore be added and removed through the App
+    (add_service, add_characteristic, add_descriptor, ...) once the service
+    is added to it.
+
+    Once ``registered`` is set, adding or removing attributes emits
+    InterfacesAdded/InterfacesRemoved for just the changed objects, and
+    PropertiesChanged for the Characteristics or Descriptors of their parent,
+    so the tree can change without re-registering the application.
     """
 
     def __init__(self, bus, name: str):
@@ -27,6 +53,24 @@ class App(dbus.service.Object):
             raise ValueError(f"App name must be alphabetical only. '{name}' is invalid")
         self.path = "/"
         self.services = []
+        self.recorder = None
+        self.offloader = None
+        self.limiter = None
+        self.aggregator = None
+        self._aggregate_uuids = frozenset()
+        self.store = None
+        self._offload_uuids = frozenset()
+        self._by_path = {}
+        self._by_uuid = {}
+        # indexed characteristics by path, for the attach_* methods
+        self._characteristics = {}
+        self.registered = False
+        self.profiler = None
+        self.tracer = None
+        self.l2cap = None
+        self.stall_monitor = None
+        # seconds from startup until BlueZ accepted the registrations
+        self.time_to_ready = None
         dbus.service.Object.__init__(self, bus, self.path)
         self.add_service(EchoService(bus, 2))
 
@@ -35,7 +79,257 @@ class App(dbus.service.Object):
 
     def add_service(self, service):
         self.services.append(service)
+        self._index(service)
+        self._added(service)
+        for chrc in service.get_characteristics():
+            self._index_characteristic(chrc)
+
+    def remove_service(self, service):
+        self.services.remove(service)
+        for chrc in service.get_characteristics():
+            self._unindex_characteristic(chrc)
+        self._unindex(service)
+        self._removed(service)
+
+    def add_characteristic(self, service, chrc):
+        service.add_characteristic(chrc)
+        self._index_characteristic(chrc)
+        self._characteristics_changed(service)
+
+    def remove_characteristic(self, chrc):
+        chrc.service.remove_characteristic(chrc)
+        self._unindex_characteristic(chrc)
+        self._characteristics_changed(chrc.service)
+
+    def add_descriptor(self, chrc, desc):
+        """Add ``desc`` to ``chrc``, indexing it if ``chrc`` already is"""
+        chrc.add_descriptor(desc)
+        if chrc.path not in self._characteristics:
+            return
+        self._index(desc)
+        self._attach_store(desc)
+        self._added(desc)
+        self._descriptors_changed(chrc)
+
+    def remove_descriptor(self, desc):
+        chrc = desc.chrc
+        chrc.remove_descriptor(desc)
+        if chrc.path not in self._characteristics:
+            return
+        self._unindex(desc)
+        self._removed(desc)
+        self._descriptors_changed(chrc)
+
+    def _characteristics_changed(self, service):
+        if self.registered:
+            service.PropertiesChanged(
+                GATT_SERVICE_IFACE,
+                {
+                    "Characteristics": service.get_properties()[GATT_SERVICE_IFACE][
+                        "Characteristics"
+                    ]
+                },
+                [],
+            )
+
+    def _descriptors_changed(self, chrc):
+        if self.registered:
+            chrc.PropertiesChanged(
+                GATT_CHRC_IFACE,
+                {"Descriptors": chrc.get_properties()[GATT_CHRC_IFACE]["Descriptors"]},
+                [],
+            )
+
+    def _added(self, attr):
+        if self.registered:
+            self.InterfacesAdded(attr.get_path(), attr.get_properties())
+
+    def _removed(self, attr):
+        if self.registered:
+            self.InterfacesRemoved(attr.get_path(), list(attr.get_properties()))
+        attr.remove_from_connection()
+
+    def get_attribute(self, path: str):
+        """Service, characteristic or descriptor at ``path``, or None"""
+        return self._by_path.get(path)
+
+    def find_by_uuid(self, uuid: str) -> list:
+        """Attributes with ``uuid``, in the order they were added. UUIDs may
+        repeat across (and within) services."""
+        return self._by_uuid.get(normalize_uuid(uuid), [])
+
+    def get_characteristics(self):
+        return list(self._characteristics.values())
+
+    def _index(self, attr):
+        if attr.path in self._by_path:
+            raise ValueError(f"{attr.path} is already in use")
+        self._by_path[attr.path] = attr
+        self._by_uuid.setdefault(normalize_uuid(attr.uuid), []).append(attr)
+
+    def _unindex(self, attr):
+        del self._by_path[attr.path]
+        uuid = normalize_uuid(attr.uuid)
+        same = self._by_uuid[uuid]
+        same.remove(attr)
+        if not same:
+            del self._by_uuid[uuid]
+
+    def _index_characteristic(self, chrc):
+        self._index(chrc)
+        self._characteristics[chrc.path] = chrc
+        for desc in chrc.get_descriptors():
+            self._index(desc)
+        self._configure(chrc)
+        if self.registered:
+            self.InterfacesAdded(chrc.get_path(), chrc.get_properties())
+            for path, properties in chrc.get_descriptor_properties():
+                self.InterfacesAdded(path, properties)
 
+    def _unindex_characteristic(self, chrc):
+        if self.registered:
+            for path, properties in chrc.get_descriptor_properties():
+                self.InterfacesRemoved(path, list(properties))
+        for desc in chrc.get_descriptors():
+            self._unindex(desc)
+            desc.remove_from_connection()
+        if chrc.aggregator is not None:
+            chrc.aggregator.remove(chrc.path)
+        del self._characteristics[chrc.path]
+        self._unindex(chrc)
+        self._removed(chrc)
+
+    def _configure(self, chrc):
+        """Apply attached components to a newly indexed characteristic"""
+        if self.recorder is not None:
+            chrc.recorder = self.recorder
+        if self.limiter is not None:
+            chrc.limiter = self.limiter
+        if self.aggregator is not None and chrc.uuid in self._aggregate_uuids:
+            chrc.aggregator = self.aggregator
+        if (
+            self.offloader is not None
+            and chrc.uuid in self._offload_uuids
+            and chrc.offloadable
+        ):
+            chrc.offloader = self.offloader
+        if self.store is not None:
+            for attr in (chrc, *chrc.get_descriptors()):
+                self._attach_store(attr)
+
+    def _attach_store(self, attr):
+        if self.store is None or not attr.persistent:
+            return
+        value = self.store.get(attr.path)
+        if value is not None:
+            attr.value = dbus.ByteArray(value)
+        attr.store = self.store
+
+    def attach_recorder(self, recorder):
+        """Record every characteristic call with an echoez.record.Recorder"""
+        self.recorder = recorder
+        for chrc in self.get_characteristics():
+            self._configure(chrc)
+
+    def attach_store(self, store):
+        """Restore and persist values of persistent attributes with an
+        echoez.store.Store"""
+        self.store = store
+        for chrc in self.get_characteristics():
+            self._configure(chrc)
+
+    def attach_limiter(self, limiter):
+        """Reject reads and writes over the rates of an
+        echoez.ratelimit.RateLimiter"""
+        self.limiter = limiter
+        for chrc in self.get_characteristics():
+            self._configure(chrc)
+
+    def attach_aggregator(self, aggregator, uuids):
+        """Batch the values written to characteristics with one of ``uuids``
+        with an echoez.aggregate.WriteAggregator"""
+        self.aggregator = aggregator
+        self._aggregate_uuids = frozenset(uuids)
+        for chrc in self.get_characteristics():
+            self._configure(chrc)
+
+    def attach_offloader(self, offloader, uuids):
+        """Run the handlers of characteristics with one of ``uuids`` on an
+        echoez.offload.Offloader instead of the main loop. Characteristics
+        that aren't offloadable are left on the main loop."""
+        self.offloader = offloader
+        self._offload_uuids = frozenset(uuids)
+        refused = set()
+        for chrc in self.get_characteristics():
+            self._configure(chrc)
+            if chrc.uuid in self._offload_uuids and not chrc.offloadable:
+                refused.add(chrc.uuid)
+        for uuid in sorted(refused):
+            logger.warning(f"Handlers of {uuid} can't be offloaded")
+
+    def get_state(self) -> dict:
+        """
+        JSON-able values of persistent attributes, paths of notifying
+        characteristics and characteristic counters, for echoez.handoff
+        """
+        values = {}
+        notifying = []
+        counters = {}
+        for path, attr in self._by_path.items():
+            if getattr(attr, "persistent", False):
+                values[path] = base64.b64encode(bytes(attr.value)).decode()
+            if isinstance(attr, Characteristic):
+                if getattr(attr, "notifying", False):
+                    notifying.append(path)
+                if attr.reads or attr.writes:
+                    counters[path] = [attr.reads, attr.writes, attr.bytes_written]
+        return {"values": values, "notifying": notifying, "counters": counters}
+
+    def restore_state(self, state: dict):
+        """Apply get_state() of another App with the same tree. Paths that
+        don't exist here are ignored.
+
+        Characteristics that were notifying start notifying here, but CCC
+        subscriptions are not restored: BlueZ hasn't subscribed anyone to
+        this App's handles, so centrals must subscribe again to be notified.
+        """
+        for path, value in state.get("values", {}).items():
+            attr = self._by_path.get(path)
+            if attr is not None and getattr(attr, "persistent", False):
+                attr.value = dbus.ByteArray(base64.b64decode(value))
+        for path in state.get("notifying", ()):
+            attr = self._by_path.get(path)
+            if attr is not None and getattr(attr, "notifying", None) is False:
+                attr.start_notify()
+        for path, (reads, writes, bytes_written) in state.get("counters", {}).items():
+            attr = self._by_path.get(path)
+            if isinstance(attr, Characteristic):
+                attr.reads = reads
+                attr.writes = writes
+                attr.bytes_written = bytes_written
+
+    def get_stats(self):
+        """Counters and histograms keyed by attribute path (and component)"""
+        stats = {chrc.path: chrc.get_stats() for chrc in self.get_characteristics()}
+        if self.recorder is not None:
+            stats["recorder"] = self.recorder.get_stats()
+        if self.offloader is not None:
+            stats["offloader"] = self.offloader.get_stats()
+        if self.limiter is not None:
+            stats["limiter"] = self.limiter.get_stats()
+        if self.aggregator is not None:
+            stats["aggregator"] = self.aggregator.get_stats()
+        if self.tracer is not None:
+            stats["tracer"] = self.tracer.get_stats()
+        if self.l2cap is not None:
+            stats["l2cap"] = self.l2cap.get_stats()
+        if self.stall_monitor is not None:
+            stats["stall"] = self.stall_monitor.get_stats()
+        if self.time_to_ready is not None:
+            stats["time_to_ready_ms"] = round(self.time_to_ready * 1000)
+        return stats
+
+    @traced
     @dbus.service.method(DBUS_OM_IFACE, out_signature="a{oa{sa{sv}}}")
     def GetManagedObjects(self):
         response = {}
@@ -46,8 +340,35 @@ class App(dbus.service.Object):
             chrcs = service.get_characteristics()
             for chrc in chrcs:
                 response[chrc.get_path()] = chrc.get_properties()
-                descs = chrc.get_descriptors()
-                for desc in descs:
-                    response[desc.get_path()] = desc.get_properties()
+                for path, properties in chrc.get_descriptor_properties():
+                    response[path] = properties
 
         return response
+
+    def _get_profiler(self):
+        if self.profiler is None:
+            raise NotSupportedException("Profiling is not enabled (--profile-dir)")
+        return self.profiler
+
+    @traced
+    @dbus.service.method(ECHOEZ_IFACE, in_signature="", out_signature="")
+    def StartProfiling(self):
+        self._get_profiler().start()
+
+    @traced
+    @dbus.service.method(ECHOEZ_IFACE, in_signature="", out_signature="s")
+    def StopProfiling(self):
+        return self._get_profiler().stop() or ""
+
+    @traced
+    @dbus.service.method(ECHOEZ_IFACE, in_signature="", out_signature="s")
+    def SnapshotMemory(self):
+        return self._get_profiler().snapshot_memory() or ""
+
+    @dbus.service.signal(DBUS_OM_IFACE, signature="oa{sa{sv}}")
+    def InterfacesAdded(self, object_path, interfaces):
+        pass
+
+    @dbus.service.signal(DBUS_OM_IFACE, signature="oas")
+    def InterfacesRemoved(self, object_path, interfaces):
+        pass
@@ -2,10 +2,23 @@
 # SPDX-License-Identifier: LGPL-2.1-or-later
 # https://git.kernel.org/pub/scm/bluetooth/bluez.git/tree/test/
 
+import logging
+import struct
+import time
+
 import dbus.service
 
 from echoez.config import *
 from echoez.err import *
+from echoez.trace import traced
+from echoez.record import (
+    READ,
+    WRITE,
+    START_NOTIFY,
+    STOP_NOTIFY,
+)
+from echoez.integrity import IntegrityChecker
+from echoez.stats import Histogram
 from echoez.descriptor import (
     EchoDescriptor,
     EchoEncryptDescriptor,
@@ -15,51 +28,115 @@ from echoez.descriptor import (
 
 __all__ = [
     "Characteristic",
+    "StaticCharacteristic",
     "EchoCharacteristic",
     "EchoEncryptCharacteristic",
     "EchoSecureCharacteristic",
+    "LatencyProbeCharacteristic",
+    "BroadcastCharacteristic",
+    "IntegrityEchoCharacteristic",
+    "L2capPsmCharacteristic",
 ]
 
+logger = logging.getLogger(__name__)
+
 
 class Characteristic(dbus.service.Object):
     """
     org.bluez.GattCharacteristic1 interface implementation
     """
 
+    # optional echoez.record.Recorder, see App.attach_recorder
+    recorder = None
+    # optional echoez.store.Store, see App.attach_store
+    store = None
+    # whether App.attach_store should restore and persist .value
+    persistent = False
+    # optional echoez.offload.Offloader, see App.attach_offloader. Handlers
+    # then run on its pool, so they must be thread safe.
+    offloader = None
+    # whether App.attach_offloader may do that. Handlers that emit signals or
+    # update shared state must stay on the main loop.
+    offloadable = True
+    # optional echoez.ratelimit.RateLimiter, see App.attach_limiter
+    limiter = None
+    # optional echoez.aggregate.WriteAggregator, see App.attach_aggregator
+    aggregator = None
+
     def __init__(self, bus, index, uuid, flags, service):
         self.path = service.path + "/char" + str(index)
         self.bus = bus
         self.uuid = uuid
         self.service = service
-        self.flags = flags
         self.descriptors = []
+        self._dbus_path = dbus.ObjectPath(self.path)
+        self._properties = None
+        self.flags = flags
+        self.reads = 0
+        self.writes = 0
+        self.bytes_written = 0
         dbus.service.Object.__init__(self, bus, self.path)
 
+    @property
+    def flags(self):
+        return self._flags
+
+    @flags.setter
+    def flags(self, flags):
+        # a tuple, so the cached properties can't go stale by mutating it
+        self._flags = tuple(flags)
+        self.invalidate_properties()
+
     def get_properties(self):
-        return {
-            GATT_CHRC_IFACE: {
-                "Service": self.service.get_path(),
-                "UUID": self.uuid,
-                "Flags": self.flags,
-                "Descriptors": dbus.Array(self.get_descriptor_paths(), signature="o"),
+        # built once and shared by every GetAll/GetManagedObjects, so callers
+        # must not modify it. See invalidate_properties.
+        if self._properties is None:
+            self._properties = {
+                GATT_CHRC_IFACE: {
+                    "Service": self.service.get_path(),
+                    "UUID": self.uuid,
+                    "Flags": dbus.Array(self.flags, signature="s"),
+                    "Descriptors": dbus.Array(
+                        self.get_descriptor_paths(), signature="o"
+                    ),
+                }
             }
-        }
+        return self._properties
+
+    def invalidate_properties(self):
+        self._properties = None
 
     def get_path(self):
-        return dbus.ObjectPath(self.path)
+        return self._dbus_path
 
     def add_descriptor(self, descriptor):
         self.descriptors.append(descriptor)
+        self.invalidate_properties()
+
+    def remove_descriptor(self, descriptor):
+        self.descriptors.remove(descriptor)
+        self.invalidate_properties()
 
     def get_descriptor_paths(self):
-        result = []
-        for desc in self.descriptors:
-            result.append(desc.get_path())
-        return result
+        return [desc.get_path() for desc in self.get_descriptors()]
 
     def get_descriptors(self):
+        """Descriptor objects, indexed and exported by the App"""
         return self.descriptors
 
+    def get_descriptor_properties(self):
+        """(path, properties) of every descriptor, for GetManagedObjects and
+        InterfacesAdded"""
+        return ((desc.get_path(), desc.get_properties()) for desc in self.descriptors)
+
+    def get_stats(self):
+        return {
+            "reads": self.reads,
+            "writes": self.writes,
+            "bytes_written": self.bytes_written,
+        }
+
+    @traced
     @dbus.service.method(DBUS_PROP_IFACE, in_signature="s", out_signature="a{sv}")
     def GetAll(self, interface):
         if interface != GATT_CHRC_IFACE:
@@ -67,23 +144,94 @@ class Characteristic(dbus.service.Object):
 
         return self.get_properties()[GATT_CHRC_IFACE]
 
-    @dbus.service.method(GATT_CHRC_IFACE, in_signature="a{sv}", out_signature="ay")
-    def ReadValue(self, options):
+    @traced
+    @dbus.service.method(
+        GATT_CHRC_IFACE,
+        in_signature="a{sv}",
+        out_signature="ay",
+        async_callbacks=("reply_handler", "error_handler"),
+    )
+    def ReadValue(self, options, reply_handler, error_handler):
+        if self.limiter is not None:
+            device = options.get("device", "")
+            if not self.limiter.allow_read(device):
+                raise FailedException("Rate limited")
+            reply = reply_handler
+
+            def reply_handler(value):
+                self.limiter.charge_read(device, len(value))
+                reply(value)
+
+        self.reads += 1
+        if self.recorder is not None:
+            self.recorder.record(READ, self.path, options.get("device", ""), options)
+        if self.offloader is not None:
+            self.offloader.submit(
+                self.read_value, (options,), reply_handler, error_handler
+            )
+            return
+        reply_handler(self.read_value(options))
+
+    @traced
+    @dbus.service.method(
+        GATT_CHRC_IFACE,
+        in_signature="aya{sv}",
+        async_callbacks=("reply_handler", "error_handler"),
+    )
+    def WriteValue(self, value, options, reply_handler, error_handler):
+        if self.limiter is not None and not self.limiter.allow_write(
+            options.get("device", ""), len(value)
+        ):
+            raise FailedException("Rate limited")
+        self.writes += 1
+        self.bytes_written += len(value)
+        if self.recorder is not None:
+            self.recorder.record(
+                WRITE, self.path, options.get("device", ""), options, value
+            )
+        if self.aggregator is not None:
+            self.aggregator.append(self.path, value)
+        if self.offloader is not None:
+            self.offloader.submit(
+                self.write_value,
+                (value, options),
+                lambda _: reply_handler(),
+                error_handler,
+            )
+            return
+        self.write_value(value, options)
+        reply_handler()
+
+    @traced
+    @dbus.service.method(GATT_CHRC_IFACE)
+    def StartNotify(self):
+        if self.recorder is not None:
+            self.recorder.record(START_NOTIFY, self.path)
+        self.start_notify()
+
+    @traced
+    @dbus.service.method(GATT_CHRC_IFACE)
+    def StopNotify(self):
+        if self.recorder is not None:
+            self.recorder.record(STOP_NOTIFY, self.path)
+        self.stop_notify()
+
+    # Subclasses override these rather than the exported methods above, so
+    # every call goes through the same instrumented entry points.
+
+    def read_value(self, options):
         print("Default ReadValue called, returning error")
         raise NotSupportedException()
 
-    @dbus.service.method(GATT_CHRC_IFACE, in_signature="aya{sv}")
-    def WriteValue(self, value, options):
+    def write_value(self, value, options):
         print("Default WriteValue called, returning error")
         raise NotSupportedException()
 
-    @dbus.service.method(GATT_CHRC_IFACE)
-    def StartNotify(self):
+    def start_notify(self):
         print("Default StartNotify called, returning error")
         raise NotSupportedException()
 
-    @dbus.service.method(GATT_CHRC_IFACE)
-    def StopNotify(self):
+    def stop_notify(self):
         print("Default StopNotify called, returning error")
         raise NotSupportedException()
 
@@ -92,6 +240,24 @@ class Characteristic(dbus.service.Object):
         pass
 
 
+class StaticCharacteristic(Characteristic):
+    """
+    Read-only characteristic with a constant value. The value is encoded once
+    into a ready-to-send dbus.ByteArray, so reads don't allocate.
+
+    """
+
+    def __init__(self, bus, index, uuid, service, value: bytes, flags=("read",)):
+        Characteristic.__init__(self, bus, index, uuid, flags, service)
+        self.value = dbus.ByteArray(value)
+
+    def read_value(self, options):
+        offset = options.get("offset", 0)
+        if offset > len(self.value):
+            raise InvalidOffsetException()
+        return self.value[offset:] if offset else self.value
+
+
 class EchoCharacteristic(Characteristic):
     """
     Dummy test characteristic. Allows writing arbitrary bytes to its value, and
@@ -101,6 +267,8 @@ class EchoCharacteristic(Characteristic):
 
     TEST_CHRC_UUID = "12345678-1234-5678-1234-56789abcdef1"
 
+    persistent = True
+
     def __init__(self, bus, index, service):
         Characteristic.__init__(
             self,
@@ -114,13 +282,15 @@ class EchoCharacteristic(Characteristic):
         self.add_descriptor(EchoDescriptor(bus, 0, self))
         self.add_descriptor(CharacteristicUserDescriptionDescriptor(bus, 1, self))
 
-    def ReadValue(self, options):
+    def read_value(self, options):
         print("TestCharacteristic Read: " + repr(self.value))
         return self.value
 
-    def WriteValue(self, value, options):
+    def write_value(self, value, options):
         print("TestCharacteristic Write: " + repr(value))
         self.value = value
+        if self.store is not None:
+            self.store.put(self.path, value)
 
 
 class EchoEncryptCharacteristic(Characteristic):
@@ -144,11 +314,11 @@ class EchoEncryptCharacteristic(Characteristic):
         self.add_descriptor(EchoEncryptDescriptor(bus, 2, self))
         self.add_descriptor(CharacteristicUserDescriptionDescriptor(bus, 3, self))
 
-    def ReadValue(self, options):
+    def read_value(self, options):
         print("TestEncryptCharacteristic Read: " + repr(self.value))
         return self.value
 
-    def WriteValue(self, value, options):
+    def write_value(self, value, options):
         print("TestEncryptCharacteristic Write: " + repr(value))
         self.value = value
 
@@ -174,10 +344,204 @@ class EchoSecureCharacteristic(Characteristic):
         self.add_descriptor(EchoSecureDescriptor(bus, 2, self))
         self.add_descriptor(CharacteristicUserDescriptionDescriptor(bus, 3, self))
 
-    def ReadValue(self, options):
+    def read_value(self, options):
         print("TestSecureCharacteristic Read: " + repr(self.value))
         return self.value
 
-    def WriteValue(self, value, options):
+    def write_value(self, value, options):
         print("TestSecureCharacteristic Write: " + repr(value))
         self.value = value
+
+
+class LatencyProbeCharacteristic(Characteristic):
+    """
+    Latency probe. Every payload written is echoed back by notification with
+    two little-endian uint64 ``time.monotonic_ns()`` stamps appended: when the
+    write was received and when the notification was sent. The difference is
+    the server processing time, which is also kept in a histogram so clients
+    can split their RTT into client, link and server components.
+
+    The send stamp is part of the notified value, so it's taken just before
+    PropertiesChanged is emitted: the time spent sending the signal and in
+    BlueZ isn't included, and counts as link time on the client.
+
+    """
+
+    PROBE_CHRC_UUID = "12345678-1234-5678-1234-56789abcdef7"
+
+    # notifies and adds to the histogram from write_value
+    offloadable = False
+
+    STAMPS = struct.Struct("<QQ")
+
+    def __init__(self, bus, index, service):
+        Characteristic.__init__(
+            self,
+            bus,
+            index,
+            self.PROBE_CHRC_UUID,
+            ["read", "write", "write-without-response", "notify"],
+            service,
+        )
+        self.value = dbus.ByteArray(b"")
+        self.notifying = False
+        self.histogram = Histogram()
+
+    def get_stats(self):
+        stats = Characteristic.get_stats(self)
+        stats["processing_ns"] = self.histogram.as_dict()
+        return stats
+
+    def read_value(self, options):
+        return self.value
+
+    def write_value(self, value, options):
+        recv_ns = time.monotonic_ns()
+        frame = bytearray(value)
+        frame += self.STAMPS.pack(recv_ns, 0)
+        send_ns = time.monotonic_ns()
+        self.STAMPS.pack_into(frame, len(frame) - self.STAMPS.size, recv_ns, send_ns)
+        self.value = dbus.ByteArray(bytes(frame))
+        if self.notifying:
+            self.PropertiesChanged(GATT_CHRC_IFACE, {"Value": self.value}, [])
+        self.histogram.add(send_ns - recv_ns)
+
+    def start_notify(self):
+        if self.notifying:
+            logger.debug("LatencyProbe already notifying")
+            return
+        self.notifying = True
+
+    def stop_notify(self):
+        if not self.notifying:
+            logger.debug("LatencyProbe not notifying")
+            return
+        self.notifying = False
+        logger.info(f"LatencyProbe server processing ns: {self.histogram.as_dict()}")
+
+
+class BroadcastCharacteristic(Characteristic):
+    """
+    Broadcast echo. A value written by any device is notified to every
+    subscribed device.
+
+    BlueZ doesn't say which device StartNotify is for, and sends each
+    PropertiesChanged to every device subscribed to the characteristic, so
+    one PropertiesChanged per write reaches them all and the fan-out (and any
+    queueing per device) stays in BlueZ.
+
+    """
+
+    BROADCAST_CHRC_UUID = "12345678-1234-5678-1234-56789abcdef9"
+
+    # notifies from write_value
+    offloadable = False
+
+    def __init__(self, bus, index, service):
+        Characteristic.__init__(
+            self,
+            bus,
+            index,
+            self.BROADCAST_CHRC_UUID,
+            ["read", "write", "write-without-response", "notify"],
+            service,
+        )
+        self.value = dbus.ByteArray(b"")
+        self.notifying = False
+        self.published = 0
+
+    def get_stats(self):
+        stats = Characteristic.get_stats(self)
+        stats["broadcast"] = {"published": self.published}
+        return stats
+
+    def read_value(self, options):
+        return self.value
+
+    def write_value(self, value, options):
+        self.value = dbus.ByteArray(value)
+        if self.notifying:
+            self.PropertiesChanged(GATT_CHRC_IFACE, {"Value": self.value}, [])
+            self.published += 1
+
+    def start_notify(self):
+        if self.notifying:
+            logger.debug("Broadcast already notifying")
+            return
+        self.notifying = True
+
+    def stop_notify(self):
+        if not self.notifying:
+            logger.debug("Broadcast not notifying")
+            return
+        self.notifying = False
+
+
+class IntegrityEchoCharacteristic(Characteristic):
+    """
+    Integrity-checked echo. Writes are echoez.integrity frames (sequence
+    number, checksum, payload). Corrupt frames are rejected, and checksum
+    errors and sequence gaps are counted per device. Valid payloads are
+    echoed, read or notified, in a frame with the same sequence number and
+    a checksum computed here, so corruption on the way back is told apart
+    from corruption on the way in.
+
+    """
+
+    INTEGRITY_CHRC_UUID = "12345678-1234-5678-1234-56789abcdefb"
+
+    # notifies and counts errors per device from write_value
+    offloadable = False
+
+    def __init__(self, bus, index, service, checksum: str = "crc32"):
+        Characteristic.__init__(
+            self,
+            bus,
+            index,
+            self.INTEGRITY_CHRC_UUID,
+            ["read", "write", "write-without-response", "notify"],
+            service,
+        )
+        self.checker = IntegrityChecker(checksum)
+        self.value = dbus.ByteArray(b"")
+        self.notifying = False
+
+    def get_stats(self):
+        stats = Characteristic.get_stats(self)
+        stats["integrity"] = self.checker.get_stats()
+        return stats
+
+    def read_value(self, options):
+        return self.value
+
+    def write_value(self, value, options):
+        # a dbus.Array of dbus.Byte, not bytes-like
+        value = bytes(value)
+        try:
+            seq, payload = self.checker.check(options.get("device", ""), value)
+        except ValueError as e:
+            raise FailedException(str(e))
+        self.value = dbus.ByteArray(self.checker.echo(seq, payload))
+        if self.notifying:
+            self.PropertiesChanged(GATT_CHRC_IFACE, {"Value": self.value}, [])
+
+    def start_notify(self):
+        self.notifying = True
+
+    def stop_notify(self):
+        self.notifying = False
+
+
+class L2capPsmCharacteristic(StaticCharacteristic):
+    """
+    PSM of the L2CAP CoC echo (see echoez.l2cap) as a little-endian uint16,
+    under the UUID iOS and others look the PSM up by.
+
+    """
+
+    L2CAP_PSM_UUID = "abdd3056-28fa-441d-a470-55a75a52553a"
+
+    def __init__(self, bus, index, service, psm: int):
+        StaticCharacteristic.__init__(
+            self, bus, index, self.L2CAP_PSM_UUID, service, struct.pack("<H", psm)
+        )
@@ -13,7 +13,39 @@ from typing import (
     Optional,
 )
 
+import echoez.advertisement
+import echoez.integrity
+import echoez.l2cap
+import echoez.load
 import echoez.main
+import echoez.policy
+import echoez.profiling
+import echoez.ratelimit
+import echoez.replay
+import echoez.supervisor
+
+
+def rate_limit(spec: str):
+    """ "global-byte-rate=1e5" -> ("global_byte_rate", 100000.0)"""
+    name, _, rate = spec.partition("=")
+    name = name.replace("-", "_")
+    if name not in echoez.ratelimit.LIMITS:
+        raise argparse.ArgumentTypeError(f"unknown limit {name!r}")
+    try:
+        return name, float(rate)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid rate {rate!r}")
+
+
+def psm(value: str):
+    """ "0x80" or "128" -> 128"""
+    try:
+        psm = int(value, 0)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid PSM {value!r}")
+    if psm and psm not in echoez.l2cap.LE_PSM_DYNAMIC:
+        raise argparse.ArgumentTypeError(f"PSM {value!r} isn't 0 or 0x80-0xff")
+    return psm
 
 
 def cli_main(args: Optional[Sequence[str]] = None):
@@ -23,12 +55,284 @@ def cli_main(args: Optional[Sequence[str]] = None):
     )
     parser.add_argument("--name", help="to advertise service as", default="echoez")
     parser.add_argument("--verbose", "-v", action="store_true")
+    parser.add_argument(
+        "--record", metavar="FILE", help="append all GATT traffic to FILE"
+    )
+    parser.add_argument(
+        "--state-file",
+        metavar="FILE",
+        help="persist written attribute values in FILE across restarts",
+    )
+    parser.add_argument("--adapter", help="to use (eg. hci0), default: first found")
+    parser.add_argument(
+        "--offload",
+        metavar="UUID",
+        action="append",
+        default=[],
+        help="run handlers of this characteristic on a thread pool (repeatable)",
+    )
+    parser.add_argument(
+        "--offload-workers", type=int, default=4, help="threads in the pool"
+    )
+    parser.add_argument(
+        "--offload-queue",
+        type=int,
+        default=64,
+        help="max offloaded operations in flight before rejecting more",
+    )
+    parser.add_argument(
+        "--aggregate",
+        metavar="UUID",
+        action="append",
+        default=[],
+        help="append values written to this characteristic to the "
+        "--aggregate-to file in batches (repeatable)",
+    )
+    parser.add_argument(
+        "--aggregate-to",
+        metavar="FILE",
+        help="file batched writes are appended to",
+    )
+    parser.add_argument(
+        "--rate-limit",
+        metavar="LIMIT=RATE",
+        type=rate_limit,
+        action="append",
+        default=[],
+        help="reject reads and writes over RATE per second (repeatable). LIMIT "
+        "is one of read-rate, write-rate, byte-rate (written) and read-byte-rate, "
+        "per device, or the same prefixed with global- for all devices together",
+    )
+    parser.add_argument(
+        "--allow",
+        metavar="ADDRESS",
+        action="append",
+        default=[],
+        help="accept pairing requests from this device (repeatable)",
+    )
+    parser.add_argument(
+        "--allow-oui",
+        metavar="OUI",
+        action="append",
+        default=[],
+        help="accept pairing requests from devices with this OUI (repeatable)",
+    )
+    parser.add_argument(
+        "--auto-accept",
+        choices=echoez.policy.REQUESTS,
+        action="append",
+        default=[],
+        help="accept this kind of agent request from any device (repeatable)",
+    )
+    parser.add_argument("--pin-code", help="PIN code to answer RequestPinCode with")
+    parser.add_argument(
+        "--passkey", type=int, help="passkey to answer RequestPasskey with"
+    )
+    parser.add_argument(
+        "--trust",
+        metavar="ADDRESS",
+        action="append",
+        default=[],
+        help="mark this known device trusted at startup (repeatable)",
+    )
+    parser.add_argument(
+        "--trust-file",
+        metavar="FILE",
+        help="mark the devices in FILE (one address per line) trusted at startup",
+    )
+    parser.add_argument(
+        "--broadcast",
+        action="store_true",
+        help="notify values written by any device to every subscribed device",
+    )
+    parser.add_argument(
+        "--integrity",
+        metavar="CHECKSUM",
+        choices=sorted(echoez.integrity.CHECKSUMS),
+        help="add an echo of checksummed, sequence numbered frames",
+    )
+    parser.add_argument(
+        "--l2cap-psm",
+        metavar="PSM",
+        type=psm,
+        help="also echo over an LE L2CAP CoC on PSM (0x80-0xff), 0 for a dynamic one",
+    )
+    parser.add_argument(
+        "--synthetic",
+        metavar="N",
+        type=int,
+        default=0,
+        help="add N synthetic services to emulate a large device",
+    )
+    parser.add_argument(
+        "--synthetic-characteristics",
+        metavar="N",
+        type=int,
+        default=1000,
+        help="characteristics per synthetic service",
+    )
+    parser.add_argument(
+        "--synthetic-descriptors",
+        metavar="N",
+        type=int,
+        default=1,
+        help="descriptors per synthetic characteristic",
+    )
+    parser.add_argument(
+        "--profile-dir",
+        metavar="DIR",
+        help="enable runtime profiling (SIGUSR1 toggles, SIGUSR2 snapshots "
+        "memory) with dumps written to DIR",
+    )
+    parser.add_argument(
+        "--profiler",
+        choices=echoez.profiling.PROFILERS,
+        default="cprofile",
+        help="profiler SIGUSR1 toggles",
+    )
+    parser.add_argument(
+        "--sample-interval",
+        type=float,
+        default=0.005,
+        help="seconds between stack samples of the sample profiler",
+    )
+    parser.add_argument(
+        "--tracemalloc",
+        dest="tracemalloc_frames",
+        metavar="FRAMES",
+        type=int,
+        default=0,
+        help="trace allocations with FRAMES deep tracebacks for SIGUSR2 snapshots",
+    )
+    parser.add_argument(
+        "--trace-slow-ms",
+        metavar="MS",
+        type=float,
+        help="log D-Bus method calls that take longer than MS milliseconds",
+    )
+    parser.add_argument(
+        "--stall-threshold-ms",
+        metavar="MS",
+        type=float,
+        help="measure main loop lag and log where the loop is stuck for over MS",
+    )
+    parser.add_argument(
+        "--handoff",
+        metavar="SOCKET",
+        help="take over from the echoez listening on SOCKET without powering "
+        "the adapter off, then listen on it for the next restart",
+    )
+    parser.add_argument(
+        "--secondary-channel",
+        choices=echoez.advertisement.SECONDARY_CHANNELS,
+        help="use extended advertising on this PHY, if the adapter supports it",
+    )
+    parser.add_argument(
+        "--fast-restart",
+        action="store_true",
+        help="don't power cycle the adapter, so restarts keep links up",
+    )
+    subparsers = parser.add_subparsers(dest="command")
+    replay = subparsers.add_parser(
+        "replay",
+        help="replay GATT traffic recorded with --record, given the same "
+        "--broadcast, --integrity, --l2cap-psm and --synthetic options",
+    )
+    replay.add_argument("file", help="recording to replay")
+    replay.add_argument(
+        "--speed",
+        type=float,
+        default=1.0,
+        help="playback speed multiplier, 0 for as fast as possible",
+    )
+
+    supervise = subparsers.add_parser(
+        "supervise", help="run one worker process per adapter"
+    )
+    supervise.add_argument(
+        "adapters", nargs="*", help="to run workers on (eg. hci0), default: all"
+    )
+    supervise.add_argument(
+        "--stats-interval",
+        type=int,
+        default=5,
+        help="seconds between worker stats reports",
+    )
+
+    load = subparsers.add_parser(
+        "load", help="act as a central and drive load against echoez devices"
+    )
+    load.add_argument(
+        "--bus",
+        metavar="ADDRESS",
+        help="D-Bus address BlueZ is on (eg. a test bus), default: system bus",
+    )
+    load.add_argument(
+        "--devices", type=int, default=1, help="echoez devices to drive at once"
+    )
+    load.add_argument(
+        "--workload", choices=echoez.load.WORKLOADS, default="write", help="to run"
+    )
+    load.add_argument("--payload-size", type=int, default=20, help="bytes per write")
+    load.add_argument(
+        "--depth", type=int, default=1, help="operations in flight per device"
+    )
+    load.add_argument(
+        "--duration",
+        type=float,
+        default=10.0,
+        help="seconds to run the workload on each device",
+    )
+    load.add_argument(
+        "--discovery-timeout",
+        type=float,
+        default=30.0,
+        help="seconds to look for devices",
+    )
 
     args = parser.parse_args(args)
 
     # setup logging
     logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
-    del args.verbose
+    command = args.command
+    del args.verbose, args.command
+    if args.trust_file:
+        with open(args.trust_file) as f:
+            lines = (line.split("#", 1)[0].strip() for line in f)
+            args.trust += [line for line in lines if line]
+    del args.trust_file
+    args.rate_limit = dict(args.rate_limit)
+    if bool(args.aggregate) != bool(args.aggregate_to):
+        parser.error("--aggregate and --aggregate-to go together")
+
+    if command == "replay":
+        return echoez.replay.replay(
+            args.file,
+            name=args.name,
+            speed=args.speed,
+            broadcast=args.broadcast,
+            l2cap_psm=args.l2cap_psm,
+            integrity=args.integrity,
+            synthetic=args.synthetic,
+            synthetic_characteristics=args.synthetic_characteristics,
+            synthetic_descriptors=args.synthetic_descriptors,
+        )
+    if command == "load":
+        return echoez.load.load(
+            address=args.bus,
+            adapter=args.adapter,
+            devices=args.devices,
+            workload=args.workload,
+            payload_size=args.payload_size,
+            depth=args.depth,
+            duration=args.duration,
+            discovery_timeout=args.discovery_timeout,
+        )
+    if command == "supervise":
+        if args.adapter:
+            parser.error("use 'supervise ADAPTER...' instead of --adapter")
+        del args.adapter
+        return echoez.supervisor.supervise(**vars(args))
 
     return echoez.main.start(**vars(args))
 
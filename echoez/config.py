@@ -4,6 +4,7 @@
 
 __all__ = [
     "BLUEZ_SERVICE_NAME",
+    "ADAPTER_IFACE",
     "GATT_MANAGER_IFACE",
     "DBUS_OM_IFACE",
     "DBUS_PROP_IFACE",
@@ -14,9 +15,13 @@ __all__ = [
     "LE_ADVERTISING_MANAGER_IFACE",
     "AGENT_INTERFACE",
     "AGENT_MANAGER_INTERFACE",
+    "DEVICE_IFACE",
+    "BASE_UUID_SUFFIX",
+    "ECHOEZ_IFACE",
 ]
 
 BLUEZ_SERVICE_NAME = "org.bluez"
+ADAPTER_IFACE = "org.bluez.Adapter1"
 GATT_MANAGER_IFACE = "org.bluez.GattManager1"
 DBUS_OM_IFACE = "org.freedesktop.DBus.ObjectManager"
 DBUS_PROP_IFACE = "org.freedesktop.DBus.Properties"
@@ -27,3 +32,8 @@ LE_ADVERTISEMENT_IFACE = "org.bluez.LEAdvertisement1"
 LE_ADVERTISING_MANAGER_IFACE = "org.bluez.LEAdvertisingManager1"
 AGENT_INTERFACE = "org.bluez.Agent1"
 AGENT_MANAGER_INTERFACE = "org.bluez.AgentManager1"
+DEVICE_IFACE = "org.bluez.Device1"
+# Bluetooth Base UUID, after the 32 bit prefix
+BASE_UUID_SUFFIX = "-0000-1000-8000-00805f9b34fb"
+# control interface exported by echoez itself
+ECHOEZ_IFACE = "com.mdegans.Echoez1"
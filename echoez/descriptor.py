@@ -8,9 +8,11 @@ import dbus.service
 
 from echoez.config import *
 from echoez.err import *
+from echoez.trace import traced
 
 __all__ = [
     "Descriptor",
+    "StaticDescriptor",
     "EchoDescriptor",
     "EchoEncryptDescriptor",
     "EchoSecureDescriptor",
@@ -23,26 +25,51 @@ class Descriptor(dbus.service.Object):
     org.bluez.GattDescriptor1 interface implementation
     """
 
+    # optional echoez.store.Store, see App.attach_store
+    store = None
+    # whether App.attach_store should restore and persist .value
+    persistent = False
+
     def __init__(self, bus, index, uuid, flags, characteristic):
         self.path = characteristic.path + "/desc" + str(index)
         self.bus = bus
         self.uuid = uuid
-        self.flags = flags
         self.chrc = characteristic
+        self._dbus_path = dbus.ObjectPath(self.path)
+        self._properties = None
+        self.flags = flags
         dbus.service.Object.__init__(self, bus, self.path)
 
+    @property
+    def flags(self):
+        return self._flags
+
+    @flags.setter
+    def flags(self, flags):
+        # a tuple, so the cached properties can't go stale by mutating it
+        self._flags = tuple(flags)
+        self.invalidate_properties()
+
     def get_properties(self):
-        return {
-            GATT_DESC_IFACE: {
-                "Characteristic": self.chrc.get_path(),
-                "UUID": self.uuid,
-                "Flags": self.flags,
+        # built once and shared by every GetAll/GetManagedObjects, so callers
+        # must not modify it. See invalidate_properties.
+        if self._properties is None:
+            self._properties = {
+                GATT_DESC_IFACE: {
+                    "Characteristic": self.chrc.get_path(),
+                    "UUID": self.uuid,
+                    "Flags": dbus.Array(self.flags, signature="s"),
+                }
             }
-        }
+        return self._properties
+
+    def invalidate_properties(self):
+        self._properties = None
 
     def get_path(self):
-        return dbus.ObjectPath(self.path)
+        return self._dbus_path
 
+    @traced
     @dbus.service.method(DBUS_PROP_IFACE, in_signature="s", out_signature="a{sv}")
     def GetAll(self, interface):
         if interface != GATT_DESC_IFACE:
@@ -50,18 +77,47 @@ class Descriptor(dbus.service.Object):
 
         return self.get_properties()[GATT_DESC_IFACE]
 
+    @traced
     @dbus.service.method(GATT_DESC_IFACE, in_signature="a{sv}", out_signature="ay")
     def ReadValue(self, options):
-        print("Default ReadValue called, returning error")
-        raise NotSupportedException()
+        return self.read_value(options)
 
+    @traced
     @dbus.service.method(GATT_DESC_IFACE, in_signature="aya{sv}")
     def WriteValue(self, value, options):
+        self.write_value(value, options)
+
+    # Subclasses override these rather than the exported methods above, so
+    # every call goes through the same entry points (see echoez.trace).
+
+    def read_value(self, options):
+        print("Default ReadValue called, returning error")
+        raise NotSupportedException()
+
+    def write_value(self, value, options):
         print("Default WriteValue called, returning error")
         raise NotSupportedException()
 
 
-class EchoDescriptor(Descriptor):
+class StaticDescriptor(Descriptor):
+    """
+    Descriptor with a constant value. The value is encoded once into a
+    ready-to-send dbus.ByteArray, so reads don't allocate.
+
+    """
+
+    def __init__(self, bus, index, uuid, flags, characteristic, value: bytes):
+        self.value = dbus.ByteArray(value)
+        Descriptor.__init__(self, bus, index, uuid, flags, characteristic)
+
+    def read_value(self, options):
+        offset = options.get("offset", 0)
+        if offset > len(self.value):
+            raise InvalidOffsetException()
+        return self.value[offset:] if offset else self.value
+
+
+class EchoDescriptor(StaticDescriptor):
     """
     Dummy test descriptor. Returns a static value.
 
@@ -70,15 +126,18 @@ class EchoDescriptor(Descriptor):
     TEST_DESC_UUID = "12345678-1234-5678-1234-56789abcdef2"
 
     def __init__(self, bus, index, characteristic):
-        Descriptor.__init__(
-            self, bus, index, self.TEST_DESC_UUID, ["read", "write"], characteristic
+        StaticDescriptor.__init__(
+            self,
+            bus,
+            index,
+            self.TEST_DESC_UUID,
+            ["read", "write"],
+            characteristic,
+            b"Echo",
         )
 
-    def ReadValue(self, options):
-        return [dbus.Byte("E"), dbus.Byte("c"), dbus.Byte("h"), dbus.Byte("o")]
-
 
-class EchoEncryptDescriptor(Descriptor):
+class EchoEncryptDescriptor(StaticDescriptor):
     """
     Dummy test descriptor requiring encryption. Returns a static value.
 
@@ -87,20 +146,18 @@ class EchoEncryptDescriptor(Descriptor):
     TEST_DESC_UUID = "12345678-1234-5678-1234-56789abcdef4"
 
     def __init__(self, bus, index, characteristic):
-        Descriptor.__init__(
+        StaticDescriptor.__init__(
             self,
             bus,
             index,
             self.TEST_DESC_UUID,
             ["encrypt-read", "encrypt-write"],
             characteristic,
+            b"Echo",
         )
 
-    def ReadValue(self, options):
-        return [dbus.Byte("E"), dbus.Byte("c"), dbus.Byte("h"), dbus.Byte("o")]
-
 
-class EchoSecureDescriptor(Descriptor):
+class EchoSecureDescriptor(StaticDescriptor):
     """
     Dummy test descriptor requiring secure connection. Returns a static value.
 
@@ -109,18 +166,16 @@ class EchoSecureDescriptor(Descriptor):
     TEST_DESC_UUID = "12345678-1234-5678-1234-56789abcdef6"
 
     def __init__(self, bus, index, characteristic):
-        Descriptor.__init__(
+        StaticDescriptor.__init__(
             self,
             bus,
             index,
             self.TEST_DESC_UUID,
             ["secure-read", "secure-write"],
             characteristic,
+            b"Echo",
         )
 
-    def ReadValue(self, options):
-        return [dbus.Byte("E"), dbus.Byte("c"), dbus.Byte("h"), dbus.Byte("o")]
-
 
 class CharacteristicUserDescriptionDescriptor(Descriptor):
     """
@@ -130,6 +185,8 @@ class CharacteristicUserDescriptionDescriptor(Descriptor):
 
     CUD_UUID = "2901"
 
+    persistent = True
+
     def __init__(self, bus, index, characteristic):
         self.writable = "writable-auxiliaries" in characteristic.flags
         self.value = array.array("B", b"This is a characteristic for testing")
@@ -138,10 +195,12 @@ class CharacteristicUserDescriptionDescriptor(Descriptor):
             self, bus, index, self.CUD_UUID, ["read", "write"], characteristic
         )
 
-    def ReadValue(self, options):
+    def read_value(self, options):
         return self.value
 
-    def WriteValue(self, value, options):
+    def write_value(self, value, options):
         if not self.writable:
             raise NotPermittedException()
         self.value = value
+        if self.store is not None:
+            self.store.put(self.path, value)
@@ -7,10 +7,12 @@ import dbus.exceptions
 __all__ = [
     "FailedException",
     "InvalidArgsException",
+    "InvalidOffsetException",
     "InvalidValueLengthException",
     "NotPermittedException",
     "NotSupportedException",
     "RejectedException",
+    "UnknownObjectException",
 ]
 
 
@@ -26,6 +28,10 @@ class NotPermittedException(dbus.exceptions.DBusException):
     _dbus_error_name = "org.bluez.Error.NotPermitted"
 
 
+class InvalidOffsetException(dbus.exceptions.DBusException):
+    _dbus_error_name = "org.bluez.Error.InvalidOffset"
+
+
 class InvalidValueLengthException(dbus.exceptions.DBusException):
     _dbus_error_name = "org.bluez.Error.InvalidValueLength"
 
@@ -36,3 +42,7 @@ class FailedException(dbus.exceptions.DBusException):
 
 class RejectedException(dbus.exceptions.DBusException):
     _dbus_error_name = "org.bluez.Error.Rejected"
+
+
+class UnknownObjectException(dbus.exceptions.DBusException):
+    _dbus_error_name = "org.freedesktop.DBus.Error.UnknownObject"
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: LGPL-2.1-or-later
+
+"""
+State handoff from a running echoez to its replacement, so a restart doesn't
+power cycle the adapter or lose in-memory values.
+
+Messages are a big-endian uint32 length followed by that many bytes of utf-8
+JSON, over a Unix stream socket the running process listens on:
+
+1. the new process connects and sends ``{"op": "hello"}``
+2. the old one replies ``{"op": "state", ...}`` with App.get_state()
+3. the new process restores the state, registers with BlueZ alongside the
+   old one and sends ``{"op": "ready"}``
+4. the old one unregisters, replies ``{"op": "released", ...}`` with its
+   final state and exits, leaving the adapter powered
+"""
+
+import errno
+import json
+import logging
+import os
+import socket
+import struct
+
+from typing import (
+    Callable,
+    List,
+    Optional,
+)
+
+try:
+    from gi.repository import GLib  # pyright: reportMissingImports=false
+except ImportError:
+    import gobject as GLib  # pyright: reportMissingImports=false
+
+__all__ = [
+    "HandoffClient",
+    "HandoffServer",
+    "Decoder",
+    "encode",
+]
+
+logger = logging.getLogger(__name__)
+
+HEADER = struct.Struct(">I")
+MAX_MESSAGE = 64 << 20
+
+
+def encode(message: dict) -> bytes:
+    data = json.dumps(message, separators=(",", ":")).encode()
+    if len(data) > MAX_MESSAGE:
+        raise ValueError(f"Handoff message of {len(data)} bytes is too large")
+    return HEADER.pack(len(data)) + data
+
+
+class Decoder:
+    """Splits a byte stream into messages"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def feed(self, data) -> List[dict]:
+        """Messages completed by ``data``"""
+        buffer = self._buffer
+        buffer += data
+        messages = []
+        while len(buffer) >= HEADER.size:
+            (size,) = HEADER.unpack_from(buffer)
+            if size > MAX_MESSAGE:
+                raise ValueError(f"Handoff message of {size} bytes is too large")
+            end = HEADER.size + size
+            if len(buffer) < end:
+                break
+            messages.append(json.loads(bytes(buffer[HEADER.size : end])))
+            del buffer[:end]
+        return messages
+
+
+class HandoffClient:
+    """
+    The new process' side. Blocking, it runs before and right after
+    registration, while there's nothing else for the main loop to do.
+    """
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self._decoder = Decoder()
+        self._messages = []
+
+    @classmethod
+    def connect(cls, path: str, timeout: float = 5.0) -> Optional["HandoffClient"]:
+        """Client for the process listening on ``path``, None if there's none"""
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        try:
+            sock.connect(path)
+        except (FileNotFoundError, ConnectionRefusedError):
+            sock.close()
+            return None
+        return cls(sock)
+
+    def _request(self, message: dict, reply: str) -> dict:
+        self.sock.sendall(encode(message))
+        while not self._messages:
+            data = self.sock.recv(1 << 16)
+            if not data:
+                raise ConnectionError("Handoff peer hung up")
+            self._messages += self._decoder.feed(data)
+        message = self._messages.pop(0)
+        if message.get("op") != reply:
+            raise ConnectionError(f"Expected {reply!r} from handoff peer: {message}")
+        return message
+
+    def receive_state(self) -> dict:
+        return self._request({"op": "hello"}, "state")
+
+    def release(self) -> dict:
+        """Tell the old process we're registered, returning its final state
+        once it has unregistered"""
+        try:
+            return self._request({"op": "ready"}, "released")
+        finally:
+            self.sock.close()
+
+
+class _Peer:
+    __slots__ = ("sock", "decoder", "pending", "reading", "writing")
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self.decoder = Decoder()
+        # encoded replies not sent yet
+        self.pending = bytearray()
+        self.reading = None
+        self.writing = None
+
+
+class HandoffServer:
+    """
+    The running process' side, on the GLib main loop. ``get_state()`` is
+    sent to a new process on request, and ``release()`` is called once it's
+    ready, after which the server stops listening.
+
+    Replies are sent without blocking, so a new process that doesn't read
+    can't stall the main loop. Only the final state is sent blocking, for up
+    to ``send_timeout`` seconds, as ``release()`` usually stops the loop.
+
+    Raises OSError (EADDRINUSE) if another process is listening on ``path``.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        get_state: Callable[[], dict],
+        release: Callable[[], None],
+        send_timeout: float = 5.0,
+    ):
+        self.path = path
+        self.get_state = get_state
+        self.release = release
+        self.send_timeout = send_timeout
+        self._remove_stale(path)
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.listener.bind(path)
+            self.listener.listen()
+        except OSError:
+            self.listener.close()
+            raise
+        self.listener.setblocking(False)
+        self._watch = GLib.io_add_watch(
+            self.listener.fileno(), GLib.PRIORITY_DEFAULT, GLib.IO_IN, self._on_accept
+        )
+
+    @staticmethod
+    def _remove_stale(path: str):
+        """Unlink ``path`` if it's left behind by a process that died"""
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+        except (FileNotFoundError, ConnectionRefusedError) as e:
+            if isinstance(e, ConnectionRefusedError):
+                logger.debug(f"Removing stale handoff socket {path}")
+                os.unlink(path)
+            return
+        finally:
+            probe.close()
+        raise OSError(errno.EADDRINUSE, "Another echoez is listening", path)
+
+    def _on_accept(self, fd, condition):
+        try:
+            sock, _ = self.listener.accept()
+        except BlockingIOError:
+            return True
+        sock.setblocking(False)
+        peer = _Peer(sock)
+        peer.reading = GLib.io_add_watch(
+            sock.fileno(),
+            GLib.PRIORITY_DEFAULT,
+            GLib.IO_IN | GLib.IO_HUP | GLib.IO_ERR,
+            self._on_readable,
+            peer,
+        )
+        logger.info("Handoff requested")
+        return True
+
+    def _on_readable(self, fd, condition, peer: _Peer):
+        try:
+            data = peer.sock.recv(1 << 16)
+            messages = peer.decoder.feed(data) if data else None
+        except (OSError, ValueError) as e:
+            logger.error(f"Handoff failed: {e}")
+            messages = None
+        if messages is None:
+            self._hang_up(peer)
+            return False
+        for message in messages:
+            if message.get("op") == "hello":
+                peer.pending += encode({"op": "state", **self.get_state()})
+                if not self._flush(peer):
+                    return False
+            elif message.get("op") == "ready":
+                state = self.get_state()
+                self.close()
+                self.release()
+                peer.pending += encode({"op": "released", **state})
+                peer.sock.settimeout(self.send_timeout)
+                try:
+                    peer.sock.sendall(peer.pending)
+                    logger.info("Handed off to the new process")
+                except OSError as e:
+                    logger.error(f"Handoff failed: {e}")
+                self._hang_up(peer)
+                return False
+        return True
+
+    def _on_writable(self, fd, condition, peer: _Peer):
+        if self._flush(peer) and peer.pending:
+            return True
+        peer.writing = None
+        return False
+
+    def _flush(self, peer: _Peer) -> bool:
+        """Send what the socket takes of ``peer.pending`` and watch for room
+        for the rest. False if the peer is gone."""
+        try:
+            sent = peer.sock.send(peer.pending)
+        except (BlockingIOError, InterruptedError):
+            sent = 0
+        except OSError as e:
+            logger.error(f"Handoff failed: {e}")
+            self._hang_up(peer)
+            return False
+        del peer.pending[:sent]
+        if peer.pending and peer.writing is None:
+            peer.writing = GLib.io_add_watch(
+                peer.sock.fileno(),
+                GLib.PRIORITY_DEFAULT,
+                GLib.IO_OUT,
+                self._on_writable,
+                peer,
+            )
+        return True
+
+    def _hang_up(self, peer: _Peer):
+        # the watch calling this is removed by returning False
+        current = GLib.main_current_source().get_id()
+        for watch in (peer.reading, peer.writing):
+            if watch is not None and watch != current:
+                GLib.source_remove(watch)
+        peer.reading = peer.writing = None
+        peer.sock.close()
+
+    def close(self):
+        if self._watch is not None:
+            GLib.source_remove(self._watch)
+            self._watch = None
+            self.listener.close()
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
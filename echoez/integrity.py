@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: LGPL-2.1-or-later
+
+"""
+Integrity-checked echo frames.
+
+A frame is a ``HEADER`` (little-endian uint32 sequence number and uint32
+checksum) followed by the payload. The checksum covers the sequence number
+and the payload, so a corrupt sequence number isn't mistaken for a gap.
+Checksums run over memoryviews of the frame, never copying the payload or
+looping over it in Python.
+"""
+
+import struct
+import zlib
+
+from typing import (
+    Callable,
+    Dict,
+    Optional,
+    Tuple,
+)
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+__all__ = [
+    "CHECKSUMS",
+    "IntegrityChecker",
+    "decode",
+    "encode",
+]
+
+# sequence number, checksum
+HEADER = struct.Struct("<II")
+SEQ = struct.Struct("<I")
+SEQ_MASK = 0xFFFFFFFF
+
+
+def _crc32(seq: memoryview, payload: memoryview) -> int:
+    return zlib.crc32(payload, zlib.crc32(seq))
+
+
+def _xxh32(seq: memoryview, payload: memoryview) -> int:
+    h = xxhash.xxh32(seq)
+    h.update(payload)
+    return h.intdigest()
+
+
+# checksums by name, xxh32 if the xxhash package is installed
+CHECKSUMS: Dict[str, Callable[..., int]] = {"crc32": _crc32}
+if xxhash is not None:
+    CHECKSUMS["xxh32"] = _xxh32
+
+
+def encode(seq: int, payload, checksum: str = "crc32") -> bytes:
+    seq_bytes = SEQ.pack(seq & SEQ_MASK)
+    with memoryview(seq_bytes) as s, memoryview(payload) as p:
+        value = CHECKSUMS[checksum](s, p)
+    return b"".join((seq_bytes, SEQ.pack(value), payload))
+
+
+def decode(frame, checksum: str = "crc32") -> Tuple[int, memoryview]:
+    """Sequence number and a view of the payload of ``frame``. Raises
+    ValueError if it's too short or the checksum doesn't match."""
+    view = memoryview(frame)
+    if len(view) < HEADER.size:
+        raise ValueError(f"Frame of {len(view)} bytes is too short")
+    seq, expected = HEADER.unpack_from(view)
+    payload = view[HEADER.size :]
+    if CHECKSUMS[checksum](view[: SEQ.size], payload) != expected:
+        raise ValueError(f"Checksum mismatch in frame {seq}")
+    return seq, payload
+
+
+class _Device:
+    __slots__ = ("next_seq", "frames", "errors", "gaps", "lost", "stale")
+
+    def __init__(self):
+        self.next_seq: Optional[int] = None
+        self.frames = 0
+        self.errors = 0
+        self.gaps = 0
+        self.lost = 0
+        self.stale = 0
+
+
+class IntegrityChecker:
+    """
+    Validates frames per device. Counts checksum errors, gaps in the
+    sequence (and the frames lost in them) and stale frames, whose sequence
+    number is behind one already seen (duplicated or reordered). Sequence
+    numbers wrap around.
+    """
+
+    def __init__(self, checksum: str = "crc32"):
+        if checksum not in CHECKSUMS:
+            raise ValueError(f"Unknown or unavailable checksum {checksum!r}")
+        self.checksum = checksum
+        self._devices: Dict[str, _Device] = {}
+
+    def check(self, device: str, frame) -> Tuple[int, memoryview]:
+        """Sequence number and payload of a frame from ``device``. Raises
+        ValueError if it's corrupt."""
+        state = self._devices.get(device)
+        if state is None:
+            state = self._devices[device] = _Device()
+        try:
+            seq, payload = decode(frame, self.checksum)
+        except ValueError:
+            state.errors += 1
+            raise
+        state.frames += 1
+        if state.next_seq is not None:
+            ahead = (seq - state.next_seq) & SEQ_MASK
+            if ahead > SEQ_MASK >> 1:
+                state.stale += 1
+                return seq, payload
+            if ahead:
+                state.gaps += 1
+                state.lost += ahead
+        state.next_seq = (seq + 1) & SEQ_MASK
+        return seq, payload
+
+    def echo(self, seq: int, payload) -> bytes:
+        """Frame echoing ``payload`` with a checksum of our own"""
+        return encode(seq, payload, self.checksum)
+
+    def get_stats(self):
+        devices = {
+            device: {
+                "frames": s.frames,
+                "errors": s.errors,
+                "gaps": s.gaps,
+                "lost": s.lost,
+                "stale": s.stale,
+            }
+            for device, s in self._devices.items()
+        }
+        return {
+            "checksum": self.checksum,
+            "devices": devices,
+            "errors": sum(d["errors"] for d in devices.values()),
+            "gaps": sum(d["gaps"] for d in devices.values()),
+        }
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: LGPL-2.1-or-later
+
+"""Echo over L2CAP connection-oriented channels (or any SOCK_SEQPACKET)."""
+
+import errno
+import logging
+import selectors
+import socket
+
+from typing import (
+    Dict,
+)
+
+__all__ = [
+    "EchoEngine",
+    "l2cap_listener",
+]
+
+logger = logging.getLogger(__name__)
+
+# address types for LE sockets, from bluetooth.h
+BDADDR_LE_PUBLIC = 0x01
+# an L2CAP SDU is at most this long
+MAX_SDU = 0xFFFF
+# PSMs of the LE dynamic range, the ones servers may listen on (0 picks one)
+LE_PSM_DYNAMIC = range(0x80, 0x100)
+
+
+def l2cap_listener(psm: int = 0, address: str = "00:00:00:00:00:00"):
+    """
+    Listening LE L2CAP CoC socket on ``psm``, 0 for a dynamic one (see
+    ``getsockname()[1]``).
+
+    Raises OSError on Pythons before 3.14, which can't bind to an LE address
+    type: a BR/EDR socket would be of no use to LE centrals.
+    """
+    if psm and psm not in LE_PSM_DYNAMIC:
+        raise ValueError(f"LE PSM must be 0 or from 0x80 to 0xff, not {psm:#x}")
+    sock = socket.socket(
+        socket.AF_BLUETOOTH, socket.SOCK_SEQPACKET, socket.BTPROTO_L2CAP
+    )
+    try:
+        try:
+            sock.bind((address, psm, 0, BDADDR_LE_PUBLIC))
+        except TypeError:
+            raise OSError(
+                errno.EAFNOSUPPORT, "LE L2CAP sockets need Python 3.14 or later"
+            ) from None
+        sock.listen()
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+class _Connection:
+    __slots__ = ("sock", "buffer", "view", "pending")
+
+    def __init__(self, sock: socket.socket, bufsize: int):
+        self.sock = sock
+        self.buffer = bytearray(bufsize)
+        self.view = memoryview(self.buffer)
+        # length of a received packet not echoed yet
+        self.pending = 0
+
+
+class EchoEngine:
+    """
+    Echoes every packet received on the connections accepted from
+    ``listener`` (a listening SOCK_SEQPACKET socket of any family) back to
+    its sender.
+
+    Each connection receives with ``recv_into`` into a buffer of its own,
+    allocated once. A packet that can't be sent right away stays in the
+    buffer and the connection isn't read again until it has been, so a slow
+    peer only slows itself down.
+
+    The engine runs on a selector and doesn't own a loop: call :meth:`poll`
+    when :meth:`fileno` (the selector's epoll fd on Linux) is readable, eg.
+    from a GLib IO watch, or in a loop of your own.
+    """
+
+    def __init__(
+        self, listener: socket.socket, bufsize: int = MAX_SDU, max_connections=64
+    ):
+        self.listener = listener
+        self.bufsize = bufsize
+        self.max_connections = max_connections
+        self.selector = selectors.DefaultSelector()
+        self.accepted = 0
+        self.refused = 0
+        self.packets = 0
+        self.bytes = 0
+        self.blocked = 0
+        self._connections: Dict[int, _Connection] = {}
+        listener.setblocking(False)
+        self.selector.register(listener, selectors.EVENT_READ)
+
+    def fileno(self) -> int:
+        return self.selector.fileno()
+
+    def poll(self, timeout: float = 0) -> int:
+        """Handle ready sockets, waiting up to ``timeout`` seconds (None
+        waits forever). Returns the number of events handled."""
+        events = self.selector.select(timeout)
+        for key, mask in events:
+            if key.fileobj is self.listener:
+                self._accept()
+            elif mask & selectors.EVENT_WRITE:
+                self._flush(key.data)
+            else:
+                self._echo(key.data)
+        return len(events)
+
+    def _accept(self):
+        try:
+            sock, _ = self.listener.accept()
+        except (BlockingIOError, InterruptedError):
+            return
+        if len(self._connections) >= self.max_connections:
+            self.refused += 1
+            sock.close()
+            return
+        sock.setblocking(False)
+        conn = _Connection(sock, self.bufsize)
+        self._connections[sock.fileno()] = conn
+        self.selector.register(sock, selectors.EVENT_READ, conn)
+        self.accepted += 1
+        logger.debug(f"L2CAP connection {sock.fileno()} accepted")
+
+    def _echo(self, conn: _Connection):
+        try:
+            size = conn.sock.recv_into(conn.buffer)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            logger.debug(f"L2CAP connection {conn.sock.fileno()}: {e}")
+            self._close(conn)
+            return
+        if not size:
+            self._close(conn)
+            return
+        self.packets += 1
+        self.bytes += size
+        conn.pending = size
+        self._flush(conn)
+
+    def _flush(self, conn: _Connection):
+        blocked = False
+        try:
+            with conn.view[: conn.pending] as packet:
+                conn.sock.send(packet)
+        except (BlockingIOError, InterruptedError):
+            blocked = True
+        except OSError as e:
+            logger.debug(f"L2CAP connection {conn.sock.fileno()}: {e}")
+            self._close(conn)
+            return
+        events = selectors.EVENT_WRITE if blocked else selectors.EVENT_READ
+        if blocked:
+            self.blocked += 1
+        else:
+            conn.pending = 0
+        if self.selector.get_key(conn.sock).events != events:
+            self.selector.modify(conn.sock, events, conn)
+
+    def _close(self, conn: _Connection):
+        self.selector.unregister(conn.sock)
+        del self._connections[conn.sock.fileno()]
+        conn.view.release()
+        conn.sock.close()
+
+    def get_stats(self):
+        return {
+            "connections": len(self._connections),
+            "accepted": self.accepted,
+            "refused": self.refused,
+            "packets": self.packets,
+            "bytes": self.bytes,
+            "blocked": self.blocked,
+        }
+
+    def close(self):
+        for conn in list(self._connections.values()):
+            self._close(conn)
+        self.selector.unregister(self.listener)
+        self.selector.close()
+        self.listener.close()
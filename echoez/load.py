@@ -0,0 +1,528 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: LGPL-2.1-or-later
+
+"""Central-mode load generator driving a fleet of echoez peripherals."""
+
+import collections
+import functools
+import logging
+import time
+
+from typing import (
+    Dict,
+    Optional,
+)
+
+import dbus
+import dbus.bus
+import dbus.mainloop.glib
+
+from echoez.config import *
+from echoez.characteristic import (
+    EchoCharacteristic,
+    LatencyProbeCharacteristic,
+)
+from echoez.service import EchoService
+from echoez.stats import Histogram
+
+try:
+    from gi.repository import GLib  # pyright: reportMissingImports=false
+except ImportError:
+    import gobject as GLib  # pyright: reportMissingImports=false
+
+__all__ = [
+    "WORKLOADS",
+    "DeviceLoad",
+    "LoadGenerator",
+    "load",
+]
+
+logger = logging.getLogger(__name__)
+
+# read and write drive the echo characteristic, notify writes to the latency
+# probe and times the notification it echoes back
+WORKLOADS = ("read", "write", "notify")
+
+# proxies aren't introspected, so arguments need explicit signatures
+_NO_OPTIONS = dbus.Dictionary({}, signature="sv")
+_COMMAND = dbus.Dictionary({"type": "command"}, signature="sv")
+
+
+class DeviceLoad:
+    """The workload against one device and its counters"""
+
+    def __init__(self, gen: "LoadGenerator", path: str):
+        self.gen = gen
+        self.path = path
+        self.state = "discovered"
+        self.chrc: Optional[dbus.Interface] = None
+        self.chrc_path: Optional[str] = None
+        self.ops = 0
+        self.bytes = 0
+        self.errors = 0
+        # notifications not received within the generator's op_timeout
+        self.lost = 0
+        self.latency = Histogram()
+        self.started = 0.0
+        self.stopped = 0.0
+        self.outstanding = 0
+        # send times of writes awaiting their notification
+        self._sent = collections.deque()
+        self._duration_timer = None
+        self._expire_timer = None
+
+    @property
+    def elapsed(self) -> float:
+        if not self.started:
+            return 0.0
+        return (self.stopped or time.monotonic()) - self.started
+
+    def get_stats(self):
+        elapsed = self.elapsed
+        return {
+            "state": self.state,
+            "ops": self.ops,
+            "bytes": self.bytes,
+            "errors": self.errors,
+            "lost": self.lost,
+            "ops_per_s": self.ops / elapsed if elapsed else 0.0,
+            "bytes_per_s": self.bytes / elapsed if elapsed else 0.0,
+            "latency_ns": self.latency.as_dict(),
+        }
+
+    def start(self, chrc_path: str):
+        self.chrc_path = chrc_path
+        self.chrc = dbus.Interface(
+            self.gen.bus.get_object(BLUEZ_SERVICE_NAME, chrc_path, introspect=False),
+            GATT_CHRC_IFACE,
+        )
+        self.state = "running"
+        self.started = time.monotonic()
+        # completions check the duration too, but there may be none, eg.
+        # when every notification in flight got lost
+        self._duration_timer = GLib.timeout_add(
+            int(self.gen.duration * 1000), self._on_duration
+        )
+        if self.gen.workload == "notify":
+            self._expire_timer = GLib.timeout_add(
+                int(self.gen.op_timeout * 500), self._expire
+            )
+            self.chrc.StartNotify(
+                reply_handler=self._fill, error_handler=self._on_fatal_error
+            )
+        else:
+            self._fill()
+
+    def _on_duration(self):
+        self._duration_timer = None
+        if self.state == "running":
+            self._stop()
+        return False
+
+    def _expire(self):
+        """Give up on notifications older than the generator's op_timeout"""
+        deadline = time.monotonic_ns() - int(self.gen.op_timeout * 1e9)
+        sent = self._sent
+        while sent and sent[0] < deadline:
+            sent.popleft()
+            self.lost += 1
+            self.outstanding -= 1
+        self._fill()
+        if self.state == "stopping" and not self.outstanding:
+            self._finish()
+        return True
+
+    def _cancel_timers(self):
+        if self._duration_timer is not None:
+            GLib.source_remove(self._duration_timer)
+            self._duration_timer = None
+        if self._expire_timer is not None:
+            GLib.source_remove(self._expire_timer)
+            self._expire_timer = None
+
+    def _fill(self):
+        while self.state == "running" and self.outstanding < self.gen.depth:
+            if time.monotonic() - self.started >= self.gen.duration:
+                self._stop()
+                break
+            self._issue()
+
+    def _issue(self):
+        self.outstanding += 1
+        sent = time.monotonic_ns()
+        workload = self.gen.workload
+        if workload == "read":
+            self.chrc.ReadValue(
+                _NO_OPTIONS,
+                reply_handler=functools.partial(self._on_read, sent),
+                error_handler=self._on_error,
+            )
+        elif workload == "write":
+            self.chrc.WriteValue(
+                self.gen.payload,
+                _NO_OPTIONS,
+                reply_handler=functools.partial(self._on_written, sent),
+                error_handler=self._on_error,
+            )
+        else:
+            self._sent.append(sent)
+            self.chrc.WriteValue(
+                self.gen.payload,
+                _COMMAND,
+                reply_handler=_ignore,
+                error_handler=self._on_error,
+            )
+
+    def _done(self, sent: int, size: int):
+        self.latency.add(time.monotonic_ns() - sent)
+        self.ops += 1
+        self.bytes += size
+        self.outstanding -= 1
+        self._fill()
+        if self.state == "stopping" and not self.outstanding:
+            self._finish()
+
+    def _on_read(self, sent: int, value):
+        self._done(sent, len(value))
+
+    def _on_written(self, sent: int):
+        self._done(sent, len(self.gen.payload))
+
+    def on_notification(self, value):
+        if self._sent:
+            self._done(self._sent.popleft(), len(value))
+
+    def _on_error(self, error):
+        self.errors += 1
+        logger.debug(f"{self.path}: {error}")
+        if self._sent:
+            self._sent.popleft()
+        self.outstanding -= 1
+        if self.errors >= self.gen.max_errors:
+            self._on_fatal_error(error)
+            return
+        self._fill()
+        if self.state == "stopping" and not self.outstanding:
+            self._finish()
+
+    def _on_fatal_error(self, error):
+        logger.error(f"{self.path}: {error}")
+        self.state = "failed"
+        self.stopped = self.stopped or time.monotonic()
+        self._cancel_timers()
+        self.gen.device_finished(self)
+
+    def _stop(self):
+        self.state = "stopping"
+        self.stopped = time.monotonic()
+        if not self.outstanding:
+            self._finish()
+
+    def _finish(self):
+        self.state = "done"
+        self._cancel_timers()
+        if self.gen.workload == "notify":
+            self.chrc.StopNotify(reply_handler=_ignore, error_handler=_ignore)
+        self.gen.device_finished(self)
+
+
+def _ignore(*_):
+    pass
+
+
+class LoadGenerator:
+    """
+    Connects to up to ``devices`` peripherals advertising the echoez service
+    on ``adapter`` (eg. "hci0", default: the first adapter) and runs
+    ``workload`` (one of ``WORKLOADS``) against each for ``duration`` seconds,
+    keeping ``depth`` operations in flight per device.
+
+    Everything, from discovery to the workloads, runs on the GLib main loop
+    with asynchronous calls, so one process can drive dozens of devices.
+    Devices found within ``discovery_timeout`` seconds are used, if their
+    services resolve within ``connect_timeout``. A device is given up on
+    after ``max_errors`` failed operations. Notifications not received
+    within ``op_timeout`` seconds are counted as lost.
+    """
+
+    def __init__(
+        self,
+        bus,
+        adapter: str = None,
+        devices: int = 1,
+        workload: str = "write",
+        payload_size: int = 20,
+        depth: int = 1,
+        duration: float = 10.0,
+        discovery_timeout: float = 30.0,
+        connect_timeout: float = 30.0,
+        max_errors: int = 100,
+        op_timeout: float = 5.0,
+    ):
+        if workload not in WORKLOADS:
+            raise ValueError(f"workload must be one of {', '.join(WORKLOADS)}")
+        self.bus = bus
+        self.adapter = adapter
+        self.devices = devices
+        self.workload = workload
+        # encoded once and sent by every write
+        self.payload = dbus.ByteArray(bytes(i & 0xFF for i in range(payload_size)))
+        self.depth = depth
+        self.duration = duration
+        self.discovery_timeout = discovery_timeout
+        self.connect_timeout = connect_timeout
+        self.max_errors = max_errors
+        self.op_timeout = op_timeout
+        self.target_uuid = (
+            LatencyProbeCharacteristic.PROBE_CHRC_UUID
+            if workload == "notify"
+            else EchoCharacteristic.TEST_CHRC_UUID
+        )
+        self.loop = GLib.MainLoop()
+        self.loads: Dict[str, DeviceLoad] = {}
+        self._chrcs: Dict[str, str] = {}
+        self._adapter_path = None
+        self._discovering = False
+        self._started = 0.0
+
+    def run(self) -> Dict:
+        """Run the workload until every device is done, returning
+        :meth:`get_stats`"""
+        self._started = time.monotonic()
+        self.bus.add_signal_receiver(
+            self._on_interfaces_added,
+            signal_name="InterfacesAdded",
+            dbus_interface=DBUS_OM_IFACE,
+            bus_name=BLUEZ_SERVICE_NAME,
+        )
+        self.bus.add_signal_receiver(
+            self._on_properties_changed,
+            signal_name="PropertiesChanged",
+            dbus_interface=DBUS_PROP_IFACE,
+            bus_name=BLUEZ_SERVICE_NAME,
+            path_keyword="path",
+        )
+        self._proxy("/", DBUS_OM_IFACE).GetManagedObjects(
+            reply_handler=self._on_managed_objects, error_handler=self._on_fatal_error
+        )
+        GLib.timeout_add(int(self.discovery_timeout * 1000), self._on_discovery_timeout)
+        try:
+            self.loop.run()
+        except KeyboardInterrupt:
+            logger.info("quitting")
+        self._cleanup()
+        return self.get_stats()
+
+    def get_stats(self) -> Dict:
+        total = Histogram()
+        ops = 0
+        size = 0
+        errors = 0
+        started = []
+        stopped = []
+        for device in self.loads.values():
+            total.merge(device.latency)
+            ops += device.ops
+            size += device.bytes
+            errors += device.errors
+            if device.started:
+                started.append(device.started)
+                stopped.append(device.stopped or time.monotonic())
+        elapsed = max(stopped) - min(started) if started else 0.0
+        return {
+            "devices": {path: d.get_stats() for path, d in self.loads.items()},
+            "total": {
+                "devices": len(started),
+                "ops": ops,
+                "bytes": size,
+                "errors": errors,
+                "ops_per_s": ops / elapsed if elapsed else 0.0,
+                "bytes_per_s": size / elapsed if elapsed else 0.0,
+                "latency_ns": total.as_dict(),
+            },
+        }
+
+    def device_finished(self, load: DeviceLoad):
+        self._proxy(load.path, DEVICE_IFACE).Disconnect(
+            reply_handler=_ignore, error_handler=_ignore
+        )
+        self._check_done()
+
+    def _proxy(self, path: str, interface: str) -> dbus.Interface:
+        return dbus.Interface(
+            self.bus.get_object(BLUEZ_SERVICE_NAME, path, introspect=False),
+            interface,
+        )
+
+    def _on_managed_objects(self, objects):
+        for path, interfaces in objects.items():
+            if ADAPTER_IFACE in interfaces and self._adapter_path is None:
+                if self.adapter is None or path.rsplit("/", 1)[-1] == self.adapter:
+                    self._adapter_path = path
+        if self._adapter_path is None:
+            self._on_fatal_error(f"adapter {self.adapter or ''} not found")
+            return
+        for path, interfaces in objects.items():
+            self._on_interfaces_added(path, interfaces)
+        adapter = self._proxy(self._adapter_path, ADAPTER_IFACE)
+        adapter.SetDiscoveryFilter(
+            {
+                "UUIDs": dbus.Array([EchoService.ECHO_SVC_UUID], signature="s"),
+                "Transport": "le",
+            },
+            reply_handler=_ignore,
+            error_handler=_ignore,
+        )
+        adapter.StartDiscovery(
+            reply_handler=self._on_discovering, error_handler=self._on_fatal_error
+        )
+
+    def _on_discovering(self):
+        self._discovering = True
+        logger.info(f"Discovering echoez devices on {self._adapter_path}")
+
+    def _on_interfaces_added(self, path, interfaces):
+        if GATT_CHRC_IFACE in interfaces:
+            uuid = interfaces[GATT_CHRC_IFACE].get("UUID", "")
+            self._chrcs[path] = str(uuid).lower()
+        if DEVICE_IFACE in interfaces:
+            self._on_device(path, interfaces[DEVICE_IFACE])
+
+    def _on_properties_changed(self, interface, changed, invalidated, path=None):
+        if interface == DEVICE_IFACE:
+            self._on_device(path, changed)
+        elif interface == GATT_CHRC_IFACE and "Value" in changed:
+            load = self.loads.get(path.rsplit("/", 2)[0])
+            if load is not None and load.chrc_path == path:
+                load.on_notification(changed["Value"])
+
+    def _on_device(self, path: str, props):
+        if self._adapter_path is None or not path.startswith(self._adapter_path + "/"):
+            return
+        load = self.loads.get(path)
+        if load is None:
+            uuids = [str(u).lower() for u in props.get("UUIDs", ())]
+            if EchoService.ECHO_SVC_UUID not in uuids:
+                return
+            if len(self.loads) >= self.devices or not self._accepting:
+                return
+            load = self.loads[path] = DeviceLoad(self, path)
+            load.state = "connecting"
+            logger.info(f"{path}: connecting")
+            self._proxy(path, DEVICE_IFACE).Connect(
+                reply_handler=_ignore,
+                error_handler=functools.partial(self._on_connect_error, load),
+            )
+            GLib.timeout_add(
+                int(self.connect_timeout * 1000), self._on_connect_timeout, load
+            )
+        if load.state == "connecting" and props.get("ServicesResolved"):
+            self._on_resolved(load)
+
+    @property
+    def _accepting(self) -> bool:
+        return time.monotonic() - self._started < self.discovery_timeout
+
+    def _on_connect_error(self, load: DeviceLoad, error):
+        # eg. AlreadyConnected for a device that is already running
+        if load.state != "connecting":
+            return
+        load.state = "failed"
+        logger.error(f"{load.path}: connect failed: {error}")
+        self._check_done()
+
+    def _on_connect_timeout(self, load: DeviceLoad):
+        if load.state == "connecting":
+            load.state = "failed"
+            logger.error(f"{load.path}: services not resolved, giving up")
+            self.device_finished(load)
+        return False
+
+    def _on_resolved(self, load: DeviceLoad):
+        prefix = load.path + "/"
+        for path, uuid in self._chrcs.items():
+            if path.startswith(prefix) and uuid == self.target_uuid:
+                logger.info(f"{load.path}: running {self.workload} on {path}")
+                load.start(path)
+                return
+        load.state = "failed"
+        logger.error(f"{load.path}: no {self.target_uuid} characteristic")
+        self._check_done()
+
+    def _on_discovery_timeout(self):
+        if not self.loads:
+            logger.error("No echoez devices found")
+        self._stop_discovery()
+        self._check_done()
+        return False
+
+    def _stop_discovery(self):
+        if self._discovering:
+            self._discovering = False
+            self._proxy(self._adapter_path, ADAPTER_IFACE).StopDiscovery(
+                reply_handler=_ignore, error_handler=_ignore
+            )
+
+    def _check_done(self):
+        if len(self.loads) >= self.devices:
+            self._stop_discovery()
+        elif self._accepting:
+            # still looking for devices
+            return
+        if all(d.state in ("done", "failed") for d in self.loads.values()):
+            self.loop.quit()
+
+    def _on_fatal_error(self, error):
+        logger.error(f"Load generator failed: {error}")
+        self.loop.quit()
+
+    def _cleanup(self):
+        self._stop_discovery()
+        for load in self.loads.values():
+            if load.state not in ("done", "failed", "discovered"):
+                self._proxy(load.path, DEVICE_IFACE).Disconnect(
+                    reply_handler=_ignore, error_handler=_ignore
+                )
+
+
+def load(
+    address: str = None,
+    adapter: str = None,
+    devices: int = 1,
+    workload: str = "write",
+    payload_size: int = 20,
+    depth: int = 1,
+    duration: float = 10.0,
+    discovery_timeout: float = 30.0,
+) -> int:
+    """Run a LoadGenerator and log per-device and total results
+
+    Args:
+        address (str): of the bus BlueZ is on, default: the system bus
+        adapter (str): to use (eg. hci0), default: first found
+        devices (int): number of echoez devices to drive concurrently
+        workload (str): one of WORKLOADS
+        payload_size (int): bytes per write
+        depth (int): operations in flight per device
+        duration (float): seconds to run the workload on each device
+        discovery_timeout (float): seconds to look for devices
+    """
+    dbus.mainloop.glib.DBusGMainLoop(set_as_default=True)
+
+    bus = dbus.bus.BusConnection(address) if address else dbus.SystemBus()
+    gen = LoadGenerator(
+        bus,
+        adapter=adapter,
+        devices=devices,
+        workload=workload,
+        payload_size=payload_size,
+        depth=depth,
+        duration=duration,
+        discovery_timeout=discovery_timeout,
+    )
+    stats = gen.run()
+    for path, device in stats["devices"].items():
+        logger.info(f"{path}: {device}")
+    logger.info(f"total: {stats['total']}")
+
+    return 0 if stats["total"]["devices"] else -1
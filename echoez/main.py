@@ -6,21 +6,47 @@
 
 import logging
 import functools
+import time
+
+from typing import (
+    Dict,
+    List,
+    Optional,
+    Sequence,
+)
 
 import dbus
 import dbus.mainloop.glib
 
 from echoez.config import *
+from echoez.aggregate import BatchWriter, WriteAggregator
 from echoez.app import App
+from echoez.characteristic import (
+    BroadcastCharacteristic,
+    IntegrityEchoCharacteristic,
+    L2capPsmCharacteristic,
+)
+from echoez.service import EchoService
 from echoez.advertisement import EchoAdvertisement
-from echoez.agent import Agent
+from echoez.agent import Agent, DeviceTrust
+from echoez.handoff import HandoffClient, HandoffServer
+from echoez.l2cap import EchoEngine, l2cap_listener
+from echoez.offload import Offloader
+from echoez.policy import PairingPolicy
+from echoez.profiling import Profiler
+from echoez.ratelimit import RateLimiter
+from echoez.record import Recorder
+from echoez.stall import StallMonitor
+from echoez.store import Store
+from echoez.synthetic import SyntheticService
+from echoez.trace import Tracer
 
 try:
     from gi.repository import GLib  # pyright: reportMissingImports=false
 except ImportError:
     import gobject as GLib  # pyright: reportMissingImports=false
 
-__all__ = ["start"]
+__all__ = ["build_app", "find_adapters", "start"]
 
 logger = logging.getLogger(__name__)
 
@@ -29,59 +55,335 @@ def on_register_success(thing: str):
     logger.info(f"GATT {thing} registered")
 
 
-def find_adapter(bus):
+def find_adapters(bus) -> List[str]:
+    """Object paths of all adapters with a GattManager1 interface"""
     remote_om = dbus.Interface(bus.get_object(BLUEZ_SERVICE_NAME, "/"), DBUS_OM_IFACE)
     objects = remote_om.GetManagedObjects()
 
-    for o, props in objects.items():
-        if GATT_MANAGER_IFACE in props.keys():
+    return sorted(o for o, props in objects.items() if GATT_MANAGER_IFACE in props)
+
+
+def find_adapter(bus, adapter: str = None):
+    """Object path of ``adapter`` (eg. "hci0"), or the first adapter if None"""
+    for o in find_adapters(bus):
+        if adapter is None or o.rsplit("/", 1)[-1] == adapter or o == adapter:
             return o
 
     return None
 
 
-def start(name: str) -> int:
+def build_app(
+    bus,
+    name: str,
+    broadcast: bool = False,
+    l2cap_psm: Optional[int] = None,
+    integrity: str = None,
+    synthetic: int = 0,
+    synthetic_characteristics: int = 1000,
+    synthetic_descriptors: int = 1,
+) -> App:
+    """App with the optional characteristics and services enabled, at the
+    same paths on every run, so recordings can be replayed against it. See
+    :func:`start` for the arguments. ``l2cap_psm`` is only advertised, the
+    listener is up to the caller."""
+    app = App(bus, name)
+    echo_service = app.find_by_uuid(EchoService.ECHO_SVC_UUID)[0]
+    if broadcast:
+        app.add_characteristic(
+            echo_service, BroadcastCharacteristic(bus, 4, echo_service)
+        )
+    if l2cap_psm is not None:
+        app.add_characteristic(
+            echo_service, L2capPsmCharacteristic(bus, 5, echo_service, l2cap_psm)
+        )
+    if integrity is not None:
+        app.add_characteristic(
+            echo_service,
+            IntegrityEchoCharacteristic(bus, 6, echo_service, checksum=integrity),
+        )
+    for i in range(synthetic):
+        app.add_service(
+            SyntheticService(
+                bus, 10 + i, synthetic_characteristics, synthetic_descriptors
+            )
+        )
+    return app
+
+
+def start(
+    name: str,
+    record: str = None,
+    state_file: str = None,
+    adapter: str = None,
+    stats_conn=None,
+    stats_interval: int = 5,
+    offload: Sequence[str] = (),
+    offload_workers: int = 4,
+    offload_queue: int = 64,
+    aggregate: Sequence[str] = (),
+    aggregate_to: str = None,
+    rate_limit: Dict[str, float] = None,
+    allow: Sequence[str] = (),
+    allow_oui: Sequence[str] = (),
+    auto_accept: Sequence[str] = (),
+    pin_code: str = None,
+    passkey: int = None,
+    trust: Sequence[str] = (),
+    broadcast: bool = False,
+    l2cap_psm: Optional[int] = None,
+    integrity: str = None,
+    synthetic: int = 0,
+    synthetic_characteristics: int = 1000,
+    synthetic_descriptors: int = 1,
+    profile_dir: str = None,
+    profiler: str = "cprofile",
+    sample_interval: float = 0.005,
+    tracemalloc_frames: int = 0,
+    trace_slow_ms: Optional[float] = None,
+    stall_threshold_ms: Optional[float] = None,
+    handoff: str = None,
+    fast_restart: bool = False,
+    secondary_channel: str = None,
+) -> int:
     """Start Echoez service
 
     Args:
         name (str): to advertise to clients
+        record (str): optional file to record GATT traffic to
+        state_file (str): optional file to persist attribute values in
+        adapter (str): to use (eg. "hci0"), the first one found if None
+        stats_conn (multiprocessing.connection.Connection): optional pipe to
+            send ``("stats", App.get_stats())`` to every ``stats_interval``
+            seconds, used by echoez.supervisor
+        offload (list): UUIDs of characteristics whose handlers run on a
+            thread pool instead of the main loop
+        offload_workers (int): threads in that pool
+        offload_queue (int): max operations in flight before rejecting more
+        aggregate (list): UUIDs of characteristics whose written values are
+            appended to ``aggregate_to`` in batches
+        aggregate_to (str): file to append batched writes to
+        rate_limit (dict): echoez.ratelimit.RateLimiter rates by argument
+            name (eg. {"write_rate": 20}). Over-limit calls are rejected.
+        allow (list): device addresses to accept pairing requests from
+        allow_oui (list): OUIs (eg. "AA:BB:CC") to accept pairing requests from
+        auto_accept (list): agent request kinds (see echoez.policy.REQUESTS)
+            to accept from any device
+        pin_code (str): to answer RequestPinCode with, rejected if None
+        passkey (int): to answer RequestPasskey with, rejected if None
+        trust (list): addresses of known devices to mark Trusted at startup
+        broadcast (bool): add a characteristic notifying every value written
+            to it to all subscribed devices
+        l2cap_psm (int): also echo over an L2CAP CoC on this PSM, 0 for a
+            dynamic one, advertised in a characteristic. None disables.
+        integrity (str): add an integrity-checked echo characteristic using
+            this echoez.integrity checksum (eg. "crc32"). None disables.
+        synthetic (int): number of echoez.synthetic services to add, to
+            emulate large devices
+        synthetic_characteristics (int): per synthetic service
+        synthetic_descriptors (int): per synthetic characteristic
+        profile_dir (str): enables runtime profiling, dumps go here. SIGUSR1
+            or com.mdegans.Echoez1.Start/StopProfiling toggle the profiler,
+            SIGUSR2 or SnapshotMemory dump a tracemalloc snapshot.
+        profiler (str): "cprofile" or "sample"
+        sample_interval (float): seconds between samples of the sampler
+        tracemalloc_frames (int): frames per tracemalloc traceback, 0 disables
+        trace_slow_ms (float): log D-Bus method calls slower than this, with
+            their sender, object path and payload size. None disables.
+        stall_threshold_ms (float): measure main loop lag, and log the
+            stack of the main loop while it's stuck for longer than this.
+            None disables.
+        handoff (str): Unix socket to take over from the echoez listening on
+            it, if any, and then to listen on to hand off to the next one.
+            The adapter then stays powered across restarts.
+        fast_restart (bool): leave the adapter powered on exit, and at
+            startup only power it if it's off, so restarts don't reset
+            links. A previous run's registrations need no cleanup: BlueZ
+            drops them when its bus connection goes away.
+        secondary_channel (str): advertise with extended advertising on this
+            PHY ("1M", "2M" or "Coded") if the adapter supports it, so the
+            whole advertisement, and echo service data with the L2CAP PSM,
+            fits in one packet. None for legacy.
     """
+    started = time.monotonic()
     dbus.mainloop.glib.DBusGMainLoop(set_as_default=True)
 
     bus = dbus.SystemBus()
-    app = App(bus, name)
+    # before anything that would need cleaning up
+    adapter_path = find_adapter(bus, adapter)
+    if not adapter_path:
+        logger.error(
+            f"Could not find {GATT_MANAGER_IFACE} on {adapter or 'any adapter'}"
+        )
+        return -1
+    engine = psm = None
+    if l2cap_psm is not None:
+        try:
+            engine = EchoEngine(l2cap_listener(l2cap_psm))
+        except (OSError, AttributeError) as e:
+            # AttributeError: Python built without Bluetooth sockets
+            logger.error(f"Could not listen on L2CAP PSM {l2cap_psm}: {e}")
+        else:
+            psm = engine.listener.getsockname()[1]
+    app = build_app(
+        bus,
+        name,
+        broadcast=broadcast,
+        l2cap_psm=psm,
+        integrity=integrity,
+        synthetic=synthetic,
+        synthetic_characteristics=synthetic_characteristics,
+        synthetic_descriptors=synthetic_descriptors,
+    )
+    if engine is not None:
+        app.l2cap = engine
+        GLib.io_add_watch(
+            engine.fileno(),
+            GLib.PRIORITY_DEFAULT,
+            GLib.IO_IN,
+            lambda *_: engine.poll(0) >= 0,
+        )
+        logger.info(f"L2CAP echo listening on PSM {psm:#x}")
+    if profile_dir:
+        app.profiler = Profiler(
+            profile_dir,
+            name=name,
+            mode=profiler,
+            sample_interval=sample_interval,
+            tracemalloc_frames=tracemalloc_frames,
+        )
+        app.profiler.install_signal_handlers()
+        logger.info(f"Profiling enabled, SIGUSR1 toggles, dumps go to {profile_dir}")
+    if trace_slow_ms is not None:
+        app.tracer = Tracer(trace_slow_ms)
+        app.tracer.enable()
+    if stall_threshold_ms is not None:
+        app.stall_monitor = StallMonitor(threshold_ms=stall_threshold_ms)
     loop = GLib.MainLoop()
     advertisement = EchoAdvertisement(bus, 0)
-    agent = Agent(bus, name=name, loop=loop)
+    policy = PairingPolicy(
+        allow=allow,
+        allow_oui=allow_oui,
+        auto_accept=auto_accept,
+        pin_code=pin_code,
+        passkey=passkey,
+    )
+    device_trust = DeviceTrust(bus)
+    agent = Agent(bus, name=name, loop=loop, policy=policy, trust=device_trust)
+    recorder = None
+    if record:
+        recorder = Recorder(record)
+        app.attach_recorder(recorder)
+        logger.info(f"Recording GATT traffic to {record}")
+    offloader = None
+    if offload:
+        dbus.mainloop.glib.threads_init()
+        offloader = Offloader(max_workers=offload_workers, max_pending=offload_queue)
+        app.attach_offloader(offloader, offload)
+    aggregator = None
+    if aggregate:
+        batch_writer = BatchWriter(aggregate_to)
+        aggregator = WriteAggregator(batch_writer)
+        app.attach_aggregator(aggregator, aggregate)
+        logger.info(f"Appending batched writes to {aggregate_to}")
+    if rate_limit:
+        app.attach_limiter(RateLimiter(**rate_limit))
+    store = None
+    if state_file:
+        store = Store(state_file)
+        app.attach_store(store)
+        logger.info(f"Persisting attribute values in {state_file}")
+    handoff_client = None
+    if handoff:
+        try:
+            handoff_client = HandoffClient.connect(handoff)
+            if handoff_client is not None:
+                app.restore_state(handoff_client.receive_state())
+                logger.info("Took over state from the running echoez")
+        except (OSError, ValueError) as e:
+            logger.error(f"Handoff failed, starting afresh: {e}")
+            handoff_client = None
 
-    gatt_obj = bus.get_object(BLUEZ_SERVICE_NAME, find_adapter(bus))
-    if not gatt_obj:
-        logger.error(f"Could not find {GATT_MANAGER_IFACE}")
-        return -1
+    gatt_obj = bus.get_object(BLUEZ_SERVICE_NAME, adapter_path)
     bluez_obj = bus.get_object(BLUEZ_SERVICE_NAME, "/org/bluez")
     if not bluez_obj:
         logger.error("Could not get /org/bluez")
 
     adapter_props = dbus.Interface(gatt_obj, "org.freedesktop.DBus.Properties")
 
-    # powered property on the controller to on
-    adapter_props.Set("org.bluez.Adapter1", "Powered", dbus.Boolean(1))
+    if trust:
+        logger.info(f"Marking {len(trust)} known devices trusted")
+        device_trust.trust_all(adapter_path, trust)
+
+    # powered property on the controller to on, unless fast_restart and it
+    # already is
+    if not fast_restart or not adapter_props.Get(ADAPTER_IFACE, "Powered"):
+        adapter_props.Set(ADAPTER_IFACE, "Powered", dbus.Boolean(1))
 
     # Get manager objects
     service_manager = dbus.Interface(gatt_obj, GATT_MANAGER_IFACE)
     ad_manager = dbus.Interface(gatt_obj, LE_ADVERTISING_MANAGER_IFACE)
     agent_manager = dbus.Interface(bluez_obj, AGENT_MANAGER_INTERFACE)
 
+    if secondary_channel is not None:
+        advertisement.use_extended(secondary_channel)
+        if advertisement.fit_to_adapter(
+            adapter_props.GetAll(LE_ADVERTISING_MANAGER_IFACE)
+        ):
+            advertisement.add_extended_data(
+                app.l2cap.listener.getsockname()[1] if app.l2cap else 0
+            )
+
+    registering = {"application", "advertisement"}
+    handoff_server = None
+    handed_off = False
+
+    def on_registered(thing: str):
+        nonlocal handoff_client, handoff_server
+        on_register_success(thing)
+        registering.discard(thing)
+        if registering:
+            return
+        app.time_to_ready = time.monotonic() - started
+        logger.info(f"Ready in {app.time_to_ready * 1000:.0f} ms")
+        if not handoff:
+            return
+        if handoff_client is not None:
+            # both of us are registered, the old one can go
+            try:
+                app.restore_state(handoff_client.release())
+            except (OSError, ValueError) as e:
+                logger.error(f"Handoff release failed: {e}")
+            handoff_client = None
+        try:
+            handoff_server = HandoffServer(handoff, app.get_state, release)
+        except OSError as e:
+            logger.error(f"Not listening for handoffs on {handoff}: {e}")
+
+    def release():
+        nonlocal handed_off
+        handed_off = True
+        for unregister, path in (
+            (ad_manager.UnregisterAdvertisement, advertisement.get_path()),
+            (service_manager.UnregisterApplication, app.get_path()),
+        ):
+            try:
+                unregister(path)
+            except dbus.DBusException as e:
+                logger.warning(f"{e.get_dbus_message()}")
+        loop.quit()
+
     def on_register_failure(thing: str, error: GLib.Error):
         """error cb"""
         logger.error(f"Failed to register {thing} because: {str(error)}\n")
         loop.quit()
 
     logger.info("Registering GATT application...")
+    # BlueZ tracks the tree through ObjectManager signals from here on
+    app.registered = True
     service_manager.RegisterApplication(
         app.get_path(),
         {},
-        reply_handler=functools.partial(on_register_success, "application"),
+        reply_handler=functools.partial(on_registered, "application"),
         error_handler=functools.partial(on_register_failure, "application"),
     )
 
@@ -89,24 +391,62 @@ def start(name: str) -> int:
     ad_manager.RegisterAdvertisement(
         advertisement.get_path(),
         {},
-        reply_handler=functools.partial(on_register_success, "advertisement"),
+        reply_handler=functools.partial(on_registered, "advertisement"),
         error_handler=functools.partial(on_register_failure, "advertisement"),
     )
 
     agent_manager.RegisterAgent(agent.path, "NoInputNoOutput")
     agent_manager.RequestDefaultAgent(agent.path)
 
+    if stats_conn is not None:
+
+        def send_stats():
+            try:
+                stats_conn.send(("stats", app.get_stats()))
+            except OSError:
+                logger.error("Lost connection to supervisor, quitting")
+                loop.quit()
+                return False
+            return True
+
+        send_stats()
+        GLib.timeout_add_seconds(stats_interval, send_stats)
+
+    if app.stall_monitor:
+        app.stall_monitor.start()
     try:
         loop.run()
     except KeyboardInterrupt:
         logger.info("quitting")
         loop.quit()
-    try:
-        ad_manager.UnregisterAdvertisement(advertisement)
-        logger.info("Advertisement unregistered")
-    except Exception as e:
-        pass
+    if handoff_server:
+        handoff_server.close()
+    if not handed_off:
+        try:
+            ad_manager.UnregisterAdvertisement(advertisement)
+            logger.info("Advertisement unregistered")
+        except Exception as e:
+            pass
+
+        if not fast_restart:
+            adapter_props.Set(ADAPTER_IFACE, "Powered", dbus.Boolean(0))
 
-    adapter_props.Set("org.bluez.Adapter1", "Powered", dbus.Boolean(0))
+    if app.profiler:
+        app.profiler.stop()
+    if app.tracer:
+        app.tracer.disable()
+    if app.stall_monitor:
+        app.stall_monitor.stop()
+    if app.l2cap:
+        app.l2cap.close()
+    if offloader:
+        offloader.shutdown()
+    if aggregator:
+        aggregator.close()
+        batch_writer.close()
+    if recorder:
+        recorder.close()
+    if store:
+        store.close()
 
     return 0
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: LGPL-2.1-or-later
+
+"""Run slow handlers off the GLib main loop and reply from it."""
+
+import concurrent.futures
+import logging
+
+from typing import (
+    Callable,
+    Optional,
+    Sequence,
+)
+
+from echoez.err import *
+
+try:
+    from gi.repository import GLib  # pyright: reportMissingImports=false
+except ImportError:
+    import gobject as GLib  # pyright: reportMissingImports=false
+
+__all__ = [
+    "Offloader",
+]
+
+logger = logging.getLogger(__name__)
+
+
+class Offloader:
+    """
+    Runs callables on an executor and hands the result to dbus-python
+    ``async_callbacks`` reply/error handlers back on the GLib main loop.
+
+    At most ``max_pending`` calls may be in flight; beyond that :meth:`submit`
+    raises FailedException so an overloaded pool fails fast instead of
+    queueing without bound.
+
+    Characteristic handlers mutate the characteristic, so they need the default
+    thread pool. A ProcessPoolExecutor may be passed in for picklable work.
+    """
+
+    def __init__(
+        self,
+        executor: Optional[concurrent.futures.Executor] = None,
+        max_workers: int = 4,
+        max_pending: int = 64,
+    ):
+        self.executor = executor or concurrent.futures.ThreadPoolExecutor(
+            max_workers, thread_name_prefix="echoez-offload"
+        )
+        self.max_pending = max_pending
+        self.pending = 0
+        self.submitted = 0
+        self.rejected = 0
+        self.failed = 0
+
+    def submit(
+        self,
+        fn: Callable,
+        args: Sequence,
+        reply_handler: Callable,
+        error_handler: Callable,
+    ):
+        """Call ``fn(*args)`` on the executor. Must be called from the main
+        loop, as are the handlers."""
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise FailedException("Too many pending operations")
+        future = self.executor.submit(fn, *args)
+        self.pending += 1
+        self.submitted += 1
+        future.add_done_callback(
+            lambda f: GLib.idle_add(self._deliver, f, reply_handler, error_handler)
+        )
+
+    def _deliver(self, future, reply_handler, error_handler):
+        self.pending -= 1
+        try:
+            result = future.result()
+        except Exception as e:
+            self.failed += 1
+            error_handler(e)
+        else:
+            reply_handler(result)
+        return False
+
+    def get_stats(self):
+        return {
+            "pending": self.pending,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "failed": self.failed,
+        }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
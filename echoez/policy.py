@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: LGPL-2.1-or-later
+
+"""Non-interactive pairing policy for echoez.agent.Agent."""
+
+import time
+
+from typing import (
+    Dict,
+    Iterable,
+    Optional,
+    Tuple,
+)
+
+__all__ = [
+    "AUTHORIZE_SERVICE",
+    "PIN_CODE",
+    "PASSKEY",
+    "CONFIRMATION",
+    "AUTHORIZATION",
+    "REQUESTS",
+    "PairingPolicy",
+    "device_address",
+]
+
+# the kinds of agent requests a rule can auto-accept
+AUTHORIZE_SERVICE = "authorize-service"
+PIN_CODE = "pin-code"
+PASSKEY = "passkey"
+CONFIRMATION = "confirmation"
+AUTHORIZATION = "authorization"
+REQUESTS = (AUTHORIZE_SERVICE, PIN_CODE, PASSKEY, CONFIRMATION, AUTHORIZATION)
+
+
+def device_address(device: str) -> str:
+    """ "/org/bluez/hci0/dev_AA_BB_CC_DD_EE_FF" -> "AA:BB:CC:DD:EE:FF" """
+    return device.rsplit("/", 1)[-1][len("dev_") :].replace("_", ":").upper()
+
+
+class PairingPolicy:
+    """
+    Answers agent requests immediately from configuration, never a prompt.
+
+    A request is accepted if the device address or its OUI (first three
+    octets) is allowlisted, or if its kind (one of ``REQUESTS``) is in
+    ``auto_accept``. Everything else is rejected. Decisions are cached per
+    (address, kind) for ``cache_ttl`` seconds so a pairing storm costs one
+    dict lookup per request.
+    """
+
+    def __init__(
+        self,
+        allow: Iterable[str] = (),
+        allow_oui: Iterable[str] = (),
+        auto_accept: Iterable[str] = (),
+        pin_code: Optional[str] = None,
+        passkey: Optional[int] = None,
+        cache_ttl: float = 300.0,
+        max_cache: int = 4096,
+    ):
+        self.allow = frozenset(a.upper().replace("-", ":") for a in allow)
+        self.allow_oui = frozenset(o.upper().replace("-", ":") for o in allow_oui)
+        self.auto_accept = frozenset(auto_accept)
+        unknown = self.auto_accept.difference(REQUESTS)
+        if unknown:
+            raise ValueError(f"Unknown request kinds: {', '.join(sorted(unknown))}")
+        self.pin_code = pin_code
+        self.passkey = passkey
+        self.cache_ttl = cache_ttl
+        self.max_cache = max_cache
+        self.accepted = 0
+        self.rejected = 0
+        self._cache: Dict[Tuple[str, str], Tuple[bool, float]] = {}
+
+    def decide(self, device: str, request: str) -> bool:
+        """Whether to accept ``request`` from ``device`` (an object path)"""
+        now = time.monotonic()
+        key = (device, request)
+        cached = self._cache.get(key)
+        if cached is not None and cached[1] > now:
+            decision = cached[0]
+        else:
+            address = device_address(device)
+            decision = (
+                address in self.allow
+                or address[:8] in self.allow_oui
+                or request in self.auto_accept
+            )
+            if len(self._cache) >= self.max_cache:
+                self._prune(now)
+            self._cache[key] = (decision, now + self.cache_ttl)
+        if decision:
+            self.accepted += 1
+        else:
+            self.rejected += 1
+        return decision
+
+    def _prune(self, now: float):
+        for key in [k for k, (_, expiry) in self._cache.items() if expiry <= now]:
+            del self._cache[key]
+        if len(self._cache) >= self.max_cache:
+            self._cache.clear()
+
+    def clear_cache(self):
+        self._cache.clear()
+
+    def get_stats(self):
+        return {"accepted": self.accepted, "rejected": self.rejected}
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: LGPL-2.1-or-later
+
+"""Profilers that can be switched on and off in a running service."""
+
+import collections
+import cProfile
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+
+from typing import (
+    Optional,
+)
+
+try:
+    from gi.repository import GLib  # pyright: reportMissingImports=false
+except ImportError:
+    import gobject as GLib  # pyright: reportMissingImports=false
+
+__all__ = [
+    "PROFILERS",
+    "Profiler",
+    "StackSampler",
+]
+
+logger = logging.getLogger(__name__)
+
+PROFILERS = ("cprofile", "sample")
+
+
+class StackSampler:
+    """
+    Statistical profiler. A background thread samples the stack of one thread
+    every ``interval`` seconds and counts identical stacks, which are written
+    in the "folded" format flame graph tools read. Unlike cProfile it doesn't
+    slow the profiled code down.
+    """
+
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="echoez-sampler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def dump(self, path: str):
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(
+                    f"{code.co_name} ({os.path.basename(code.co_filename)}"
+                    f":{code.co_firstlineno})"
+                )
+                frame = frame.f_back
+            if names:
+                self.stacks[";".join(reversed(names))] += 1
+
+
+class Profiler:
+    """
+    Runtime-toggled profiling of the main loop thread.
+
+    :meth:`toggle` starts or stops a cProfile or sampling profiler and
+    :meth:`snapshot_memory` dumps a tracemalloc snapshot (tracemalloc starts
+    with the Profiler if ``tracemalloc_frames`` is set). Dumps go to
+    ``directory`` as ``{name}-{pid}-{start time}-{n}.{prof,folded,tracemalloc}``
+    so runs and dumps never overwrite each other.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        name: str = "echoez",
+        mode: str = "cprofile",
+        sample_interval: float = 0.005,
+        tracemalloc_frames: int = 0,
+    ):
+        if mode not in PROFILERS:
+            raise ValueError(f"mode must be one of {', '.join(PROFILERS)}")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.mode = mode
+        self.sample_interval = sample_interval
+        self._prefix = f"{name}-{os.getpid()}-{time.strftime('%Y%m%dT%H%M%S')}"
+        self._seq = 0
+        self._thread_id = threading.get_ident()
+        self._active = None
+        if tracemalloc_frames:
+            tracemalloc.start(tracemalloc_frames)
+
+    @property
+    def running(self) -> bool:
+        return self._active is not None
+
+    def start(self):
+        if self._active is not None:
+            return
+        if self.mode == "cprofile":
+            self._active = cProfile.Profile()
+            self._active.enable()
+        else:
+            self._active = StackSampler(self._thread_id, self.sample_interval)
+            self._active.start()
+        logger.info(f"{self.mode} profiler started")
+
+    def stop(self) -> Optional[str]:
+        """Stop profiling, returning the path of the dump"""
+        if self._active is None:
+            return None
+        profiler, self._active = self._active, None
+        if self.mode == "cprofile":
+            profiler.disable()
+            path = self._next_path("prof")
+            profiler.dump_stats(path)
+        else:
+            profiler.stop()
+            path = self._next_path("folded")
+            profiler.dump(path)
+        logger.info(f"{self.mode} profile written to {path}")
+        return path
+
+    def toggle(self) -> Optional[str]:
+        if self._active is None:
+            self.start()
+            return None
+        return self.stop()
+
+    def snapshot_memory(self) -> Optional[str]:
+        """Dump a tracemalloc snapshot, returning its path"""
+        if not tracemalloc.is_tracing():
+            logger.warning("tracemalloc is not enabled, no snapshot taken")
+            return None
+        path = self._next_path("tracemalloc")
+        tracemalloc.take_snapshot().dump(path)
+        logger.info(f"tracemalloc snapshot written to {path}")
+        return path
+
+    def install_signal_handlers(self):
+        """SIGUSR1 toggles profiling, SIGUSR2 takes a memory snapshot. The
+        handlers run on the GLib main loop."""
+        GLib.unix_signal_add(GLib.PRIORITY_HIGH, signal.SIGUSR1, self._on_sigusr1)
+        GLib.unix_signal_add(GLib.PRIORITY_HIGH, signal.SIGUSR2, self._on_sigusr2)
+
+    def _on_sigusr1(self):
+        self.toggle()
+        return True
+
+    def _on_sigusr2(self):
+        self.snapshot_memory()
+        return True
+
+    def _next_path(self, ext: str) -> str:
+        self._seq += 1
+        return os.path.join(self.directory, f"{self._prefix}-{self._seq:03d}.{ext}")
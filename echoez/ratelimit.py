@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: LGPL-2.1-or-later
+
+"""Per-device and global rate limits on characteristic reads and writes."""
+
+import time
+
+from collections import OrderedDict
+from typing import (
+    Callable,
+    Dict,
+    Optional,
+)
+
+__all__ = [
+    "LIMITS",
+    "RateLimiter",
+    "TokenBucket",
+]
+
+# the RateLimiter arguments, in calls or bytes per second
+LIMITS = (
+    "read_rate",
+    "write_rate",
+    "byte_rate",
+    "read_byte_rate",
+    "global_read_rate",
+    "global_write_rate",
+    "global_byte_rate",
+    "global_read_byte_rate",
+)
+
+
+class TokenBucket:
+    """
+    ``rate`` tokens per second, holding at most ``capacity``. Taking more
+    than the capacity is allowed from a full bucket and leaves it in debt, so
+    a single large write can't be locked out forever.
+    """
+
+    __slots__ = ("rate", "capacity", "tokens", "stamp")
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.stamp = now
+
+    def ready(self, now: float, amount: float = 1) -> bool:
+        """Refill, then whether ``amount`` may be taken"""
+        tokens = self.tokens + (now - self.stamp) * self.rate
+        self.tokens = tokens if tokens < self.capacity else self.capacity
+        self.stamp = now
+        return self.tokens >= (amount if amount < self.capacity else self.capacity)
+
+    def take(self, amount: float = 1):
+        self.tokens -= amount
+
+
+class _Device:
+    __slots__ = (
+        "reads",
+        "writes",
+        "bytes",
+        "read_bytes",
+        "throttled_reads",
+        "throttled_writes",
+    )
+
+    def __init__(self, limiter: "RateLimiter", now: float):
+        self.reads = limiter._bucket(limiter.read_rate, now)
+        self.writes = limiter._bucket(limiter.write_rate, now)
+        self.bytes = limiter._bucket(limiter.byte_rate, now)
+        self.read_bytes = limiter._bucket(limiter.read_byte_rate, now)
+        self.throttled_reads = 0
+        self.throttled_writes = 0
+
+
+class RateLimiter:
+    """
+    Token bucket limits on reads/s, writes/s, written bytes/s and read
+    bytes/s, per device (the ``device`` option BlueZ passes) and over all
+    devices. A limit of None is unlimited. Buckets hold ``burst`` seconds
+    worth of tokens.
+
+    A call is admitted only if every bucket it draws from has the tokens, so
+    a rejected call costs nothing but the check. The size of a read is only
+    known once it's done, so reads are admitted while their byte buckets
+    aren't in debt, and charged by :meth:`charge_read` afterwards. Once more
+    than ``max_devices`` are tracked, the least recently seen device is
+    dropped.
+    """
+
+    def __init__(
+        self,
+        read_rate: Optional[float] = None,
+        write_rate: Optional[float] = None,
+        byte_rate: Optional[float] = None,
+        read_byte_rate: Optional[float] = None,
+        global_read_rate: Optional[float] = None,
+        global_write_rate: Optional[float] = None,
+        global_byte_rate: Optional[float] = None,
+        global_read_byte_rate: Optional[float] = None,
+        burst: float = 1.0,
+        max_devices: int = 4096,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.read_rate = read_rate
+        self.write_rate = write_rate
+        self.byte_rate = byte_rate
+        self.read_byte_rate = read_byte_rate
+        self.burst = burst
+        self.max_devices = max_devices
+        self.clock = clock
+        now = clock()
+        self.reads = self._bucket(global_read_rate, now)
+        self.writes = self._bucket(global_write_rate, now)
+        self.bytes = self._bucket(global_byte_rate, now)
+        self.read_bytes = self._bucket(global_read_byte_rate, now)
+        self.throttled_reads = 0
+        self.throttled_writes = 0
+        # least recently seen first
+        self._devices: Dict[str, _Device] = OrderedDict()
+
+    def _bucket(self, rate: Optional[float], now: float) -> Optional[TokenBucket]:
+        if rate is None:
+            return None
+        return TokenBucket(rate, max(rate * self.burst, 1.0), now)
+
+    def _device(self, device: str, now: float) -> _Device:
+        state = self._devices.get(device)
+        if state is None:
+            if len(self._devices) >= self.max_devices:
+                self._devices.popitem(last=False)
+            state = self._devices[device] = _Device(self, now)
+        else:
+            self._devices.move_to_end(device)
+        return state
+
+    def allow_read(self, device: str) -> bool:
+        now = self.clock()
+        state = self._device(device, now)
+        if all(
+            b is None or b.ready(now)
+            for b in (state.reads, state.read_bytes, self.reads, self.read_bytes)
+        ):
+            for b in (state.reads, self.reads):
+                if b is not None:
+                    b.take()
+            return True
+        state.throttled_reads += 1
+        self.throttled_reads += 1
+        return False
+
+    def charge_read(self, device: str, size: int):
+        """Take the ``size`` bytes of a read allowed by :meth:`allow_read`"""
+        state = self._devices.get(device)
+        buckets = (
+            (self.read_bytes,) if state is None else (state.read_bytes, self.read_bytes)
+        )
+        for b in buckets:
+            if b is not None:
+                b.take(size)
+
+    def allow_write(self, device: str, size: int) -> bool:
+        now = self.clock()
+        state = self._device(device, now)
+        if (
+            (state.writes is None or state.writes.ready(now))
+            and (state.bytes is None or state.bytes.ready(now, size))
+            and (self.writes is None or self.writes.ready(now))
+            and (self.bytes is None or self.bytes.ready(now, size))
+        ):
+            for b, amount in (
+                (state.writes, 1),
+                (state.bytes, size),
+                (self.writes, 1),
+                (self.bytes, size),
+            ):
+                if b is not None:
+                    b.take(amount)
+            return True
+        state.throttled_writes += 1
+        self.throttled_writes += 1
+        return False
+
+    def get_stats(self):
+        return {
+            "throttled_reads": self.throttled_reads,
+            "throttled_writes": self.throttled_writes,
+            "devices": {
+                device: {
+                    "throttled_reads": state.throttled_reads,
+                    "throttled_writes": state.throttled_writes,
+                }
+                for device, state in self._devices.items()
+                if state.throttled_reads or state.throttled_writes
+            },
+        }
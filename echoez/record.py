@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: LGPL-2.1-or-later
+
+"""
+Compact binary recording of GATT traffic.
+
+File layout is ``MAGIC`` followed by records, each a fixed ``RECORD`` header
+followed by the device path, characteristic path and JSON encoded options
+(utf-8) and the raw payload. Every time a :class:`Recorder` opens a file it
+appends a ``SESSION`` record carrying the wall clock time as a little-endian
+uint64 so replays can reset their timing baseline.
+"""
+
+import json
+import logging
+import mmap
+import queue
+import struct
+import threading
+import time
+
+from typing import (
+    Dict,
+    Iterator,
+    NamedTuple,
+    Optional,
+)
+
+__all__ = [
+    "SESSION",
+    "READ",
+    "WRITE",
+    "START_NOTIFY",
+    "STOP_NOTIFY",
+    "Record",
+    "Recorder",
+    "iter_records",
+    "open_records",
+]
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"ECHOEZ\x00\x01"
+# monotonic_ns, op, len(device), len(path), len(options), len(payload)
+RECORD = struct.Struct("<QBHHHI")
+WALL_CLOCK = struct.Struct("<Q")
+# longest device, path and options the H fields of RECORD hold
+MAX_FIELD = 0xFFFF
+
+SESSION = 0
+READ = 1
+WRITE = 2
+START_NOTIFY = 3
+STOP_NOTIFY = 4
+
+
+class Record(NamedTuple):
+    timestamp_ns: int
+    op: int
+    device: str
+    path: str
+    options: Dict[str, object]
+    payload: memoryview
+
+
+class Recorder:
+    """
+    Append-only GATT traffic recorder.
+
+    Records are packed on the calling thread and handed to a background thread
+    which does all the file I/O, so the GLib main loop never waits on disk. If
+    the writer falls more than ``max_pending`` records behind, new records are
+    dropped and counted instead of blocking. So are records whose device, path
+    or options don't fit the header (over ``MAX_FIELD`` bytes).
+    """
+
+    def __init__(self, path: str, max_pending: int = 65536):
+        self.path = path
+        self.dropped = 0
+        self.recorded = 0
+        self._queue = queue.Queue(max_pending)
+        self._file = open(path, "ab")
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+        self._thread = threading.Thread(
+            target=self._run, name="echoez-recorder", daemon=True
+        )
+        self._thread.start()
+        self.record(SESSION, payload=WALL_CLOCK.pack(time.time_ns()))
+
+    def record(
+        self,
+        op: int,
+        path: str = "",
+        device: str = "",
+        options: Optional[Dict[str, object]] = None,
+        payload: bytes = b"",
+    ):
+        device_b = device.encode()
+        path_b = path.encode()
+        options_b = (
+            json.dumps(options, separators=(",", ":"), default=str).encode()
+            if options
+            else b""
+        )
+        if max(len(device_b), len(path_b), len(options_b)) > MAX_FIELD:
+            logger.error(f"{path}: not recording a call with options too large")
+            self.dropped += 1
+            return
+        payload_b = bytes(payload)
+        try:
+            self._queue.put_nowait(
+                b"".join(
+                    (
+                        RECORD.pack(
+                            time.monotonic_ns(),
+                            op,
+                            len(device_b),
+                            len(path_b),
+                            len(options_b),
+                            len(payload_b),
+                        ),
+                        device_b,
+                        path_b,
+                        options_b,
+                        payload_b,
+                    )
+                )
+            )
+            self.recorded += 1
+        except queue.Full:
+            self.dropped += 1
+
+    def get_stats(self):
+        return {"recorded": self.recorded, "dropped": self.dropped}
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        self._file.close()
+        if self.dropped:
+            logger.warning(f"Recorder dropped {self.dropped} records")
+
+    def _run(self):
+        done = False
+        while not done:
+            batch = [self._queue.get()]
+            try:
+                while True:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            if None in batch:
+                done = True
+                batch = [b for b in batch if b is not None]
+            self._file.write(b"".join(batch))
+            self._file.flush()
+
+
+def iter_records(buf) -> Iterator[Record]:
+    """Iterate over the records in ``buf`` (bytes, mmap, ...) without copying
+    payloads"""
+    view = memoryview(buf)
+    if bytes(view[: len(MAGIC)]) != MAGIC:
+        raise ValueError("Not an echoez recording")
+    offset = len(MAGIC)
+    end = len(view)
+    while offset + RECORD.size <= end:
+        ts, op, dev_len, path_len, opt_len, payload_len = RECORD.unpack_from(
+            view, offset
+        )
+        offset += RECORD.size
+        if offset + dev_len + path_len + opt_len + payload_len > end:
+            logger.warning("Recording is truncated")
+            return
+        device = str(view[offset : offset + dev_len], "utf-8")
+        offset += dev_len
+        path = str(view[offset : offset + path_len], "utf-8")
+        offset += path_len
+        options = (
+            json.loads(str(view[offset : offset + opt_len], "utf-8")) if opt_len else {}
+        )
+        offset += opt_len
+        yield Record(ts, op, device, path, options, view[offset : offset + payload_len])
+        offset += payload_len
+
+
+def open_records(path: str) -> mmap.mmap:
+    """Map a recording read-only for use with :func:`iter_records`"""
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
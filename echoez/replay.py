@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: LGPL-2.1-or-later
+
+"""Replay GATT traffic captured by echoez.record against the object model."""
+
+import logging
+import time
+
+from typing import (
+    Optional,
+)
+
+import dbus
+import dbus.mainloop.glib
+
+from echoez.app import App
+from echoez.characteristic import Characteristic
+from echoez.main import build_app
+from echoez.record import (
+    SESSION,
+    READ,
+    WRITE,
+    START_NOTIFY,
+    STOP_NOTIFY,
+    iter_records,
+    open_records,
+)
+
+try:
+    from gi.repository import GLib  # pyright: reportMissingImports=false
+except ImportError:
+    import gobject as GLib  # pyright: reportMissingImports=false
+
+__all__ = [
+    "Replayer",
+    "replay",
+]
+
+logger = logging.getLogger(__name__)
+
+
+class Replayer:
+    """
+    Re-drives recorded calls against an App's characteristics on the GLib main
+    loop, preserving the recorded spacing divided by ``speed``. A ``speed`` of
+    0 replays as fast as possible. Calls that succeed count as ``replayed``,
+    calls that fail as ``errors``, and calls to paths the App doesn't have as
+    ``skipped``, with a warning for each of those paths.
+    """
+
+    BATCH = 64
+
+    def __init__(self, app: App, records, loop: GLib.MainLoop, speed: float = 1.0):
+        if speed < 0:
+            raise ValueError("speed must be >= 0")
+        self.app = app
+        self.loop = loop
+        self.speed = speed
+        self.replayed = 0
+        self.skipped = 0
+        self.errors = 0
+        self.unknown_paths = set()
+        self._records = iter(records)
+        # (recorded timestamp, local monotonic time) pair of the current session
+        self._origin = None
+        self._pending = None
+
+    def start(self):
+        GLib.idle_add(self._step)
+
+    def _step(self):
+        for n, record in enumerate(self._records, 1):
+            if record.op == SESSION:
+                self._origin = None
+                continue
+            if self.speed and self._origin is not None:
+                due = self._origin[1] + (
+                    (record.timestamp_ns - self._origin[0]) / self.speed
+                )
+                delay_ms = int((due - time.monotonic_ns()) // 1_000_000)
+                if delay_ms > 0:
+                    self._pending = record
+                    GLib.timeout_add(delay_ms, self._dispatch_pending)
+                    return False
+            elif self._origin is None:
+                self._origin = (record.timestamp_ns, time.monotonic_ns())
+            self._dispatch(record)
+            if n == self.BATCH:
+                # give the rest of the main loop a chance to run
+                return True
+        logger.info(
+            f"Replay done: {self.replayed} calls, "
+            f"{self.skipped} skipped, {self.errors} errors"
+        )
+        self.loop.quit()
+        return False
+
+    def _dispatch_pending(self):
+        self._dispatch(self._pending)
+        self._pending = None
+        GLib.idle_add(self._step)
+        return False
+
+    def _dispatch(self, record):
+        chrc = self.app.get_attribute(record.path)
+        if not isinstance(chrc, Characteristic):
+            if record.path not in self.unknown_paths:
+                self.unknown_paths.add(record.path)
+                logger.warning(
+                    f"No characteristic at {record.path}, skipping its calls. "
+                    "Was it recorded with other options?"
+                )
+            self.skipped += 1
+            return
+        options = dict(record.options)
+        if record.device:
+            options["device"] = dbus.ObjectPath(record.device)
+        try:
+            if record.op == READ:
+                chrc.ReadValue(options, self._on_reply, self._on_error)
+            elif record.op == WRITE:
+                chrc.WriteValue(
+                    dbus.Array((dbus.Byte(b) for b in record.payload), signature="y"),
+                    options,
+                    self._on_reply,
+                    self._on_error,
+                )
+            elif record.op == START_NOTIFY:
+                chrc.StartNotify()
+                self.replayed += 1
+            elif record.op == STOP_NOTIFY:
+                chrc.StopNotify()
+                self.replayed += 1
+            else:
+                self.skipped += 1
+        except dbus.exceptions.DBusException as e:
+            self._on_error(e)
+
+    def _on_reply(self, *_):
+        self.replayed += 1
+
+    def _on_error(self, error):
+        logger.debug(f"replayed call failed: {error}")
+        self.errors += 1
+
+
+def replay(
+    file: str,
+    name: str = "echoez",
+    speed: float = 1.0,
+    broadcast: bool = False,
+    l2cap_psm: Optional[int] = None,
+    integrity: str = None,
+    synthetic: int = 0,
+    synthetic_characteristics: int = 1000,
+    synthetic_descriptors: int = 1,
+) -> int:
+    """Replay a recording
+
+    Args:
+        file (str): recorded with ``echoez --record``
+        name (str): of the App to replay against
+        speed (float): playback speed multiplier, 0 for as fast as possible
+        broadcast, l2cap_psm, integrity, synthetic,
+        synthetic_characteristics, synthetic_descriptors: as passed to
+            echoez.main.start when recording, so the App has the same
+            characteristics
+    """
+    dbus.mainloop.glib.DBusGMainLoop(set_as_default=True)
+
+    bus = dbus.SystemBus()
+    app = build_app(
+        bus,
+        name,
+        broadcast=broadcast,
+        l2cap_psm=l2cap_psm,
+        integrity=integrity,
+        synthetic=synthetic,
+        synthetic_characteristics=synthetic_characteristics,
+        synthetic_descriptors=synthetic_descriptors,
+    )
+    loop = GLib.MainLoop()
+
+    replayer = Replayer(app, iter_records(open_records(file)), loop, speed)
+    replayer.start()
+    try:
+        loop.run()
+    except KeyboardInterrupt:
+        logger.info("quitting")
+        loop.quit()
+
+    return 0 if not replayer.errors else 1
@@ -6,14 +6,17 @@ import dbus.service
 
 from echoez.config import *
 from echoez.err import *
+from echoez.trace import traced
 from echoez.characteristic import (
     EchoCharacteristic,
     EchoEncryptCharacteristic,
     EchoSecureCharacteristic,
+    LatencyProbeCharacteristic,
 )
 
 __all__ = [
     "Service",
+    "EchoService",
 ]
 
 
@@ -32,34 +35,47 @@ class Service(dbus.service.Object):
         self.uuid = uuid
         self.primary = primary
         self.characteristics = []
-        dbus.service.Object.__init__(self, bus, self.path)
+        self._dbus_path = dbus.ObjectPath(self.path)
+        self._properties = None
+        # cooperative, so a subclass can mix in dbus.service.FallbackObject
+        super().__init__(bus, self.path)
 
     def get_properties(self):
-        return {
-            GATT_SERVICE_IFACE: {
-                "UUID": self.uuid,
-                "Primary": self.primary,
-                "Characteristics": dbus.Array(
-                    self.get_characteristic_paths(), signature="o"
-                ),
+        # built once and shared by every GetAll/GetManagedObjects, so callers
+        # must not modify it. See invalidate_properties.
+        if self._properties is None:
+            self._properties = {
+                GATT_SERVICE_IFACE: {
+                    "UUID": self.uuid,
+                    "Primary": self.primary,
+                    "Characteristics": dbus.Array(
+                        self.get_characteristic_paths(), signature="o"
+                    ),
+                }
             }
-        }
+        return self._properties
+
+    def invalidate_properties(self):
+        self._properties = None
 
     def get_path(self):
-        return dbus.ObjectPath(self.path)
+        return self._dbus_path
 
     def add_characteristic(self, characteristic):
         self.characteristics.append(characteristic)
+        self.invalidate_properties()
+
+    def remove_characteristic(self, characteristic):
+        self.characteristics.remove(characteristic)
+        self.invalidate_properties()
 
     def get_characteristic_paths(self):
-        result = []
-        for chrc in self.characteristics:
-            result.append(chrc.get_path())
-        return result
+        return [chrc.get_path() for chrc in self.characteristics]
 
     def get_characteristics(self):
         return self.characteristics
 
+    @traced
     @dbus.service.method(DBUS_PROP_IFACE, in_signature="s", out_signature="a{sv}")
     def GetAll(self, interface):
         if interface != GATT_SERVICE_IFACE:
@@ -67,6 +83,10 @@ class Service(dbus.service.Object):
 
         return self.get_properties()[GATT_SERVICE_IFACE]
 
+    @dbus.service.signal(DBUS_PROP_IFACE, signature="sa{sv}as")
+    def PropertiesChanged(self, interface, changed, invalidated):
+        pass
+
 
 class EchoService(Service):
     """
@@ -82,3 +102,4 @@ class EchoService(Service):
         self.add_characteristic(EchoCharacteristic(bus, 0, self))
         self.add_characteristic(EchoEncryptCharacteristic(bus, 1, self))
         self.add_characteristic(EchoSecureCharacteristic(bus, 2, self))
+        self.add_characteristic(LatencyProbeCharacteristic(bus, 3, self))
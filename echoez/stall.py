@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: LGPL-2.1-or-later
+
+"""Main loop stall detection."""
+
+import collections
+import logging
+import sys
+import threading
+import time
+import traceback
+
+from echoez.stats import Histogram
+
+try:
+    from gi.repository import GLib  # pyright: reportMissingImports=false
+except ImportError:
+    import gobject as GLib  # pyright: reportMissingImports=false
+
+__all__ = [
+    "StallMonitor",
+]
+
+logger = logging.getLogger(__name__)
+
+
+class StallMonitor:
+    """
+    Measures how late a timer on the GLib main loop fires every
+    ``interval_ms``, into a Histogram of nanoseconds of lag.
+
+    A watchdog thread checks the timer's heartbeat and, when the loop has
+    been stuck for over ``threshold_ms``, logs the stack of the thread
+    running the loop (from ``sys._current_frames``) while it's still stuck,
+    so the log shows what's blocking rather than what ran after. The last
+    ``max_stacks`` stacks are kept for get_stats.
+    """
+
+    def __init__(
+        self, interval_ms: int = 10, threshold_ms: float = 100.0, max_stacks: int = 8
+    ):
+        self.interval_ms = interval_ms
+        self.threshold_ns = int(threshold_ms * 1e6)
+        self.lag = Histogram()
+        self.stalls = 0
+        self.stacks = collections.deque(maxlen=max_stacks)
+        self._source = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._thread_id = None
+        self._due = 0
+        self._beat = 0
+        self._beat_ns = 0
+        self._dumped_beat = -1
+
+    @property
+    def running(self) -> bool:
+        return self._source is not None
+
+    def start(self):
+        """Start monitoring the loop run by the calling thread"""
+        if self.running:
+            return
+        self._thread_id = threading.get_ident()
+        self._beat_ns = time.monotonic_ns()
+        self._due = self._beat_ns + self.interval_ms * 1000000
+        self._source = GLib.timeout_add(self.interval_ms, self._tick)
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._watch, name="echoez-stall", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        if not self.running:
+            return
+        GLib.source_remove(self._source)
+        self._source = None
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _tick(self):
+        now = time.monotonic_ns()
+        lag = now - self._due
+        self.lag.add(lag)
+        if lag > self.threshold_ns:
+            self.stalls += 1
+            logger.warning(f"Main loop stalled for {lag / 1e6:.1f} ms")
+        self._due = now + self.interval_ms * 1000000
+        self._beat_ns = now
+        self._beat += 1
+        return True
+
+    def _watch(self):
+        # a stall is caught between threshold and 1.5 x threshold in
+        check_interval = self.threshold_ns / 2e9
+        while not self._stop.wait(check_interval):
+            beat = self._beat
+            late = time.monotonic_ns() - self._beat_ns
+            if beat == self._dumped_beat or late <= self.threshold_ns:
+                continue
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                continue
+            stack = "".join(traceback.format_stack(frame))
+            del frame
+            self._dumped_beat = beat
+            self.stacks.append(stack)
+            logger.warning(f"Main loop stuck for {late / 1e6:.1f} ms in:\n{stack}")
+
+    def get_stats(self):
+        return {
+            "lag_ns": self.lag.as_dict(),
+            "stalls": self.stalls,
+            "stacks": list(self.stacks),
+        }
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: LGPL-2.1-or-later
+
+"""Lightweight statistics helpers shared by the Echoez services."""
+
+from typing import (
+    Dict,
+    Optional,
+)
+
+__all__ = [
+    "Histogram",
+]
+
+
+class Histogram:
+    """
+    Log2-bucketed histogram of non-negative integer samples (eg. nanoseconds).
+
+    Adding a sample is a couple of integer operations, so it's cheap enough to
+    call on every GATT operation. Percentiles are approximate and reported as
+    the upper bound of the bucket they fall in.
+    """
+
+    __slots__ = ("buckets", "count", "total", "min", "max")
+
+    NUM_BUCKETS = 65
+
+    def __init__(self):
+        self.buckets = [0] * self.NUM_BUCKETS
+        self.count = 0
+        self.total = 0
+        self.min: Optional[int] = None
+        self.max: Optional[int] = None
+
+    def add(self, value: int):
+        if value < 0:
+            value = 0
+        self.buckets[min(value.bit_length(), self.NUM_BUCKETS - 1)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other: "Histogram"):
+        for i, n in enumerate(other.buckets):
+            self.buckets[i] += n
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+
+    def clear(self):
+        self.__init__()
+
+    def percentile(self, p: float) -> int:
+        """Upper bound of the bucket containing the p-th (0-100) percentile"""
+        if not self.count:
+            return 0
+        rank = max(1, int(self.count * p / 100.0 + 0.5))
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank:
+                return min((1 << i) - 1 if i else 0, self.max)
+        return self.max
+
+    def as_dict(self) -> Dict[str, object]:
+        return {
+            "count": self.count,
+            "min": self.min or 0,
+            "max": self.max or 0,
+            "mean": self.total // self.count if self.count else 0,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            # keyed by bucket upper bound, empty buckets omitted
+            "buckets": {
+                (1 << i) - 1 if i else 0: n for i, n in enumerate(self.buckets) if n
+            },
+        }
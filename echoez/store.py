@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: LGPL-2.1-or-later
+
+"""
+Append-only persistent store for attribute values.
+
+The log is ``MAGIC`` followed by ``RECORD`` headers (key length, value
+length, crc32 of key and value) each followed by the utf-8 key and the value.
+The last record for a key wins. A torn or corrupt tail (eg. power loss in the
+middle of a write) is dropped on load.
+"""
+
+import logging
+import mmap
+import os
+import struct
+import threading
+import zlib
+
+from typing import (
+    Dict,
+    Optional,
+)
+
+__all__ = [
+    "Store",
+]
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"ECHOEZS\x01"
+# len(key), len(value), crc32(key + value)
+RECORD = struct.Struct("<HII")
+
+
+def _pack(key: bytes, value: bytes) -> bytes:
+    return b"".join(
+        (
+            RECORD.pack(len(key), len(value), zlib.crc32(value, zlib.crc32(key))),
+            key,
+            value,
+        )
+    )
+
+
+class Store:
+    """
+    Key/value store backed by an append-only log.
+
+    :meth:`put` only updates memory and queues the record; a background thread
+    writes and fsyncs queued records in batches every ``flush_interval``
+    seconds, so callers on the GLib main loop never wait on the disk. When the
+    log grows past ``compact_ratio`` times the size of the live data it is
+    rewritten with only the latest value of each key.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        flush_interval: float = 0.5,
+        compact_ratio: int = 4,
+        compact_min_bytes: int = 1 << 20,
+    ):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.compact_ratio = compact_ratio
+        self.compact_min_bytes = compact_min_bytes
+        self._values: Dict[str, bytes] = {}
+        self._pending = []
+        self._live_size = 0
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closing = False
+        self._log_size = self._load()
+        self._file = open(path, "ab")
+        if self._log_size == 0:
+            self._file.write(MAGIC)
+            self._log_size = len(MAGIC)
+        self._thread = threading.Thread(
+            target=self._run, name="echoez-store", daemon=True
+        )
+        self._thread.start()
+
+    def get(self, key: str, default: Optional[bytes] = None) -> Optional[bytes]:
+        return self._values.get(key, default)
+
+    def put(self, key: str, value):
+        value = bytes(value)
+        record = _pack(key.encode(), value)
+        with self._lock:
+            old = self._values.get(key)
+            if old is not None:
+                self._live_size -= RECORD.size + len(key.encode()) + len(old)
+            self._live_size += len(record)
+            self._values[key] = value
+            self._pending.append(record)
+
+    def flush(self):
+        """Write and fsync queued records now (blocking)"""
+        with self._io_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if batch:
+                data = b"".join(batch)
+                self._file.write(data)
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._log_size += len(data)
+            if self._log_size > max(
+                self.compact_min_bytes, self.compact_ratio * self._live_size
+            ):
+                self._compact()
+
+    def compact(self):
+        """Rewrite the log with only the live values (blocking)"""
+        with self._io_lock:
+            self._compact()
+
+    def _compact(self):
+        with self._lock:
+            # anything still pending is in _values already
+            self._pending = []
+            data = b"".join(_pack(k.encode(), v) for k, v in self._values.items())
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(MAGIC)
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self._file.close()
+        self._file = open(self.path, "ab")
+        self._log_size = len(MAGIC) + len(data)
+        logger.debug(f"Compacted {self.path} to {self._log_size} bytes")
+
+    def close(self):
+        self._closing = True
+        self._wakeup.set()
+        self._thread.join()
+        self._file.close()
+
+    def _run(self):
+        while not self._closing:
+            self._wakeup.wait(self.flush_interval)
+            try:
+                self.flush()
+            except OSError as e:
+                logger.error(f"Could not write {self.path}: {e}")
+        self.flush()
+
+    def _load(self) -> int:
+        """Load the log, returning the size of its valid prefix"""
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return 0
+        with f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return 0
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                if buf[: len(MAGIC)] != MAGIC:
+                    raise ValueError(f"{self.path} is not an echoez store")
+                offset = len(MAGIC)
+                end = len(buf)
+                while offset + RECORD.size <= end:
+                    key_len, value_len, crc = RECORD.unpack_from(buf, offset)
+                    start = offset + RECORD.size
+                    stop = start + key_len + value_len
+                    if stop > end or zlib.crc32(buf[start:stop]) != crc:
+                        logger.warning(f"Ignoring corrupt tail of {self.path}")
+                        break
+                    key = buf[start : start + key_len].decode()
+                    value = buf[start + key_len : stop]
+                    old = self._values.get(key)
+                    if old is not None:
+                        self._live_size -= RECORD.size + key_len + len(old)
+                    self._live_size += RECORD.size + key_len + value_len
+                    self._values[key] = value
+                    offset = stop
+        if offset != end:
+            # cut the bad tail off so appends land after valid data
+            os.truncate(self.path, offset)
+        return offset
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: LGPL-2.1-or-later
+
+"""Run one Echoez worker process per adapter and keep them alive."""
+
+import logging
+import multiprocessing
+import multiprocessing.connection
+import os
+import signal
+import time
+
+from typing import (
+    Callable,
+    Dict,
+    List,
+    Optional,
+)
+
+import dbus
+
+import echoez.main
+
+__all__ = [
+    "Supervisor",
+    "merge_stats",
+    "supervise",
+]
+
+logger = logging.getLogger(__name__)
+
+# stats keys which can't be summed across workers
+_MIN_KEYS = frozenset(("min",))
+_MAX_KEYS = frozenset(("max",))
+_SKIP_KEYS = frozenset(("mean", "p50", "p90", "p99"))
+
+# workers are forked, whatever the platform default, so they keep the
+# logging setup of the supervisor (-v). Python 3.14 defaults to forkserver.
+_mp = multiprocessing.get_context("fork")
+
+
+def merge_stats(total: Dict, stats: Dict) -> Dict:
+    """Sum the counters in ``stats`` into ``total`` (in place)"""
+    for k, v in stats.items():
+        if isinstance(v, dict):
+            merge_stats(total.setdefault(k, {}), v)
+        elif isinstance(v, (int, float)) and k not in _SKIP_KEYS:
+            if k not in total:
+                total[k] = v
+            elif k in _MIN_KEYS:
+                total[k] = min(total[k], v)
+            elif k in _MAX_KEYS:
+                total[k] = max(total[k], v)
+            else:
+                total[k] += v
+    return total
+
+
+def _worker_main(conn, name: str, adapter: str, stats_interval: int, kwargs):
+    # the parent's SIGTERM handler is inherited across fork
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    raise SystemExit(
+        echoez.main.start(
+            name,
+            adapter=adapter,
+            stats_conn=conn,
+            stats_interval=stats_interval,
+            **kwargs,
+        )
+    )
+
+
+class Worker:
+    def __init__(self, adapter: str):
+        self.adapter = adapter
+        self.process: Optional[multiprocessing.Process] = None
+        self.conn: Optional[multiprocessing.connection.Connection] = None
+        self.restarts = 0
+        self.started = 0.0
+        self.last_seen = 0.0
+        self.next_start = 0.0
+        # SIGKILL sent for missing heartbeats, waiting to reap
+        self.killed = False
+        self.stats = {}
+
+
+class Supervisor:
+    """
+    Forks a worker per adapter, each with its own bus connection and GLib main
+    loop (see echoez.main.start). Workers report their stats over a pipe; a
+    worker that exits or stops reporting for ``heartbeat_timeout`` seconds is
+    restarted with exponential backoff (capped at ``max_backoff`` seconds).
+
+    Per-worker ``record`` and ``state_file`` paths get the adapter name
+    appended so workers never share a file.
+
+    ``target(conn, name, adapter, stats_interval, kwargs)`` runs in each
+    worker, echoez.main.start by default.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        adapters: List[str],
+        stats_interval: int = 5,
+        heartbeat_timeout: float = 30.0,
+        max_backoff: float = 30.0,
+        target: Callable = _worker_main,
+        **kwargs,
+    ):
+        if not adapters:
+            raise ValueError("at least one adapter is required")
+        self.name = name
+        self.stats_interval = stats_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self.max_backoff = max_backoff
+        self.target = target
+        self.kwargs = kwargs
+        self.workers = [Worker(adapter) for adapter in adapters]
+        self._stopping = False
+
+    def get_stats(self) -> Dict:
+        stats = {"total": {}}
+        for w in self.workers:
+            stats[w.adapter] = {
+                "alive": bool(w.process and w.process.is_alive()),
+                "restarts": w.restarts,
+                "stats": w.stats,
+            }
+            merge_stats(stats["total"], w.stats)
+        return stats
+
+    def stop(self, *_):
+        self._stopping = True
+
+    def run(self) -> int:
+        signal.signal(signal.SIGTERM, self.stop)
+        last_report = time.monotonic()
+        try:
+            while not self._stopping:
+                now = time.monotonic()
+                self._check(now)
+                self._poll(1.0)
+                if now - last_report >= self.stats_interval:
+                    last_report = now
+                    logger.info(f"stats: {self.get_stats()['total']}")
+        except KeyboardInterrupt:
+            logger.info("quitting")
+        self._shutdown()
+        return 0
+
+    def _check(self, now: float):
+        """Start workers that are due, kill unresponsive ones"""
+        for w in self.workers:
+            if w.process is None:
+                if now >= w.next_start:
+                    self._spawn(w)
+            elif not w.killed and now - w.last_seen > self.heartbeat_timeout:
+                logger.error(f"{w.adapter}: worker unresponsive, killing")
+                w.process.kill()
+                w.killed = True
+
+    def _spawn(self, w: Worker):
+        kwargs = dict(self.kwargs)
+        for key in ("record", "state_file", "handoff"):
+            if kwargs.get(key):
+                kwargs[key] = f"{kwargs[key]}.{w.adapter}"
+        parent_conn, child_conn = _mp.Pipe(duplex=False)
+        w.process = _mp.Process(
+            target=self.target,
+            args=(child_conn, self.name, w.adapter, self.stats_interval, kwargs),
+            name=f"echoez-{w.adapter}",
+        )
+        w.process.start()
+        child_conn.close()
+        w.conn = parent_conn
+        w.started = w.last_seen = time.monotonic()
+        logger.info(f"{w.adapter}: started worker {w.process.pid}")
+
+    def _poll(self, timeout: float):
+        by_handle = {}
+        for w in self.workers:
+            if w.process is not None:
+                by_handle[w.conn] = w
+                by_handle[w.process.sentinel] = w
+        if not by_handle:
+            time.sleep(timeout)
+            return
+        for ready in multiprocessing.connection.wait(list(by_handle), timeout):
+            w = by_handle[ready]
+            if w.process is None:
+                # already reaped this round
+                continue
+            if ready is w.conn:
+                try:
+                    kind, payload = w.conn.recv()
+                except (EOFError, OSError):
+                    continue
+                if kind == "stats":
+                    w.stats = payload
+                    w.last_seen = time.monotonic()
+            else:
+                self._reap(w)
+
+    def _reap(self, w: Worker):
+        w.process.join()
+        code = w.process.exitcode
+        w.conn.close()
+        w.process = None
+        w.conn = None
+        w.killed = False
+        if self._stopping:
+            return
+        if time.monotonic() - w.started > 2 * self.max_backoff:
+            # it was healthy for a while, so this is a fresh failure
+            w.restarts = 0
+        backoff = min(2.0**w.restarts, self.max_backoff)
+        w.restarts += 1
+        w.next_start = time.monotonic() + backoff
+        logger.error(
+            f"{w.adapter}: worker exited with {code}, restarting in {backoff:.0f}s"
+        )
+
+    def _shutdown(self):
+        self._stopping = True
+        for w in self.workers:
+            if w.process is not None and w.process.is_alive():
+                # echoez.main.start cleans up on KeyboardInterrupt
+                os.kill(w.process.pid, signal.SIGINT)
+        for w in self.workers:
+            if w.process is not None:
+                w.process.join(5.0)
+                if w.process.is_alive():
+                    w.process.kill()
+                    w.process.join()
+
+
+def supervise(
+    name: str, adapters: List[str] = None, stats_interval: int = 5, **kwargs
+) -> int:
+    """Run a worker per adapter until interrupted
+
+    Args:
+        name (str): to advertise to clients
+        adapters (list): to use (eg. ["hci0", "hci1"]), all adapters if empty
+        stats_interval (int): seconds between worker stats reports
+        **kwargs: passed to echoez.main.start in each worker
+    """
+    if not adapters:
+        # a private connection, so no connection is inherited by the workers
+        bus = dbus.SystemBus(private=True)
+        adapters = [path.rsplit("/", 1)[-1] for path in echoez.main.find_adapters(bus)]
+        bus.close()
+    if not adapters:
+        logger.error("No adapters found")
+        return -1
+    return Supervisor(name, adapters, stats_interval=stats_interval, **kwargs).run()
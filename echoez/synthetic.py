@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: LGPL-2.1-or-later
+
+"""
+Synthetic GATT services with thousands of attributes, to emulate large
+devices.
+
+Everything the attributes of a synthetic service have in common (flags,
+default values, how UUIDs are derived) lives on the classes, so a
+characteristic only stores its index, path and service. Descriptors aren't
+D-Bus objects and aren't in the App's index: their paths and properties are
+computed from their indices, calls on their paths are answered by the
+service, which is exported as a fallback object for its whole subtree, and a
+slotted record is only created to answer a call.
+"""
+
+import dbus.service
+
+from echoez.config import *
+from echoez.err import *
+from echoez.trace import traced
+from echoez.characteristic import Characteristic
+from echoez.service import Service
+
+__all__ = [
+    "SyntheticCharacteristic",
+    "SyntheticDescriptor",
+    "SyntheticService",
+    "synthetic_uuid",
+]
+
+# indices are encoded in 16 bit UUID fields, 0xffff meaning "none"
+MAX_INDEX = 0xFFFE
+
+
+def synthetic_uuid(service: int, chrc: int = 0xFFFF, desc: int = 0xFFFF) -> str:
+    return f"5e7e{service:04x}-{chrc:04x}-{desc:04x}-aa4c-c3c6adc0b74b"
+
+
+class SyntheticDescriptor:
+    """
+    Read-only descriptor of a SyntheticCharacteristic. It isn't exported;
+    SyntheticService creates one to answer a call on its path.
+    """
+
+    __slots__ = ("chrc", "index", "path")
+
+    flags = ("read",)
+    value = dbus.ByteArray(b"synthetic")
+    persistent = False
+
+    def __init__(self, chrc, index: int):
+        self.chrc = chrc
+        self.index = index
+        self.path = f"{chrc.path}/desc{index}"
+
+    @property
+    def uuid(self):
+        return synthetic_uuid(self.chrc.service.index, self.chrc.index, self.index)
+
+    def get_path(self):
+        return dbus.ObjectPath(self.path)
+
+    def get_properties(self):
+        return self.properties_of(self.chrc, self.index)
+
+    @classmethod
+    def properties_of(cls, chrc, index: int):
+        """Properties of descriptor ``index`` of ``chrc``, without creating
+        it. Built on demand rather than cached, there are a lot of these."""
+        return {
+            GATT_DESC_IFACE: {
+                "Characteristic": chrc.get_path(),
+                "UUID": synthetic_uuid(chrc.service.index, chrc.index, index),
+                "Flags": dbus.Array(cls.flags, signature="s"),
+            }
+        }
+
+    def read_value(self, options):
+        offset = options.get("offset", 0)
+        if offset > len(self.value):
+            raise InvalidOffsetException()
+        return self.value[offset:] if offset else self.value
+
+
+class SyntheticCharacteristic(Characteristic):
+    """
+    Echo characteristic of a SyntheticService. Reads return the last value
+    written, or a shared default.
+
+    Characteristic.__init__ isn't called: the flags, value and counters
+    default to class attributes and only become per-instance once they
+    change. It has ``service.num_descriptors`` descriptors, which exist only
+    as paths and properties, see get_descriptor_properties.
+    """
+
+    _flags = ("read", "write", "write-without-response")
+    value = dbus.ByteArray(b"")
+    reads = 0
+    writes = 0
+    bytes_written = 0
+
+    def __init__(self, bus, index: int, service):
+        self.index = index
+        self.path = f"{service.path}/char{index}"
+        self.service = service
+        dbus.service.Object.__init__(self, bus, self.path)
+
+    @property
+    def uuid(self):
+        return synthetic_uuid(self.service.index, self.index)
+
+    def get_path(self):
+        return dbus.ObjectPath(self.path)
+
+    def get_properties(self):
+        return {
+            GATT_CHRC_IFACE: {
+                "Service": self.service.get_path(),
+                "UUID": self.uuid,
+                "Flags": dbus.Array(self.flags, signature="s"),
+                "Descriptors": dbus.Array(self.get_descriptor_paths(), signature="o"),
+            }
+        }
+
+    def invalidate_properties(self):
+        pass
+
+    def add_descriptor(self, descriptor):
+        raise TypeError("Synthetic characteristics have a fixed set of descriptors")
+
+    remove_descriptor = add_descriptor
+
+    def get_descriptors(self):
+        # none to index or export, SyntheticService answers on their paths
+        return ()
+
+    def get_descriptor_paths(self):
+        return [
+            dbus.ObjectPath(f"{self.path}/desc{i}")
+            for i in range(self.service.num_descriptors)
+        ]
+
+    def get_descriptor_properties(self):
+        return (
+            (path, SyntheticDescriptor.properties_of(self, i))
+            for i, path in enumerate(self.get_descriptor_paths())
+        )
+
+    def read_value(self, options):
+        offset = options.get("offset", 0)
+        if offset > len(self.value):
+            raise InvalidOffsetException()
+        return self.value[offset:] if offset else self.value
+
+    def write_value(self, value, options):
+        self.value = value
+
+
+class SyntheticService(Service, dbus.service.FallbackObject):
+    """
+    Service with ``num_characteristics`` SyntheticCharacteristics, each with
+    ``num_descriptors`` SyntheticDescriptors.
+
+    """
+
+    def __init__(self, bus, index: int, num_characteristics: int, num_descriptors=1):
+        if not 0 <= index <= MAX_INDEX:
+            raise ValueError(f"index must be from 0 to {MAX_INDEX}")
+        if not 0 <= num_characteristics <= MAX_INDEX + 1:
+            raise ValueError(f"at most {MAX_INDEX + 1} characteristics per service")
+        if not 0 <= num_descriptors <= MAX_INDEX + 1:
+            raise ValueError(f"at most {MAX_INDEX + 1} descriptors per characteristic")
+        self.index = index
+        self.num_descriptors = num_descriptors
+        Service.__init__(self, bus, index, synthetic_uuid(index), True)
+        self.characteristics = [
+            SyntheticCharacteristic(bus, i, self) for i in range(num_characteristics)
+        ]
+
+    def _descriptor(self, rel_path: str) -> SyntheticDescriptor:
+        # rel_path is "/char{chrc}/desc{desc}"
+        try:
+            chrc_part, _, desc_part = rel_path.rpartition("/desc")
+            if not chrc_part.startswith("/char"):
+                raise ValueError(rel_path)
+            chrc_index = int(chrc_part[len("/char") :])
+            desc_index = int(desc_part)
+        except ValueError:
+            raise UnknownObjectException(f"No object at {self.path}{rel_path}")
+        chrcs = self.characteristics
+        if chrc_index < len(chrcs) and chrcs[chrc_index].index == chrc_index:
+            chrc = chrcs[chrc_index]
+        else:
+            # some were removed, so the list doesn't match the indices
+            chrc = next((c for c in chrcs if c.index == chrc_index), None)
+        if chrc is None or not 0 <= desc_index < self.num_descriptors:
+            raise UnknownObjectException(f"No object at {self.path}{rel_path}")
+        return SyntheticDescriptor(chrc, desc_index)
+
+    @traced
+    @dbus.service.method(
+        DBUS_PROP_IFACE,
+        in_signature="s",
+        out_signature="a{sv}",
+        rel_path_keyword="rel_path",
+    )
+    def GetAll(self, interface, rel_path="/"):
+        if rel_path == "/":
+            attr, attr_interface = self, GATT_SERVICE_IFACE
+        else:
+            attr, attr_interface = self._descriptor(rel_path), GATT_DESC_IFACE
+        if interface != attr_interface:
+            raise InvalidArgsException()
+
+        return attr.get_properties()[attr_interface]
+
+    @traced
+    @dbus.service.method(
+        GATT_DESC_IFACE,
+        in_signature="a{sv}",
+        out_signature="ay",
+        rel_path_keyword="rel_path",
+    )
+    def ReadValue(self, options, rel_path="/"):
+        return self._descriptor(rel_path).read_value(options)
+
+    @traced
+    @dbus.service.method(
+        GATT_DESC_IFACE,
+        in_signature="aya{sv}",
+        rel_path_keyword="rel_path",
+    )
+    def WriteValue(self, value, options, rel_path="/"):
+        self._descriptor(rel_path)
+        raise NotPermittedException()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: LGPL-2.1-or-later
+
+"""
+Slow-call tracing of exported D-Bus methods.
+
+Methods are marked with :func:`traced` where they're defined::
+
+    @traced
+    @dbus.service.method(GATT_CHRC_IFACE, in_signature="a{sv}", out_signature="ay")
+    def ReadValue(self, options):
+        ...
+
+Marking costs nothing: the method is returned as-is. Only while a
+:class:`Tracer` is enabled are the marked methods swapped for timing wrappers
+in their classes, and disabling it puts the originals back.
+"""
+
+import collections
+import functools
+import logging
+import sys
+import time
+
+from typing import (
+    Callable,
+    Dict,
+    List,
+)
+
+__all__ = [
+    "Tracer",
+    "traced",
+]
+
+logger = logging.getLogger(__name__)
+
+_methods: List[Callable] = []
+
+# sender_keyword for methods which don't declare their own
+_SENDER_KEYWORD = "_echoez_trace_sender"
+
+
+def traced(func: Callable) -> Callable:
+    """Mark an exported D-Bus method for slow-call tracing"""
+    _methods.append(func)
+    return func
+
+
+def _owner(func: Callable):
+    owner = sys.modules[func.__module__]
+    for name in func.__qualname__.split(".")[:-1]:
+        owner = getattr(owner, name)
+    return owner
+
+
+def _payload_size(args) -> int:
+    # byte arrays and dbus.Array payloads are bytes/list subclasses
+    return sum(len(a) for a in args if isinstance(a, (bytes, bytearray, list)))
+
+
+class Tracer:
+    """
+    Times every call of the :func:`traced` methods while enabled and logs the
+    ones slower than ``threshold_ms`` with their sender, object path and
+    payload size. Methods using dbus-python ``async_callbacks`` are timed
+    until they reply. Per-method counters and the last ``max_records`` slow
+    calls are kept for get_stats.
+    """
+
+    def __init__(self, threshold_ms: float = 10.0, max_records: int = 100):
+        self.threshold_ns = int(threshold_ms * 1e6)
+        self.slow_calls = collections.deque(maxlen=max_records)
+        self.methods: Dict[str, List[int]] = {}
+        self._originals = []
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._originals)
+
+    def enable(self):
+        if self._originals:
+            return
+        for func in _methods:
+            cls = _owner(func)
+            self._originals.append((cls, func))
+            setattr(cls, func.__name__, self._wrap(func))
+        logger.info(f"Tracing {len(_methods)} D-Bus methods")
+
+    def disable(self):
+        for cls, func in self._originals:
+            setattr(cls, func.__name__, func)
+        self._originals = []
+
+    def get_stats(self):
+        return {
+            "methods": {
+                name: {"calls": calls, "slow": slow, "max_ns": max_ns}
+                for name, (calls, slow, max_ns) in self.methods.items()
+            },
+            "slow_calls": list(self.slow_calls),
+        }
+
+    def _finish(self, name, counters, start, sender, path, args):
+        elapsed = time.perf_counter_ns() - start
+        counters[0] += 1
+        if elapsed > counters[2]:
+            counters[2] = elapsed
+        if elapsed >= self.threshold_ns:
+            counters[1] += 1
+            call = {
+                "method": name,
+                "sender": sender or "",
+                "path": path,
+                "payload": _payload_size(args),
+                "ns": elapsed,
+            }
+            self.slow_calls.append(call)
+            logger.warning(
+                f"Slow D-Bus call {name} from {call['sender']} on {path}: "
+                f"{elapsed / 1e6:.1f} ms, {call['payload']} byte payload"
+            )
+
+    def _wrap(self, func: Callable) -> Callable:
+        name = func.__qualname__
+        counters = self.methods.setdefault(name, [0, 0, 0])
+        sender_keyword = getattr(func, "_dbus_sender_keyword", None)
+        own_sender = sender_keyword is None
+        if own_sender:
+            sender_keyword = _SENDER_KEYWORD
+        async_callbacks = getattr(func, "_dbus_async_callbacks", None)
+        finish = self._finish
+
+        @functools.wraps(func)
+        def wrapper(obj, *args, **kwargs):
+            start = time.perf_counter_ns()
+            if own_sender:
+                sender = kwargs.pop(sender_keyword, None)
+            else:
+                sender = kwargs.get(sender_keyword)
+            path = getattr(obj, "path", "")
+            if async_callbacks and async_callbacks[0] in kwargs:
+                reply_name, error_name = async_callbacks
+                reply_handler = kwargs[reply_name]
+                error_handler = kwargs[error_name]
+
+                def on_reply(*result):
+                    finish(name, counters, start, sender, path, args)
+                    reply_handler(*result)
+
+                def on_error(error):
+                    finish(name, counters, start, sender, path, args)
+                    error_handler(error)
+
+                kwargs[reply_name] = on_reply
+                kwargs[error_name] = on_error
+                try:
+                    return func(obj, *args, **kwargs)
+                except Exception:
+                    finish(name, counters, start, sender, path, args)
+                    raise
+            try:
+                return func(obj, *args, **kwargs)
+            finally:
+                finish(name, counters, start, sender, path, args)
+
+        # have dbus-python pass the sender in
+        wrapper._dbus_sender_keyword = sender_keyword
+        return wrapper
@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+
+"""Shared fixtures."""
+
+import shutil
+import subprocess
+
+import pytest
+
+
+@pytest.fixture
+def bus_address():
+    """Address of a private dbus-daemon"""
+    if shutil.which("dbus-daemon") is None:
+        pytest.skip("dbus-daemon not found")
+    daemon = subprocess.Popen(
+        ["dbus-daemon", "--session", "--print-address", "--nofork"],
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    try:
+        yield daemon.stdout.readline().strip()
+    finally:
+        daemon.terminate()
+        daemon.wait()
+
+
+@pytest.fixture
+def app(bus_address):
+    """The App, on its own connection to the private bus"""
+    pytest.importorskip("dbus")
+    pytest.importorskip("gi")
+    import dbus.bus
+    import dbus.mainloop.glib
+
+    from echoez.app import App
+
+    bus = dbus.bus.BusConnection(
+        bus_address, mainloop=dbus.mainloop.glib.DBusGMainLoop()
+    )
+    return App(bus, "echoez")
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+
+"""Tests for `echoez.advertisement`."""
+
+import pytest
+
+dbus = pytest.importorskip("dbus")
+
+import dbus.bus
+import dbus.mainloop.glib
+
+from echoez.advertisement import EchoAdvertisement
+from echoez.config import LE_ADVERTISEMENT_IFACE
+from echoez.service import EchoService
+
+EXTENDED = {
+    "SupportedSecondaryChannels": ["1M", "2M"],
+    "SupportedCapabilities": {"MaxAdvLen": dbus.Byte(251)},
+    "SupportedIncludes": ["tx-power", "local-name"],
+}
+LEGACY = {
+    "SupportedSecondaryChannels": [],
+    "SupportedIncludes": ["tx-power", "local-name"],
+}
+
+
+@pytest.fixture
+def ad(bus_address):
+    mainloop = dbus.mainloop.glib.DBusGMainLoop()
+    return EchoAdvertisement(dbus.bus.BusConnection(bus_address, mainloop=mainloop), 0)
+
+
+def properties(ad):
+    return ad.get_properties()[LE_ADVERTISEMENT_IFACE]
+
+
+def test_legacy_length(ad):
+    # flags, 128-bit UUID, manufacturer data, name, TX power
+    assert ad.get_length() == 3 + 18 + 6 + 8 + 3
+
+
+@pytest.mark.parametrize("channel", ["1M", "2M"])
+def test_extended(ad, channel):
+    ad.use_extended(channel)
+    ad.add_include("appearance")
+    assert ad.fit_to_adapter(EXTENDED)
+    assert ad.max_length == 251
+    assert properties(ad)["SecondaryChannel"] == channel
+    # unsupported includes are dropped
+    assert properties(ad)["Includes"] == []
+
+
+@pytest.mark.parametrize("adapter", [LEGACY, {}])
+def test_legacy_fallback(ad, adapter):
+    ad.use_extended("Coded")
+    assert not ad.fit_to_adapter(adapter)
+    assert ad.max_length == 31
+    assert "SecondaryChannel" not in properties(ad)
+
+
+def test_unknown_channel(ad):
+    with pytest.raises(ValueError):
+        ad.use_extended("3M")
+
+
+def test_extended_data(ad):
+    ad.use_extended("2M")
+    assert ad.fit_to_adapter(EXTENDED)
+    length = ad.get_length()
+    assert ad.add_extended_data(0x81)
+    # 128-bit UUID service data: version and PSM
+    assert ad.get_length() == length + 2 + 16 + 3
+    data = properties(ad)["ServiceData"][EchoService.ECHO_SVC_UUID]
+    assert bytes(data) == b"\x01\x81\x00"
+
+
+def test_no_extended_data_when_legacy(ad, caplog):
+    assert not ad.fit_to_adapter(LEGACY)
+    # the legacy advertisement already needs a scan response
+    assert "scan response" in caplog.text
+    assert not ad.add_extended_data(0x81)
+    assert "ServiceData" not in properties(ad)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+"""Tests for `echoez.agent`, against a fake BlueZ on a private bus."""
+
+import pytest
+
+dbus = pytest.importorskip("dbus")
+pytest.importorskip("gi")
+
+import dbus.bus
+import dbus.mainloop.glib
+import dbus.service
+
+from gi.repository import GLib
+
+from echoez.agent import DeviceTrust, device_path
+from echoez.config import *
+
+ADAPTER = "/org/bluez/hci0"
+
+
+class FakeBluez(dbus.service.FallbackObject):
+    """Device1 Properties on every path below the adapter, and the
+    ObjectManager at /"""
+
+    def __init__(self, bus):
+        self.trusted = []
+        dbus.service.FallbackObject.__init__(self, bus, "/")
+
+    @dbus.service.method(DBUS_PROP_IFACE, in_signature="ssv", rel_path_keyword="path")
+    def Set(self, interface, name, value, path):
+        self.trusted.append(path)
+
+    @dbus.service.signal(DBUS_OM_IFACE, signature="oas")
+    def InterfacesRemoved(self, path, interfaces):
+        pass
+
+
+def run_until(done):
+    expired = []
+    timeout = GLib.timeout_add(2000, expired.append, True)
+    context = GLib.MainContext.default()
+    while not done() and not expired:
+        context.iteration(True)
+    if not expired:
+        GLib.source_remove(timeout)
+    assert done()
+
+
+@pytest.fixture
+def bluez(bus_address):
+    bluez_bus = dbus.bus.BusConnection(
+        bus_address, mainloop=dbus.mainloop.glib.DBusGMainLoop()
+    )
+    bluez = FakeBluez(bluez_bus)
+    # the name is released once this is collected
+    bluez.bus_name = dbus.service.BusName(BLUEZ_SERVICE_NAME, bluez_bus)
+    return bluez
+
+
+@pytest.fixture
+def trust(bus_address, bluez):
+    bus = dbus.bus.BusConnection(
+        bus_address, mainloop=dbus.mainloop.glib.DBusGMainLoop()
+    )
+    return DeviceTrust(bus, max_devices=2)
+
+
+def test_cache_is_bounded(bluez, trust):
+    addresses = ["00:00:00:00:00:01", "00:00:00:00:00:02", "00:00:00:00:00:03"]
+    trust.trust_all(ADAPTER, addresses)
+    run_until(lambda: trust.trusted == 3)
+    assert bluez.trusted == [device_path(ADAPTER, a) for a in addresses]
+    assert list(trust._props) == [device_path(ADAPTER, a) for a in addresses[1:]]
+    # used again, so it's kept over the other one
+    trust.set_trusted(device_path(ADAPTER, addresses[1]))
+    trust.set_trusted(device_path(ADAPTER, addresses[0]))
+    assert list(trust._props) == [device_path(ADAPTER, a) for a in addresses[1::-1]]
+
+
+def test_removed_devices_are_forgotten(bluez, trust):
+    device = device_path(ADAPTER, "00:00:00:00:00:01")
+    trust.set_trusted(device)
+    run_until(lambda: trust.trusted == 1)
+    bluez.InterfacesRemoved(device, [DEVICE_IFACE])
+    run_until(lambda: not trust._props)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+
+"""Tests for `echoez.aggregate`."""
+
+import pickle
+import threading
+
+import pytest
+
+pytest.importorskip("gi")
+
+from gi.repository import GLib
+
+from echoez.aggregate import BatchWriter, WriteAggregator
+
+
+class Consumer:
+    def __init__(self):
+        self.batches = []
+
+    def __call__(self, path, data, sizes):
+        self.batches.append((path, bytes(data), list(sizes)))
+
+
+def test_size_flush():
+    consumer = Consumer()
+    aggregator = WriteAggregator(consumer, max_bytes=8, max_delay=10)
+    aggregator.append("/a", b"1234")
+    aggregator.append("/a", b"56")
+    assert consumer.batches == []
+    # doesn't fit, the batch so far goes first
+    aggregator.append("/a", b"789")
+    assert consumer.batches == [("/a", b"123456", [4, 2])]
+    # fills the buffer exactly
+    aggregator.append("/a", b"abcde")
+    assert consumer.batches[-1] == ("/a", b"789abcde", [3, 5])
+    # larger than the buffer, on its own
+    aggregator.append("/a", b"x" * 9)
+    assert consumer.batches[-1] == ("/a", b"x" * 9, [9])
+    assert aggregator.get_stats() == {
+        "writes": 5,
+        "batches": 3,
+        "bytes": 23,
+        "timed_flushes": 0,
+        "kept_buffers": 0,
+    }
+    aggregator.close()
+
+
+def test_time_flush():
+    consumer = Consumer()
+    aggregator = WriteAggregator(consumer, max_bytes=1024, max_delay=0.01)
+    loop = GLib.MainLoop()
+    aggregator.append("/a", [1, 2, 3])
+    aggregator.append("/a", b"\x04")
+    GLib.timeout_add(200, loop.quit)
+    loop.run()
+    assert consumer.batches == [("/a", b"\x01\x02\x03\x04", [3, 1])]
+    assert aggregator.get_stats()["timed_flushes"] == 1
+
+
+def test_batches_per_path():
+    consumer = Consumer()
+    aggregator = WriteAggregator(consumer, max_bytes=4, max_delay=10)
+    aggregator.append("/a", b"aa")
+    aggregator.append("/b", b"bbb")
+    aggregator.append("/a", b"aa")
+    assert consumer.batches == [("/a", b"aaaa", [2, 2])]
+    aggregator.append("/c", b"c")
+    aggregator.remove("/b")
+    assert consumer.batches[-1] == ("/b", b"bbb", [3])
+    aggregator.flush()
+    assert consumer.batches[-1] == ("/c", b"c", [1])
+    aggregator.flush("/b")
+    assert len(consumer.batches) == 3
+
+
+def test_kept_buffer_is_not_reused():
+    kept = []
+    aggregator = WriteAggregator(
+        lambda path, data, sizes: kept.append(pickle.PickleBuffer(data)),
+        max_bytes=4,
+        max_delay=10,
+    )
+    aggregator.append("/a", b"1234")
+    aggregator.append("/a", b"5678")
+    assert [bytes(buffer.raw()) for buffer in kept] == [b"1234", b"5678"]
+    assert aggregator.get_stats()["kept_buffers"] == 2
+
+
+def test_batch_writer(tmp_path):
+    path = tmp_path / "writes"
+    path.write_bytes(b"old")
+    writer = BatchWriter(str(path))
+    aggregator = WriteAggregator(writer, max_bytes=4, max_delay=10)
+    for value in (b"12", b"34", b"567", b"8"):
+        aggregator.append("/a", value)
+    # the last batch is only written once the aggregator is closed
+    aggregator.close()
+    writer.close()
+    assert path.read_bytes() == b"old12345678"
+    assert writer.get_stats() == {"written": 2, "dropped": 0}
+    assert aggregator.get_stats()["kept_buffers"] == 0
+
+
+def test_batch_writer_drops_when_behind(tmp_path):
+    writer = BatchWriter(str(tmp_path / "writes"), max_pending=1)
+    # hold up the writer thread
+    gate = threading.Event()
+    write = writer._file.write
+    writer._file.write = lambda data: gate.wait() and write(data)
+    writer("/a", memoryview(b"1"), None)
+    # until the thread has taken the first batch, the queue is full
+    while not writer._queue.empty():
+        pass
+    writer("/a", memoryview(b"2"), None)
+    writer("/a", memoryview(b"3"), None)
+    gate.set()
+    writer.close()
+    assert (tmp_path / "writes").read_bytes() == b"12"
+    assert writer.get_stats() == {"written": 2, "dropped": 1}
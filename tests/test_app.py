@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+
+"""Tests for `echoez.app`, over a private bus."""
+
+import pytest
+
+dbus = pytest.importorskip("dbus")
+pytest.importorskip("gi")
+
+import dbus.bus
+import dbus.mainloop.glib
+
+from gi.repository import GLib
+
+from echoez.characteristic import Characteristic, LatencyProbeCharacteristic
+from echoez.descriptor import EchoDescriptor
+from echoez.service import EchoService
+
+ECHO = "/org/bluez/example/service2"
+
+
+class Signals:
+    """ObjectManager and Properties signals of ``app``, seen from another
+    connection, as (member, path, args) tuples"""
+
+    def __init__(self, bus_address, app):
+        self.bus = dbus.bus.BusConnection(
+            bus_address, mainloop=dbus.mainloop.glib.DBusGMainLoop()
+        )
+        self.received = []
+        for member in ("InterfacesAdded", "InterfacesRemoved", "PropertiesChanged"):
+            self.bus.add_signal_receiver(
+                self._on_signal,
+                member,
+                sender_keyword="sender",
+                member_keyword="member",
+                path_keyword="path",
+                bus_name=app.connection.get_unique_name(),
+            )
+        # the match rules are in place once the bus has replied
+        self.bus.get_unique_name()
+        self.bus.list_names()
+
+    def _on_signal(self, *args, sender, member, path):
+        self.received.append((member, path, args))
+
+    def take(self, count):
+        """The next ``count`` signals, waiting up to a second for them"""
+        expired = []
+        timeout = GLib.timeout_add(1000, expired.append, True)
+        context = GLib.MainContext.default()
+        while len(self.received) < count and not expired:
+            context.iteration(True)
+        if not expired:
+            GLib.source_remove(timeout)
+        received, self.received = self.received[:count], self.received[count:]
+        return received
+
+
+@pytest.fixture
+def signals(bus_address, app):
+    return Signals(bus_address, app)
+
+
+def test_characteristic_index(app):
+    service = app.find_by_uuid(EchoService.ECHO_SVC_UUID)[0]
+    paths = [chrc.path for chrc in app.get_characteristics()]
+    assert paths == [f"{ECHO}/char{i}" for i in range(4)]
+
+    probe = LatencyProbeCharacteristic(app.connection, 7, service)
+    app.add_characteristic(service, probe)
+    assert app.get_characteristics()[-1] is probe
+    app.remove_characteristic(service.characteristics[0])
+    paths = [chrc.path for chrc in app.get_characteristics()]
+    assert paths == [f"{ECHO}/char{i}" for i in (1, 2, 3, 7)]
+    assert all(isinstance(c, Characteristic) for c in app.get_characteristics())
+
+
+def test_descriptor_added_after_indexing(app):
+    chrc = app.get_attribute(f"{ECHO}/char3")
+    desc = EchoDescriptor(app.connection, 0, chrc)
+    app.add_descriptor(chrc, desc)
+    assert app.get_attribute(desc.path) is desc
+    assert desc in app.find_by_uuid(EchoDescriptor.TEST_DESC_UUID)
+    objects = app.GetManagedObjects()
+    assert desc.path in objects
+    assert (
+        desc.get_path()
+        in objects[chrc.path]["org.bluez.GattCharacteristic1"]["Descriptors"]
+    )
+
+    app.remove_descriptor(desc)
+    assert app.get_attribute(desc.path) is None
+    assert desc.path not in app.GetManagedObjects()
+    assert chrc.get_descriptors() == []
+
+
+def test_descriptor_signals(app, signals):
+    app.registered = True
+    chrc = app.get_attribute(f"{ECHO}/char3")
+    desc = EchoDescriptor(app.connection, 0, chrc)
+    app.add_descriptor(chrc, desc)
+    added, changed = signals.take(2)
+    assert added[:2] == ("InterfacesAdded", "/")
+    assert added[2][0] == desc.path
+    assert changed[:2] == ("PropertiesChanged", chrc.path)
+    assert changed[2][1] == {"Descriptors": [desc.path]}
+
+    app.remove_descriptor(desc)
+    removed, changed = signals.take(2)
+    assert removed[:2] == ("InterfacesRemoved", "/")
+    assert removed[2][0] == desc.path
+    assert changed[2][1] == {"Descriptors": []}
+
+
+def test_characteristic_signals(app, signals):
+    app.registered = True
+    service = app.find_by_uuid(EchoService.ECHO_SVC_UUID)[0]
+    probe = LatencyProbeCharacteristic(app.connection, 7, service)
+    app.add_characteristic(service, probe)
+    added, changed = signals.take(2)
+    assert added[:2] == ("InterfacesAdded", "/")
+    assert added[2][0] == probe.path
+    assert changed[:2] == ("PropertiesChanged", ECHO)
+    assert changed[2][0] == "org.bluez.GattService1"
+    paths = [f"{ECHO}/char{i}" for i in (0, 1, 2, 3, 7)]
+    assert changed[2][1] == {"Characteristics": paths}
+
+    app.remove_characteristic(service.characteristics[0])
+    # its 2 descriptors go first
+    *removed, changed = signals.take(4)
+    assert {member for member, _, _ in removed} == {"InterfacesRemoved"}
+    assert [args[0] for _, _, args in removed] == [
+        f"{ECHO}/char0/desc0",
+        f"{ECHO}/char0/desc1",
+        f"{ECHO}/char0",
+    ]
+    assert changed[2][1] == {"Characteristics": paths[1:]}
+    # before registration, nothing is emitted
+    app.registered = False
+    app.remove_characteristic(probe)
+    assert signals.take(1) == []
+
+
+def test_flags_cannot_go_stale(app):
+    chrc = app.get_attribute(f"{ECHO}/char0")
+    desc = chrc.descriptors[0]
+    for attr, iface in (
+        (chrc, "org.bluez.GattCharacteristic1"),
+        (desc, "org.bluez.GattDescriptor1"),
+    ):
+        assert isinstance(attr.flags, tuple)
+        flags = attr.get_properties()[iface]["Flags"]
+        with pytest.raises(AttributeError):
+            attr.flags.append("notify")
+        attr.flags = [*attr.flags, "notify"]
+        assert list(attr.get_properties()[iface]["Flags"]) == [*flags, "notify"]
@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+
+"""Tests for `echoez.characteristic`, called over a private bus."""
+
+import logging
+import threading
+
+import pytest
+
+dbus = pytest.importorskip("dbus")
+pytest.importorskip("gi")
+
+import dbus.bus
+import dbus.mainloop.glib
+
+from gi.repository import GLib
+
+from echoez import integrity
+from echoez.characteristic import (
+    BroadcastCharacteristic,
+    EchoCharacteristic,
+    IntegrityEchoCharacteristic,
+    L2capPsmCharacteristic,
+    LatencyProbeCharacteristic,
+)
+from echoez.config import DBUS_PROP_IFACE, GATT_CHRC_IFACE, GATT_DESC_IFACE
+from echoez.err import NotPermittedException
+from echoez.offload import Offloader
+from echoez.service import EchoService
+
+OPTIONS = dbus.Dictionary({"device": "/org/bluez/hci0/dev_A"}, signature="sv")
+
+
+class Client:
+    """Calls methods of ``app`` from another connection, running the loop
+    until each replies"""
+
+    def __init__(self, bus_address, app):
+        self.loop = GLib.MainLoop()
+        self.bus = dbus.bus.BusConnection(
+            bus_address, mainloop=dbus.mainloop.glib.DBusGMainLoop()
+        )
+        self.name = app.connection.get_unique_name()
+
+    def call(self, path, method, *args, interface=GATT_CHRC_IFACE):
+        """Reply of ``method``, or the DBusException it raised"""
+        results = []
+
+        def done(*result):
+            results.append(result)
+            self.loop.quit()
+
+        def failed(error):
+            results.append(error)
+            self.loop.quit()
+
+        obj = self.bus.get_object(self.name, path, introspect=False)
+        obj.get_dbus_method(method, interface)(
+            *args, reply_handler=done, error_handler=failed
+        )
+        self.loop.run()
+        return results[0]
+
+    def drain(self):
+        context = self.loop.get_context()
+        while context.iteration(False):
+            pass
+
+
+@pytest.fixture
+def client(bus_address, app):
+    return Client(bus_address, app)
+
+
+def echo_service(app):
+    return app.find_by_uuid(EchoService.ECHO_SVC_UUID)[0]
+
+
+def test_integrity_echo(app, client):
+    service = echo_service(app)
+    chrc = IntegrityEchoCharacteristic(app.connection, 6, service)
+    app.add_characteristic(service, chrc)
+
+    frame = dbus.ByteArray(integrity.encode(1, b"hello"))
+    assert client.call(chrc.path, "WriteValue", frame, OPTIONS) == ()
+    (value,) = client.call(chrc.path, "ReadValue", OPTIONS)
+    seq, payload = integrity.decode(bytes(value))
+    assert (seq, bytes(payload)) == (1, b"hello")
+
+    error = client.call(chrc.path, "WriteValue", dbus.ByteArray(b"garbage!"), OPTIONS)
+    assert error.get_dbus_name() == "org.bluez.Error.Failed"
+    stats = chrc.get_stats()["integrity"]["devices"][OPTIONS["device"]]
+    assert stats["frames"] == 1
+    assert stats["errors"] == 1
+
+
+def test_broadcast_notifies_once_per_write(app, client):
+    service = echo_service(app)
+    chrc = BroadcastCharacteristic(app.connection, 4, service)
+    app.add_characteristic(service, chrc)
+    values = []
+    client.bus.add_signal_receiver(
+        lambda iface, changed, invalidated: values.append(bytes(changed["Value"])),
+        "PropertiesChanged",
+        DBUS_PROP_IFACE,
+        path=chrc.path,
+    )
+
+    # not notified before StartNotify
+    client.call(chrc.path, "WriteValue", dbus.ByteArray(b"first"), OPTIONS)
+    client.call(chrc.path, "StartNotify")
+    for value in (b"second", b"third"):
+        client.call(chrc.path, "WriteValue", dbus.ByteArray(value), OPTIONS)
+    client.call(chrc.path, "StopNotify")
+    client.call(chrc.path, "WriteValue", dbus.ByteArray(b"fourth"), OPTIONS)
+    client.drain()
+
+    assert values == [b"second", b"third"]
+    assert chrc.get_stats()["broadcast"] == {"published": 2}
+    (value,) = client.call(chrc.path, "ReadValue", OPTIONS)
+    assert bytes(value) == b"fourth"
+
+
+def test_latency_probe_stamps(app, client):
+    service = echo_service(app)
+    chrc = LatencyProbeCharacteristic(app.connection, 7, service)
+    app.add_characteristic(service, chrc)
+
+    client.call(chrc.path, "WriteValue", dbus.ByteArray(b"probe"), OPTIONS)
+    (value,) = client.call(chrc.path, "ReadValue", OPTIONS)
+    value = bytes(value)
+    stamps = LatencyProbeCharacteristic.STAMPS
+    assert len(value) == len(b"probe") + stamps.size == 5 + 16
+    assert value[:5] == b"probe"
+    recv_ns, send_ns = stamps.unpack_from(value, 5)
+    assert 0 < recv_ns <= send_ns
+    processing = chrc.get_stats()["processing_ns"]
+    assert processing["count"] == 1
+    assert processing["max"] == send_ns - recv_ns
+
+
+def test_read_offsets(app, client):
+    service = echo_service(app)
+    chrc = L2capPsmCharacteristic(app.connection, 5, service, 0x81)
+    app.add_characteristic(service, chrc)
+    desc = service.characteristics[0].descriptors[0]
+
+    for path, interface, value in (
+        (chrc.path, GATT_CHRC_IFACE, b"\x81\x00"),
+        (desc.path, GATT_DESC_IFACE, bytes(desc.value)),
+    ):
+        for offset in range(len(value) + 1):
+            options = dbus.Dictionary({"offset": dbus.UInt16(offset)}, signature="sv")
+            reply = client.call(path, "ReadValue", options, interface=interface)
+            assert bytes(reply[0]) == value[offset:]
+        options = dbus.Dictionary(
+            {"offset": dbus.UInt16(len(value) + 1)}, signature="sv"
+        )
+        error = client.call(path, "ReadValue", options, interface=interface)
+        assert error.get_dbus_name() == "org.bluez.Error.InvalidOffset"
+
+
+@pytest.fixture
+def offloader():
+    offloader = Offloader(max_workers=1, max_pending=1)
+    yield offloader
+    offloader.shutdown()
+
+
+def test_offloaded_handlers(app, client, offloader):
+    app.attach_offloader(offloader, [EchoCharacteristic.TEST_CHRC_UUID])
+    chrc = app.find_by_uuid(EchoCharacteristic.TEST_CHRC_UUID)[0]
+    assert chrc.offloader is offloader
+    threads = []
+    read_value = chrc.read_value
+
+    def traced_read_value(options):
+        threads.append(threading.current_thread().name)
+        return read_value(options)
+
+    chrc.read_value = traced_read_value
+
+    assert client.call(chrc.path, "WriteValue", dbus.ByteArray(b"hi"), OPTIONS) == ()
+    (value,) = client.call(chrc.path, "ReadValue", OPTIONS)
+    assert bytes(value) == b"hi"
+    (name,) = threads
+    assert name.startswith("echoez-offload")
+    assert offloader.get_stats()["submitted"] == 2
+
+
+def test_offload_over_max_pending(app, client, offloader):
+    app.attach_offloader(offloader, [EchoCharacteristic.TEST_CHRC_UUID])
+    chrc = app.find_by_uuid(EchoCharacteristic.TEST_CHRC_UUID)[0]
+    gate = threading.Event()
+    replies = []
+    offloader.submit(gate.wait, (), replies.append, replies.append)
+
+    error = client.call(chrc.path, "WriteValue", dbus.ByteArray(b"hi"), OPTIONS)
+    assert error.get_dbus_name() == "org.bluez.Error.Failed"
+    assert offloader.get_stats()["rejected"] == 1
+    gate.set()
+    context = client.loop.get_context()
+    while not replies:
+        context.iteration(True)
+    assert replies == [True]
+    # room again once it has replied
+    assert client.call(chrc.path, "WriteValue", dbus.ByteArray(b"hi"), OPTIONS) == ()
+
+
+def test_offloaded_handler_errors(app, client, offloader):
+    app.attach_offloader(offloader, [EchoCharacteristic.TEST_CHRC_UUID])
+    chrc = app.find_by_uuid(EchoCharacteristic.TEST_CHRC_UUID)[0]
+
+    def write_value(value, options):
+        raise NotPermittedException()
+
+    def read_value(options):
+        raise ValueError("bad")
+
+    chrc.write_value = write_value
+    chrc.read_value = read_value
+
+    error = client.call(chrc.path, "WriteValue", dbus.ByteArray(b"hi"), OPTIONS)
+    assert error.get_dbus_name() == "org.bluez.Error.NotPermitted"
+    error = client.call(chrc.path, "ReadValue", OPTIONS)
+    assert error.get_dbus_name() == "org.freedesktop.DBus.Python.ValueError"
+    assert offloader.get_stats()["failed"] == 2
+
+
+def test_notifying_handlers_are_not_offloaded(app, offloader, caplog):
+    service = echo_service(app)
+    probe = LatencyProbeCharacteristic(app.connection, 7, service)
+    app.add_characteristic(service, probe)
+    uuids = [
+        LatencyProbeCharacteristic.PROBE_CHRC_UUID,
+        BroadcastCharacteristic.BROADCAST_CHRC_UUID,
+        EchoCharacteristic.TEST_CHRC_UUID,
+    ]
+    with caplog.at_level(logging.WARNING, logger="echoez.app"):
+        app.attach_offloader(offloader, uuids)
+    (record,) = caplog.records
+    assert LatencyProbeCharacteristic.PROBE_CHRC_UUID in record.getMessage()
+    assert probe.offloader is None
+
+    # nor when added later
+    broadcast = BroadcastCharacteristic(app.connection, 4, service)
+    app.add_characteristic(service, broadcast)
+    assert broadcast.offloader is None
+    assert app.find_by_uuid(EchoCharacteristic.TEST_CHRC_UUID)[0].offloader
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+
+"""Tests for `echoez.handoff`."""
+
+import os
+import socket
+import tempfile
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("gi")
+
+from gi.repository import GLib
+
+from echoez import handoff
+
+
+def test_decoder_splits_stream():
+    messages = [{"op": "hello"}, {"op": "state", "values": {"/a": "AAE="}}]
+    stream = b"".join(handoff.encode(m) for m in messages)
+    decoder = handoff.Decoder()
+    received = []
+    for i in range(len(stream)):
+        received += decoder.feed(stream[i : i + 1])
+    assert received == messages
+
+
+def test_decoder_rejects_oversized():
+    with pytest.raises(ValueError):
+        handoff.Decoder().feed(handoff.HEADER.pack(handoff.MAX_MESSAGE + 1))
+
+
+def test_no_running_process():
+    with tempfile.TemporaryDirectory() as tmp:
+        assert handoff.HandoffClient.connect(os.path.join(tmp, "sock")) is None
+
+
+def test_handoff():
+    state = {"values": {"/a": "AAE="}, "notifying": ["/b"], "counters": {}}
+    released = []
+    loop = GLib.MainLoop()
+
+    def release():
+        released.append(True)
+        state["values"]["/a"] = "Ag=="
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "sock")
+        server = handoff.HandoffServer(path, lambda: dict(state), release)
+        replies = []
+
+        def new_process():
+            client = handoff.HandoffClient.connect(path)
+            replies.append(client.receive_state())
+            replies.append(client.release())
+            GLib.idle_add(loop.quit)
+
+        thread = threading.Thread(target=new_process)
+        thread.start()
+        GLib.timeout_add_seconds(5, loop.quit)
+        loop.run()
+        thread.join()
+
+        assert released == [True]
+        assert replies[0] == {"op": "state", **state, "values": {"/a": "AAE="}}
+        # state is taken before release
+        assert replies[1]["op"] == "released"
+        # the path is free for the new process to listen on
+        assert not os.path.exists(path)
+        server.close()
+
+
+def test_stale_socket_is_replaced():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "sock")
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(path)
+        stale.close()
+        server = handoff.HandoffServer(path, dict, lambda: None)
+        # a live one is left alone
+        with pytest.raises(OSError):
+            handoff.HandoffServer(path, dict, lambda: None)
+        assert handoff.HandoffClient.connect(path) is not None
+        server.close()
+
+
+def test_slow_reader_does_not_block():
+    state = {"values": {"/a": "A" * (8 << 20)}}
+    loop = GLib.MainLoop()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "sock")
+        server = handoff.HandoffServer(path, lambda: state, lambda: None)
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        client.connect(path)
+        # asks for the state, but doesn't read it yet
+        client.sendall(handoff.encode({"op": "hello"}))
+        started = time.monotonic()
+        GLib.timeout_add(200, loop.quit)
+        loop.run()
+        assert time.monotonic() - started < 1.0
+
+        decoder = handoff.Decoder()
+        replies = []
+        client.setblocking(False)
+        context = GLib.MainContext.default()
+        while not replies:
+            context.iteration(False)
+            try:
+                replies += decoder.feed(client.recv(1 << 16))
+            except BlockingIOError:
+                pass
+        assert replies == [{"op": "state", **state}]
+        client.close()
+        server.close()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+
+"""Tests for `echoez.integrity`."""
+
+import pytest
+
+from echoez import integrity
+
+CHECKSUMS = sorted(integrity.CHECKSUMS)
+
+
+@pytest.mark.parametrize("checksum", CHECKSUMS)
+def test_round_trip(checksum):
+    for payload in (b"", b"x", bytes(range(256)) * 2):
+        frame = integrity.encode(7, payload, checksum)
+        assert len(frame) == integrity.HEADER.size + len(payload)
+        seq, view = integrity.decode(frame, checksum)
+        assert seq == 7
+        assert view == payload
+
+
+@pytest.mark.parametrize("checksum", CHECKSUMS)
+def test_corruption_is_detected(checksum):
+    frame = integrity.encode(1, b"payload", checksum)
+    for i in range(len(frame)):
+        corrupt = bytearray(frame)
+        corrupt[i] ^= 0x10
+        with pytest.raises(ValueError):
+            integrity.decode(bytes(corrupt), checksum)
+    with pytest.raises(ValueError):
+        integrity.decode(frame[:7], checksum)
+
+
+def test_checker_counts_per_device():
+    checker = integrity.IntegrityChecker()
+    for seq in (0, 1, 4, 5, 3, 9):
+        checker.check("a", integrity.encode(seq, b"a"))
+    checker.check("b", integrity.encode(100, b"b"))
+    with pytest.raises(ValueError):
+        checker.check("b", b"\x00" * 8 + b"b")
+    stats = checker.get_stats()
+    assert stats["devices"]["a"] == {
+        "frames": 6,
+        "errors": 0,
+        "gaps": 2,
+        "lost": 2 + 3,
+        "stale": 1,
+    }
+    assert stats["devices"]["b"]["errors"] == 1
+    assert stats["errors"] == 1
+    assert stats["gaps"] == 2
+
+
+def test_sequence_wraps_around():
+    checker = integrity.IntegrityChecker()
+    for seq in (0xFFFFFFFE, 0xFFFFFFFF, 0, 1):
+        checker.check("a", integrity.encode(seq, b""))
+    assert checker.get_stats()["devices"]["a"]["gaps"] == 0
+    assert checker.get_stats()["devices"]["a"]["stale"] == 0
+
+
+def test_echo_has_fresh_checksum():
+    checker = integrity.IntegrityChecker()
+    seq, payload = checker.check("a", integrity.encode(3, b"echo"))
+    assert integrity.decode(checker.echo(seq, payload)) == (3, b"echo")
+
+
+def test_unknown_checksum():
+    with pytest.raises(ValueError):
+        integrity.IntegrityChecker("md5")
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+
+"""Tests for `echoez.l2cap`, over AF_UNIX instead of a radio."""
+
+import os
+import socket
+import tempfile
+
+import pytest
+
+from echoez import l2cap
+
+
+@pytest.fixture
+def engine():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "l2cap")
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        listener.bind(path)
+        listener.listen()
+        engine = l2cap.EchoEngine(listener, bufsize=1024, max_connections=2)
+        engine.path = path
+        yield engine
+        engine.close()
+
+
+def connect(engine):
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+    client.settimeout(1.0)
+    client.connect(engine.path)
+    engine.poll(1.0)
+    return client
+
+
+def test_echo(engine):
+    client = connect(engine)
+    for packet in (b"a", b"echo" * 100, bytes(range(256))):
+        client.send(packet)
+        engine.poll(1.0)
+        # packet boundaries are kept
+        assert client.recv(2048) == packet
+    client.close()
+    engine.poll(1.0)
+    assert engine.get_stats() == {
+        "connections": 0,
+        "accepted": 1,
+        "refused": 0,
+        "packets": 3,
+        "bytes": 1 + 400 + 256,
+        "blocked": 0,
+    }
+
+
+def test_connections_are_independent(engine):
+    first = connect(engine)
+    second = connect(engine)
+    first.send(b"first")
+    second.send(b"second")
+    while engine.poll(0.1):
+        pass
+    assert second.recv(64) == b"second"
+    assert first.recv(64) == b"first"
+    # beyond max_connections
+    third = connect(engine)
+    assert third.recv(64) == b""
+    assert engine.get_stats()["refused"] == 1
+
+
+def test_slow_peer_is_not_read(engine):
+    client = connect(engine)
+    client.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    # without reading, the echoes eventually block
+    client.setblocking(False)
+    sent = 0
+    while not engine.get_stats()["blocked"] and sent < 10000:
+        try:
+            client.send(b"x" * 512)
+        except BlockingIOError:
+            break
+        sent += 1
+        engine.poll(0)
+    assert engine.get_stats()["blocked"]
+    received = 0
+    client.settimeout(1.0)
+    while received < sent:
+        assert client.recv(1024) == b"x" * 512
+        received += 1
+        engine.poll(0)
+    assert engine.get_stats()["packets"] == sent
+
+
+@pytest.mark.parametrize("psm", [0x1, 0x7F, 0x100, 0x1001])
+def test_listener_rejects_non_le_psm(psm):
+    with pytest.raises(ValueError):
+        l2cap.l2cap_listener(psm)
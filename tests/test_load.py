@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+
+"""Tests for `echoez.load`, against a fake BlueZ on a private bus."""
+
+import pytest
+
+dbus = pytest.importorskip("dbus")
+pytest.importorskip("gi")
+
+import dbus.bus
+import dbus.mainloop.glib
+import dbus.service
+
+from gi.repository import GLib
+
+from echoez import load
+from echoez.config import *
+from echoez.characteristic import (
+    EchoCharacteristic,
+    LatencyProbeCharacteristic,
+)
+from echoez.service import EchoService
+
+ADAPTER = "/org/bluez/hci0"
+ADDRESSES = ("00:11:22:33:44:55", "66:77:88:99:AA:BB", "CC:DD:EE:FF:00:11")
+
+
+class FakeObjectManager(dbus.service.Object):
+    def __init__(self, bus):
+        self.objects = {}
+        dbus.service.Object.__init__(self, bus, "/")
+
+    def add(self, path, interfaces):
+        self.objects[path] = interfaces
+        self.InterfacesAdded(path, interfaces)
+
+    @dbus.service.method(DBUS_OM_IFACE, out_signature="a{oa{sa{sv}}}")
+    def GetManagedObjects(self):
+        return self.objects
+
+    @dbus.service.signal(DBUS_OM_IFACE, signature="oa{sa{sv}}")
+    def InterfacesAdded(self, path, interfaces):
+        pass
+
+
+class FakeCharacteristic(dbus.service.Object):
+    def __init__(self, bus, path, uuid):
+        self.value = dbus.ByteArray(b"")
+        self.notifying = False
+        # characteristic whose PropertiesChanged carries our notifications
+        self.notifier = self
+        self.props = {"UUID": uuid, "Flags": dbus.Array(["read"], signature="s")}
+        dbus.service.Object.__init__(self, bus, path)
+
+    @dbus.service.method(GATT_CHRC_IFACE, in_signature="a{sv}", out_signature="ay")
+    def ReadValue(self, options):
+        return self.value
+
+    @dbus.service.method(GATT_CHRC_IFACE, in_signature="aya{sv}")
+    def WriteValue(self, value, options):
+        self.value = dbus.ByteArray(bytes(value))
+        if self.notifying:
+            self.notifier.PropertiesChanged(GATT_CHRC_IFACE, {"Value": self.value}, [])
+
+    @dbus.service.method(GATT_CHRC_IFACE)
+    def StartNotify(self):
+        self.notifying = True
+
+    @dbus.service.method(GATT_CHRC_IFACE)
+    def StopNotify(self):
+        self.notifying = False
+
+    @dbus.service.signal(DBUS_PROP_IFACE, signature="sa{sv}as")
+    def PropertiesChanged(self, interface, changed, invalidated):
+        pass
+
+
+class FakeDevice(dbus.service.Object):
+    # notifications come from the wrong characteristic, so are never seen
+    misroute = False
+
+    def __init__(self, bus, om, address):
+        self.bus = bus
+        self.om = om
+        self.path = f"{ADAPTER}/dev_{address.replace(':', '_')}"
+        self.props = {
+            "Address": address,
+            "UUIDs": dbus.Array([EchoService.ECHO_SVC_UUID], signature="s"),
+            "Connected": False,
+            "ServicesResolved": False,
+        }
+        self.chrcs = []
+        dbus.service.Object.__init__(self, bus, self.path)
+
+    @dbus.service.method(DEVICE_IFACE)
+    def Connect(self):
+        GLib.idle_add(self._resolve)
+
+    @dbus.service.method(DEVICE_IFACE)
+    def Disconnect(self):
+        self.PropertiesChanged(DEVICE_IFACE, {"Connected": False}, [])
+
+    def _resolve(self):
+        for i, uuid in enumerate(
+            (
+                EchoCharacteristic.TEST_CHRC_UUID,
+                LatencyProbeCharacteristic.PROBE_CHRC_UUID,
+            )
+        ):
+            chrc = FakeCharacteristic(
+                self.bus, f"{self.path}/service0001/char{i:04x}", uuid
+            )
+            self.chrcs.append(chrc)
+            self.om.add(chrc._object_path, {GATT_CHRC_IFACE: chrc.props})
+        if self.misroute:
+            self.chrcs[1].notifier = self.chrcs[0]
+        self.PropertiesChanged(
+            DEVICE_IFACE, {"Connected": True, "ServicesResolved": True}, []
+        )
+        return False
+
+    @dbus.service.signal(DBUS_PROP_IFACE, signature="sa{sv}as")
+    def PropertiesChanged(self, interface, changed, invalidated):
+        pass
+
+
+class FakeAdapter(dbus.service.Object):
+    def __init__(self, bus, om):
+        self.bus = bus
+        self.om = om
+        om.objects[ADAPTER] = {ADAPTER_IFACE: {}, GATT_MANAGER_IFACE: {}}
+        self.devices = []
+        dbus.service.Object.__init__(self, bus, ADAPTER)
+
+    @dbus.service.method(ADAPTER_IFACE, in_signature="a{sv}")
+    def SetDiscoveryFilter(self, properties):
+        pass
+
+    @dbus.service.method(ADAPTER_IFACE)
+    def StartDiscovery(self):
+        for address in ADDRESSES:
+            device = FakeDevice(self.bus, self.om, address)
+            self.devices.append(device)
+            self.om.add(device.path, {DEVICE_IFACE: device.props})
+
+    @dbus.service.method(ADAPTER_IFACE)
+    def StopDiscovery(self):
+        pass
+
+
+@pytest.fixture
+def bluez(bus_address):
+    dbus.mainloop.glib.DBusGMainLoop(set_as_default=True)
+    bluez_bus = dbus.bus.BusConnection(bus_address)
+    adapter = FakeAdapter(bluez_bus, FakeObjectManager(bluez_bus))
+    # the name is released once this is collected
+    adapter.bus_name = dbus.service.BusName(BLUEZ_SERVICE_NAME, bluez_bus)
+    return adapter
+
+
+@pytest.mark.parametrize("workload", load.WORKLOADS)
+def test_load(bus_address, bluez, workload):
+    gen = load.LoadGenerator(
+        dbus.bus.BusConnection(bus_address),
+        devices=2,
+        workload=workload,
+        depth=4,
+        duration=0.2,
+        discovery_timeout=5,
+        connect_timeout=5,
+    )
+    stats = gen.run()
+
+    assert stats["total"]["devices"] == 2
+    assert stats["total"]["ops"] > 0
+    assert stats["total"]["errors"] == 0
+    for device in stats["devices"].values():
+        assert device["state"] == "done"
+        assert device["latency_ns"]["count"] == device["ops"]
+
+
+def test_lost_notifications(bus_address, bluez, monkeypatch):
+    monkeypatch.setattr(FakeDevice, "misroute", True)
+    gen = load.LoadGenerator(
+        dbus.bus.BusConnection(bus_address),
+        devices=1,
+        workload="notify",
+        depth=4,
+        duration=0.2,
+        discovery_timeout=5,
+        connect_timeout=5,
+        op_timeout=0.2,
+    )
+    # would hang once depth notifications are in flight
+    stats = gen.run()
+
+    (device,) = stats["devices"].values()
+    assert device["state"] == "done"
+    assert device["ops"] == 0
+    assert device["lost"] >= 4
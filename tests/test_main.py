@@ -0,0 +1,24 @@
+#!/usr/bin/env python
+
+"""Tests for `echoez.main`."""
+
+import pytest
+
+dbus = pytest.importorskip("dbus")
+pytest.importorskip("gi")
+
+import dbus.bus
+
+from echoez import main
+
+
+def test_missing_adapter_starts_nothing(bus_address, monkeypatch, tmp_path):
+    monkeypatch.setattr(
+        main.dbus, "SystemBus", lambda: dbus.bus.BusConnection(bus_address)
+    )
+    monkeypatch.setattr(main, "find_adapter", lambda bus, adapter: None)
+    files = {
+        arg: str(tmp_path / arg) for arg in ("record", "state_file", "aggregate_to")
+    }
+    assert main.start("echoez", adapter="hci9", aggregate=["uuid"], **files) == -1
+    assert list(tmp_path.iterdir()) == []
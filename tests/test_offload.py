@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+
+"""Tests for `echoez.offload`."""
+
+import threading
+
+import pytest
+
+pytest.importorskip("dbus")
+pytest.importorskip("gi")
+
+from gi.repository import GLib
+
+from echoez.err import FailedException
+from echoez.offload import Offloader
+
+
+class Handlers:
+    """Reply and error handlers, noting the thread each was called on"""
+
+    def __init__(self):
+        self.results = []
+        self.errors = []
+        self.threads = []
+
+    def reply(self, result):
+        self.threads.append(threading.current_thread())
+        self.results.append(result)
+
+    def error(self, error):
+        self.threads.append(threading.current_thread())
+        self.errors.append(error)
+
+    def wait(self, count):
+        expired = []
+        timeout = GLib.timeout_add(2000, expired.append, True)
+        context = GLib.MainContext.default()
+        while len(self.results) + len(self.errors) < count and not expired:
+            context.iteration(True)
+        if not expired:
+            GLib.source_remove(timeout)
+        assert len(self.results) + len(self.errors) == count
+
+
+@pytest.fixture
+def offloader():
+    offloader = Offloader(max_workers=2, max_pending=2)
+    yield offloader
+    offloader.shutdown()
+
+
+def test_results_are_delivered_on_the_main_loop(offloader):
+    handlers = Handlers()
+    offloader.submit(
+        lambda a, b: (threading.current_thread().name, a + b),
+        (1, 2),
+        handlers.reply,
+        handlers.error,
+    )
+    assert offloader.get_stats()["pending"] == 1
+    handlers.wait(1)
+    ((name, result),) = handlers.results
+    assert name.startswith("echoez-offload")
+    assert result == 3
+    assert handlers.threads == [threading.main_thread()]
+    assert offloader.get_stats() == {
+        "pending": 0,
+        "submitted": 1,
+        "rejected": 0,
+        "failed": 0,
+    }
+
+
+def test_over_max_pending_is_rejected(offloader):
+    handlers = Handlers()
+    gate = threading.Event()
+    for _ in range(2):
+        offloader.submit(gate.wait, (), handlers.reply, handlers.error)
+    with pytest.raises(FailedException):
+        offloader.submit(gate.wait, (), handlers.reply, handlers.error)
+    gate.set()
+    handlers.wait(2)
+    # room again once the pending calls have replied
+    offloader.submit(gate.wait, (), handlers.reply, handlers.error)
+    handlers.wait(3)
+    assert handlers.results == [True] * 3
+    stats = offloader.get_stats()
+    assert (stats["submitted"], stats["rejected"]) == (3, 1)
+
+
+def test_exceptions_go_to_the_error_handler(offloader):
+    handlers = Handlers()
+
+    def fail():
+        raise ValueError("bad")
+
+    offloader.submit(fail, (), handlers.reply, handlers.error)
+    handlers.wait(1)
+    (error,) = handlers.errors
+    assert isinstance(error, ValueError)
+    assert handlers.threads == [threading.main_thread()]
+    assert offloader.get_stats()["failed"] == 1
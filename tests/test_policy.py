@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+
+"""Tests for `echoez.policy`."""
+
+from echoez import policy
+
+DEVICE = "/org/bluez/hci0/dev_00_11_22_33_44_55"
+OTHER = "/org/bluez/hci0/dev_66_77_88_99_AA_BB"
+
+
+def test_device_address():
+    assert policy.device_address(DEVICE) == "00:11:22:33:44:55"
+
+
+def test_rejects_by_default():
+    p = policy.PairingPolicy()
+    assert not any(p.decide(DEVICE, request) for request in policy.REQUESTS)
+
+
+def test_allowlists():
+    p = policy.PairingPolicy(allow=["00:11:22:33:44:55"])
+    assert p.decide(DEVICE, policy.CONFIRMATION)
+    assert not p.decide(OTHER, policy.CONFIRMATION)
+
+    p = policy.PairingPolicy(allow_oui=["66-77-88"])
+    assert p.decide(OTHER, policy.PASSKEY)
+    assert not p.decide(DEVICE, policy.PASSKEY)
+
+
+def test_auto_accept():
+    p = policy.PairingPolicy(auto_accept=[policy.AUTHORIZATION])
+    assert p.decide(OTHER, policy.AUTHORIZATION)
+    assert not p.decide(OTHER, policy.AUTHORIZE_SERVICE)
+    assert p.get_stats() == {"accepted": 1, "rejected": 1}
+
+
+def test_cache_is_bounded():
+    p = policy.PairingPolicy(auto_accept=[policy.AUTHORIZATION], max_cache=8)
+    for i in range(100):
+        p.decide(f"/org/bluez/hci0/dev_00_00_00_00_00_{i:02X}", policy.AUTHORIZATION)
+    assert len(p._cache) <= 8
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+
+"""Tests for `echoez.profiling`."""
+
+import os
+import pstats
+import time
+import tracemalloc
+
+import pytest
+
+pytest.importorskip("gi")
+
+from echoez.profiling import Profiler
+
+
+def busy(seconds=0.05):
+    """Keep the main thread in a recognizable frame for a while"""
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        sum(range(1000))
+
+
+@pytest.fixture
+def no_tracemalloc():
+    was_tracing = tracemalloc.is_tracing()
+    tracemalloc.stop()
+    yield
+    if was_tracing:
+        tracemalloc.start()
+
+
+def test_cprofile_toggle(tmp_path):
+    profiler = Profiler(str(tmp_path), mode="cprofile")
+    paths = []
+    for _ in range(2):
+        assert profiler.toggle() is None
+        assert profiler.running
+        busy(0.01)
+        paths.append(profiler.toggle())
+        assert not profiler.running
+    assert len(set(paths)) == 2
+    for path in paths:
+        assert path.endswith(".prof")
+        functions = {func for _, _, func in pstats.Stats(path).stats}
+        assert "busy" in functions
+    # stopping when stopped does nothing
+    assert profiler.stop() is None
+
+
+def test_sample_toggle(tmp_path):
+    profiler = Profiler(str(tmp_path), mode="sample", sample_interval=0.001)
+    paths = []
+    for _ in range(2):
+        profiler.start()
+        # starting twice doesn't start another sampler
+        profiler.start()
+        busy()
+        paths.append(profiler.stop())
+    assert len(set(paths)) == 2
+    for path in paths:
+        assert path.endswith(".folded")
+        with open(path) as f:
+            lines = f.read().splitlines()
+        assert lines
+        assert all(int(line.rsplit(" ", 1)[1]) > 0 for line in lines)
+        assert any("busy (test_profiling.py" in line for line in lines)
+
+
+def test_bad_mode(tmp_path):
+    with pytest.raises(ValueError):
+        Profiler(str(tmp_path), mode="perf")
+
+
+def test_snapshot_memory(tmp_path, no_tracemalloc):
+    assert Profiler(str(tmp_path)).snapshot_memory() is None
+    assert os.listdir(tmp_path) == []
+
+    profiler = Profiler(str(tmp_path), tracemalloc_frames=1)
+    try:
+        path = profiler.snapshot_memory()
+    finally:
+        tracemalloc.stop()
+    assert path.endswith(".tracemalloc")
+    assert tracemalloc.Snapshot.load(path).traceback_limit == 1
+
+
+def test_app_methods(app, tmp_path):
+    from echoez.err import NotSupportedException
+
+    for method in (app.StartProfiling, app.StopProfiling, app.SnapshotMemory):
+        with pytest.raises(NotSupportedException):
+            method()
+
+    app.profiler = Profiler(str(tmp_path))
+    app.StartProfiling()
+    assert app.profiler.running
+    path = app.StopProfiling()
+    assert os.path.exists(path)
+    # D-Bus can't return None
+    assert app.StopProfiling() == ""
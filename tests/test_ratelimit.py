@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+
+"""Tests for `echoez.ratelimit`."""
+
+from echoez import ratelimit
+
+DEVICE = "/org/bluez/hci0/dev_00_11_22_33_44_55"
+OTHER = "/org/bluez/hci0/dev_66_77_88_99_AA_BB"
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_unlimited():
+    limiter = ratelimit.RateLimiter()
+    assert all(limiter.allow_write(DEVICE, 512) for _ in range(1000))
+    assert all(limiter.allow_read(DEVICE) for _ in range(1000))
+
+
+def test_per_device_rate():
+    clock = Clock()
+    limiter = ratelimit.RateLimiter(write_rate=10, clock=clock)
+    assert sum(limiter.allow_write(DEVICE, 1) for _ in range(100)) == 10
+    # another device has its own bucket
+    assert limiter.allow_write(OTHER, 1)
+    clock.now = 0.5
+    assert sum(limiter.allow_write(DEVICE, 1) for _ in range(100)) == 5
+    stats = limiter.get_stats()
+    assert stats["throttled_writes"] == 185
+    assert stats["devices"] == {DEVICE: {"throttled_reads": 0, "throttled_writes": 185}}
+
+
+def test_global_rate():
+    limiter = ratelimit.RateLimiter(global_read_rate=4, clock=Clock())
+    allowed = [limiter.allow_read(d) for d in (DEVICE, OTHER) * 3]
+    assert allowed == [True, True, True, True, False, False]
+
+
+def test_byte_rate():
+    clock = Clock()
+    limiter = ratelimit.RateLimiter(byte_rate=100, clock=clock)
+    assert limiter.allow_write(DEVICE, 60)
+    assert not limiter.allow_write(DEVICE, 60)
+    # a rejected write takes nothing
+    assert limiter.allow_write(DEVICE, 40)
+    # larger than the bucket, allowed when it's full
+    clock.now = 10
+    assert limiter.allow_write(DEVICE, 500)
+    clock.now = 11
+    assert not limiter.allow_write(DEVICE, 1)
+
+
+def test_read_byte_rate():
+    clock = Clock()
+    limiter = ratelimit.RateLimiter(
+        read_byte_rate=100, global_read_byte_rate=150, clock=clock
+    )
+    assert limiter.allow_read(DEVICE)
+    limiter.charge_read(DEVICE, 120)
+    # in debt until refilled
+    assert not limiter.allow_read(DEVICE)
+    assert limiter.allow_read(OTHER)
+    limiter.charge_read(OTHER, 60)
+    # the global bucket is empty too
+    assert not limiter.allow_read(OTHER)
+    clock.now = 0.5
+    assert limiter.allow_read(DEVICE)
+    assert limiter.get_stats()["throttled_reads"] == 2
+
+
+def test_devices_are_bounded():
+    limiter = ratelimit.RateLimiter(read_rate=1, max_devices=8, clock=Clock())
+    for i in range(100):
+        limiter.allow_read(f"/org/bluez/hci0/dev_00_00_00_00_00_{i:02X}")
+    assert len(limiter._devices) <= 8
+
+
+def test_least_recently_seen_device_is_dropped():
+    limiter = ratelimit.RateLimiter(write_rate=1, max_devices=2, clock=Clock())
+    assert limiter.allow_write(DEVICE, 1)
+    assert limiter.allow_write(OTHER, 1)
+    # DEVICE is seen again, and is kept in debt when a third one comes
+    assert not limiter.allow_write(DEVICE, 1)
+    assert limiter.allow_write("/org/bluez/hci0/dev_third", 1)
+    assert not limiter.allow_write(DEVICE, 1)
+    assert OTHER not in limiter._devices
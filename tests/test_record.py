@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+
+"""Tests for `echoez.record`."""
+
+from echoez import record
+
+
+def test_roundtrip(tmp_path):
+    """Records written by the background thread read back through mmap."""
+    path = str(tmp_path / "traffic.rec")
+    recorder = record.Recorder(path)
+    recorder.record(
+        record.WRITE,
+        "/org/bluez/example/service2/char0",
+        "/org/bluez/hci0/dev_00_11_22_33_44_55",
+        {"offset": 0, "type": "request"},
+        [0x45, 0x63, 0x68, 0x6F],
+    )
+    recorder.record(record.START_NOTIFY, "/org/bluez/example/service2/char3")
+    recorder.close()
+
+    records = list(record.iter_records(record.open_records(path)))
+    assert [r.op for r in records] == [
+        record.SESSION,
+        record.WRITE,
+        record.START_NOTIFY,
+    ]
+    write = records[1]
+    assert write.device == "/org/bluez/hci0/dev_00_11_22_33_44_55"
+    assert write.path == "/org/bluez/example/service2/char0"
+    assert write.options == {"offset": 0, "type": "request"}
+    assert bytes(write.payload) == b"Echo"
+    assert records[2].timestamp_ns >= write.timestamp_ns
+
+
+def test_append_sessions(tmp_path):
+    """Reopening a recording appends a new session instead of truncating."""
+    path = str(tmp_path / "traffic.rec")
+    for _ in range(2):
+        recorder = record.Recorder(path)
+        recorder.record(record.READ, "/org/bluez/example/service2/char0")
+        recorder.close()
+
+    ops = [r.op for r in record.iter_records(record.open_records(path))]
+    assert ops == [record.SESSION, record.READ] * 2
+
+
+def test_oversized_options_are_dropped(tmp_path):
+    """Options too long for the header are dropped, not a struct.error."""
+    path = str(tmp_path / "traffic.rec")
+    recorder = record.Recorder(path)
+    options = {"blob": "x" * record.MAX_FIELD}
+    recorder.record(record.WRITE, "/org/bluez/example/service2/char0", "", options)
+    recorder.record(record.READ, "/org/bluez/example/service2/char0")
+    recorder.close()
+
+    ops = [r.op for r in record.iter_records(record.open_records(path))]
+    assert ops == [record.SESSION, record.READ]
+    assert recorder.get_stats() == {"recorded": 2, "dropped": 1}
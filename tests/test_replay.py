@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+
+"""Tests for `echoez.replay`."""
+
+import logging
+
+import pytest
+
+dbus = pytest.importorskip("dbus")
+pytest.importorskip("gi")
+
+import dbus.bus
+import dbus.mainloop.glib
+
+from gi.repository import GLib
+
+from echoez.main import build_app
+from echoez.ratelimit import RateLimiter
+from echoez.record import READ, SESSION, WRITE, Record
+from echoez.replay import Replayer
+
+CHRC = "/org/bluez/example/service2/char0"
+BROADCAST = "/org/bluez/example/service2/char4"
+SYNTHETIC = "/org/bluez/example/service10/char0"
+OPTIONAL = [
+    Record(0, SESSION, "", "", {}, memoryview(b"")),
+    Record(1, WRITE, "", BROADCAST, {}, memoryview(b"a")),
+    Record(2, READ, "", SYNTHETIC, {}, memoryview(b"")),
+    Record(3, READ, "", SYNTHETIC, {}, memoryview(b"")),
+]
+
+
+def replay(app, records):
+    loop = GLib.MainLoop()
+    replayer = Replayer(app, records, loop, speed=0)
+    replayer.start()
+    GLib.timeout_add_seconds(5, loop.quit)
+    loop.run()
+    return replayer
+
+
+def test_errors_are_not_replayed(app):
+    # the second write is rate limited
+    app.attach_limiter(RateLimiter(global_write_rate=1))
+    records = [
+        Record(0, SESSION, "", "", {}, memoryview(b"")),
+        Record(1, WRITE, "", CHRC, {}, memoryview(b"a")),
+        Record(2, WRITE, "", CHRC, {}, memoryview(b"b")),
+        Record(3, READ, "", CHRC, {}, memoryview(b"")),
+        Record(4, READ, "", "/org/bluez/example/nothing", {}, memoryview(b"")),
+    ]
+    replayer = replay(app, records)
+    assert (replayer.replayed, replayer.errors, replayer.skipped) == (2, 1, 1)
+
+
+def test_unknown_paths_are_warned_about(app, caplog):
+    caplog.set_level(logging.WARNING, logger="echoez.replay")
+    replayer = replay(app, OPTIONAL)
+    assert (replayer.replayed, replayer.skipped) == (0, 3)
+    assert replayer.unknown_paths == {BROADCAST, SYNTHETIC}
+    # once per path
+    broadcast, synthetic = caplog.records
+    assert BROADCAST in broadcast.getMessage()
+    assert SYNTHETIC in synthetic.getMessage()
+
+
+def test_optional_characteristics_are_replayed(bus_address):
+    bus = dbus.bus.BusConnection(
+        bus_address, mainloop=dbus.mainloop.glib.DBusGMainLoop()
+    )
+    app = build_app(
+        bus, "echoez", broadcast=True, synthetic=1, synthetic_characteristics=1
+    )
+    replayer = replay(app, OPTIONAL)
+    assert (replayer.replayed, replayer.skipped, replayer.errors) == (3, 0, 0)
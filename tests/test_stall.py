@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+
+"""Tests for `echoez.stall`."""
+
+import time
+
+import pytest
+
+pytest.importorskip("gi")
+
+from gi.repository import GLib
+
+from echoez.stall import StallMonitor
+
+
+def test_stall_is_measured_and_caught():
+    loop = GLib.MainLoop()
+    monitor = StallMonitor(interval_ms=5, threshold_ms=50)
+
+    def block_the_loop():
+        time.sleep(0.3)
+        return False
+
+    GLib.timeout_add(50, block_the_loop)
+    GLib.timeout_add(500, loop.quit)
+    monitor.start()
+    loop.run()
+    monitor.stop()
+
+    stats = monitor.get_stats()
+    assert stats["stalls"] == 1
+    assert stats["lag_ns"]["max"] >= 250e6
+    assert stats["lag_ns"]["count"] > 10
+    # caught in the act
+    assert len(stats["stacks"]) == 1
+    assert "block_the_loop" in stats["stacks"][0]
+    assert not monitor.running
@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+
+"""Tests for `echoez.stats`."""
+
+from echoez.stats import Histogram
+
+
+def test_buckets():
+    histogram = Histogram()
+    for value in (0, 1, 2, 3, 4, 1000, -5):
+        histogram.add(value)
+    stats = histogram.as_dict()
+    # negative samples count as 0, buckets are keyed by upper bound
+    assert stats["buckets"] == {0: 2, 1: 1, 3: 2, 7: 1, 1023: 1}
+    assert (stats["count"], stats["min"], stats["max"]) == (7, 0, 1000)
+    assert stats["mean"] == 1010 // 7
+
+
+def test_percentiles():
+    histogram = Histogram()
+    for value in range(1, 101):
+        histogram.add(value)
+    assert histogram.percentile(50) == 63
+    assert histogram.percentile(90) == 100
+    # capped by the largest sample
+    assert histogram.percentile(99) == 100
+    assert Histogram().percentile(50) == 0
+
+
+def test_huge_samples_share_the_last_bucket():
+    histogram = Histogram()
+    histogram.add(1 << 70)
+    histogram.add(1 << 80)
+    assert histogram.buckets[-1] == 2
+
+
+def test_merge():
+    a, b = Histogram(), Histogram()
+    a.add(5)
+    b.add(1)
+    b.add(100)
+    a.merge(b)
+    assert a.as_dict()["buckets"] == {1: 1, 7: 1, 127: 1}
+    assert (a.count, a.min, a.max, a.total) == (3, 1, 100, 106)
+    a.clear()
+    assert a.count == 0 and a.min is None
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+
+"""Tests for `echoez.store`."""
+
+from echoez.store import Store
+
+
+def test_restore(tmp_path):
+    """Values put before close are loaded by the next Store."""
+    path = str(tmp_path / "state")
+    store = Store(path)
+    store.put("/org/bluez/example/service2/char0", [0x45, 0x63, 0x68, 0x6F])
+    store.put("/org/bluez/example/service2/char0/desc1", b"first")
+    store.put("/org/bluez/example/service2/char0/desc1", b"second")
+    store.close()
+
+    store = Store(path)
+    assert store.get("/org/bluez/example/service2/char0") == b"Echo"
+    assert store.get("/org/bluez/example/service2/char0/desc1") == b"second"
+    assert store.get("/missing") is None
+    store.close()
+
+
+def test_compaction(tmp_path):
+    """Overwriting one key many times doesn't grow the log without bound."""
+    path = tmp_path / "state"
+    store = Store(str(path), compact_min_bytes=0)
+    for i in range(1000):
+        store.put("key", b"%d" % i)
+        if i % 100 == 0:
+            store.flush()
+    store.close()
+
+    assert path.stat().st_size < 100
+    assert Store(str(path)).get("key") == b"999"
+
+
+def test_torn_tail(tmp_path):
+    """A partially written record at the end of the log is dropped."""
+    path = tmp_path / "state"
+    store = Store(str(path))
+    store.put("key", b"value")
+    store.close()
+    with open(str(path), "ab") as f:
+        f.write(b"\x03\x00\x10")
+
+    store = Store(str(path))
+    assert store.get("key") == b"value"
+    store.put("other", b"ok")
+    store.close()
+    assert Store(str(path)).get("other") == b"ok"
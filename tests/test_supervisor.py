@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+
+"""Tests for `echoez.supervisor`, with fake workers."""
+
+import logging
+import multiprocessing
+import os
+import time
+
+import pytest
+
+pytest.importorskip("dbus")
+
+from echoez import supervisor
+
+
+def report_and_exit(conn, name, adapter, stats_interval, kwargs):
+    conn.send(("stats", {"adapter": adapter, "reads": 1, "latency": {"min": 5}}))
+    raise SystemExit(kwargs.get("code", 0))
+
+
+def hang(conn, name, adapter, stats_interval, kwargs):
+    conn.send(("stats", {"pid": os.getpid()}))
+    time.sleep(60)
+
+
+def report_log_level(conn, name, adapter, stats_interval, kwargs):
+    conn.send(("stats", {"level": logging.getLogger().level}))
+
+
+def run_until(sup, done, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not done():
+        assert time.monotonic() < deadline
+        sup._check(time.monotonic())
+        sup._poll(0.05)
+
+
+def test_merge_stats():
+    total = {}
+    supervisor.merge_stats(total, {"reads": 1, "lat": {"min": 5, "max": 9, "p50": 7}})
+    supervisor.merge_stats(total, {"reads": 2, "lat": {"min": 3, "max": 8, "p50": 4}})
+    assert total == {"reads": 3, "lat": {"min": 3, "max": 9}}
+
+
+def test_workers_are_forked_and_restarted():
+    sup = supervisor.Supervisor(
+        "echoez",
+        ["hci0", "hci1"],
+        max_backoff=0.1,
+        target=report_and_exit,
+        code=3,
+    )
+    run_until(sup, lambda: all(w.restarts >= 3 for w in sup.workers))
+    for w in sup.workers:
+        assert w.stats["adapter"] == w.adapter
+        # capped backoff
+        assert w.next_start - time.monotonic() <= 0.1
+    assert sup.get_stats()["total"] == {"reads": 2, "latency": {"min": 5}}
+    sup._shutdown()
+
+
+def test_backoff_doubles():
+    sup = supervisor.Supervisor("echoez", ["hci0"], target=report_and_exit)
+    w = sup.workers[0]
+    run_until(sup, lambda: w.restarts == 1)
+    assert 0.5 < w.next_start - time.monotonic() <= 1.0
+    # not started again before it's due
+    sup._check(time.monotonic())
+    assert w.process is None
+    sup._check(w.next_start)
+    run_until(sup, lambda: w.restarts == 2)
+    assert 1.5 < w.next_start - time.monotonic() <= 2.0
+    sup._shutdown()
+
+
+def test_unresponsive_worker_is_killed_once():
+    sup = supervisor.Supervisor("echoez", ["hci0"], heartbeat_timeout=0.2, target=hang)
+    w = sup.workers[0]
+    run_until(sup, lambda: "pid" in w.stats)
+    process = w.process
+    kills = []
+    kill = process.kill
+    process.kill = lambda: kills.append(time.monotonic())
+    for _ in range(10):
+        sup._check(time.monotonic() + 1.0)
+    assert len(kills) == 1
+    kill()
+    run_until(sup, lambda: w.restarts == 1)
+    assert process.exitcode == -9
+    assert not w.killed
+    sup._shutdown()
+
+
+def test_workers_keep_the_log_level(monkeypatch):
+    # as with the default start method of Python 3.14
+    monkeypatch.setattr(
+        multiprocessing, "Process", multiprocessing.get_context("forkserver").Process
+    )
+    root = logging.getLogger()
+    monkeypatch.setattr(root, "level", logging.DEBUG)
+    sup = supervisor.Supervisor("echoez", ["hci0"], target=report_log_level)
+    w = sup.workers[0]
+    run_until(sup, lambda: w.stats)
+    assert w.stats == {"level": logging.DEBUG}
+    sup._shutdown()
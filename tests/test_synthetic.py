@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+
+"""Tests for `echoez.synthetic`."""
+
+import gc
+
+import pytest
+
+pytest.importorskip("dbus")
+pytest.importorskip("gi")
+
+from echoez.config import GATT_CHRC_IFACE, GATT_DESC_IFACE
+from echoez.err import InvalidOffsetException, UnknownObjectException
+from echoez.synthetic import SyntheticDescriptor, SyntheticService, synthetic_uuid
+
+
+def descriptors():
+    return sum(isinstance(o, SyntheticDescriptor) for o in gc.get_objects())
+
+
+@pytest.fixture
+def app(app):
+    app.add_service(SyntheticService(app.connection, 10, 100, num_descriptors=3))
+    return app
+
+
+def test_descriptors_are_not_created(app):
+    objects = app.GetManagedObjects()
+    assert descriptors() == 0
+
+    path = "/org/bluez/example/service10/char7/desc2"
+    assert objects[path][GATT_DESC_IFACE]["UUID"] == synthetic_uuid(10, 7, 2)
+    chrc = objects["/org/bluez/example/service10/char7"][GATT_CHRC_IFACE]
+    assert path in chrc["Descriptors"]
+    assert app.get_attribute(path) is None
+    # 1 service, 100 characteristics and 300 descriptors
+    assert sum(p.startswith("/org/bluez/example/service10") for p in objects) == 401
+
+
+def test_descriptor_calls(app):
+    service = app.find_by_uuid(synthetic_uuid(10))[0]
+    assert bytes(service.ReadValue({}, rel_path="/char99/desc0")) == b"synthetic"
+    props = service.GetAll(GATT_DESC_IFACE, rel_path="/char3/desc1")
+    assert props["UUID"] == synthetic_uuid(10, 3, 1)
+    with pytest.raises(InvalidOffsetException):
+        service.ReadValue({"offset": 10}, rel_path="/char99/desc0")
+    for rel_path in ("/char100/desc0", "/char0/desc3", "/char0"):
+        with pytest.raises(UnknownObjectException):
+            service.ReadValue({}, rel_path=rel_path)
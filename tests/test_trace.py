@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+"""Tests for `echoez.trace`, called over a private bus."""
+
+import logging
+
+import pytest
+
+dbus = pytest.importorskip("dbus")
+pytest.importorskip("gi")
+
+import dbus.bus
+import dbus.mainloop.glib
+
+from gi.repository import GLib
+
+from echoez.characteristic import Characteristic
+from echoez.config import GATT_CHRC_IFACE
+from echoez.trace import Tracer
+
+CHRC = "/org/bluez/example/service2/char0"
+OPTIONS = dbus.Dictionary({"device": "/org/bluez/hci0/dev_A"}, signature="sv")
+
+
+@pytest.fixture
+def client(bus_address):
+    return dbus.bus.BusConnection(
+        bus_address, mainloop=dbus.mainloop.glib.DBusGMainLoop()
+    )
+
+
+@pytest.fixture
+def tracer():
+    tracer = Tracer(threshold_ms=0)
+    yield tracer
+    tracer.disable()
+
+
+def write(client, app, value):
+    loop = GLib.MainLoop()
+    obj = client.get_object(app.connection.get_unique_name(), CHRC, introspect=False)
+    obj.get_dbus_method("WriteValue", GATT_CHRC_IFACE)(
+        dbus.ByteArray(value),
+        OPTIONS,
+        reply_handler=lambda: loop.quit(),
+        error_handler=lambda e: loop.quit(),
+    )
+    loop.run()
+
+
+def test_slow_calls_are_logged(app, client, tracer, caplog):
+    caplog.set_level(logging.WARNING, logger="echoez.trace")
+    tracer.enable()
+    write(client, app, b"hello")
+
+    (call,) = tracer.get_stats()["slow_calls"]
+    assert call["method"] == "Characteristic.WriteValue"
+    assert call["sender"] == client.get_unique_name()
+    assert call["path"] == CHRC
+    assert call["payload"] == len(b"hello")
+    (record,) = caplog.records
+    message = record.getMessage()
+    assert client.get_unique_name() in message
+    assert CHRC in message
+    assert f"{call['payload']} byte payload" in message
+    counters = tracer.get_stats()["methods"]["Characteristic.WriteValue"]
+    assert counters["calls"] == counters["slow"] == 1
+
+
+def test_fast_calls_are_counted_only(app, client, caplog):
+    tracer = Tracer(threshold_ms=60_000)
+    tracer.enable()
+    try:
+        write(client, app, b"hello")
+    finally:
+        tracer.disable()
+    assert not [r for r in caplog.records if r.name == "echoez.trace"]
+    counters = tracer.get_stats()["methods"]["Characteristic.WriteValue"]
+    assert (counters["calls"], counters["slow"]) == (1, 0)
+
+
+def test_disabled_tracer_does_not_log(app, client, tracer, caplog):
+    original = Characteristic.WriteValue
+    tracer.enable()
+    assert Characteristic.WriteValue is not original
+    tracer.disable()
+    assert Characteristic.WriteValue is original
+
+    caplog.set_level(logging.DEBUG, logger="echoez.trace")
+    write(client, app, b"hello")
+    assert not caplog.records
+    assert tracer.get_stats()["slow_calls"] == []